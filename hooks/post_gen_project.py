@@ -30,8 +30,8 @@ def convert_ipynb_to_py(filepath):
     py_file = open(filepath.replace(".ipynb", ".py"), "w+")
 
     # Find line number where we finish imports
-    first_20_lines = np.hstack([c["source"] for c in code['cells']])[0:20]
-    ln_imports = np.where([(c[0:6] == "import") or (c[0:4] == "from") for c in first_20_lines])[0][-1] + 1
+    first_40_lines = np.hstack([c["source"] for c in code['cells']])[0:40]
+    ln_imports = np.where([(c[0:6] == "import") or (c[0:4] == "from") for c in first_40_lines])[0][-1] + 1
 
     # Cycle through lines
     ln = 0
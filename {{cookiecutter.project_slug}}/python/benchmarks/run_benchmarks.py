@@ -0,0 +1,268 @@
+from datetime import datetime
+from datetime import timedelta as td
+import json
+import os
+import platform
+from time import perf_counter as timerpc
+
+import numpy as np
+import pandas as pd
+
+import floris
+from flasc.dataframe_operations import dataframe_manipulations as dfm
+from flasc.energy_ratio import energy_ratio_suite
+from flasc import floris_tools as ftools
+
+from {{cookiecutter.project_slug}}.floris_tables import df_approx_to_table_array
+from {{cookiecutter.project_slug}}.interpolation import TableInterpolator
+from {{cookiecutter.project_slug}}.models import clear_floris_cache, load_floris
+from {{cookiecutter.project_slug}}.northing_calibration import apply_bias_corrections
+from {{cookiecutter.project_slug}}.synthetic_data import SyntheticScadaGenerator, get_grid_layout
+
+
+def time_function(fun, repeats=3):
+    """Time a function call a number of times.
+
+    Args:
+        fun (callable): Function without arguments to time.
+        repeats (int, optional): Number of calls. Defaults to 3.
+
+    Returns:
+        dict: Dictionary with the 'min', 'median' and 'max' wall clock time
+          in seconds over all calls, and the number of 'repeats'.
+    """
+    timings = []
+    for _ in range(repeats):
+        start_time = timerpc()
+        fun()
+        timings.append(timerpc() - start_time)
+    return {
+        "min": float(np.min(timings)),
+        "median": float(np.median(timings)),
+        "max": float(np.max(timings)),
+        "repeats": int(repeats),
+    }
+
+
+def get_synthetic_scada(layout_x, layout_y, n_samples, seed=0):
+    """Generate a SCADA dataframe of 10-minute averages for a synthetic wind
+    farm, see synthetic_data.SyntheticScadaGenerator.
+
+    Args:
+        layout_x (array): x-coordinates of the turbines in [m].
+        layout_y (array): y-coordinates of the turbines in [m].
+        n_samples (int): Number of timestamps.
+        seed (int, optional): Seed of the random number generator. Defaults to 0.
+
+    Returns:
+        df (pd.DataFrame): Dataframe with the columns 'time', 'wd', 'ws', 'ti'
+          and 'wd_###', 'ws_###' and 'pow_###' for each turbine, where 'wd',
+          'ws' and 'ti' are the true ambient inflow conditions.
+    """
+    generator = SyntheticScadaGenerator(
+        layout_x, layout_y, duration=td(seconds=600.0 * n_samples), dt=600.0, seed=seed
+    )
+    df, _ = generator.get_chunk(n_samples)
+    df = df.rename(columns={"wd_truth": "wd", "ws_truth": "ws", "ti_truth": "ti"})
+    cols = ["{:s}_{:03d}".format(v, ti) for v in ["wd", "ws", "pow"] for ti in range(len(layout_x))]
+    return df[["time", "wd", "ws", "ti"] + cols]
+
+
+def benchmark_load_floris(wake_models, repeats=3):
+    results = {}
+    for wake_model in wake_models:
+        def fun():
+            clear_floris_cache()
+            load_floris(wake_model=wake_model)
+        results["load_floris[{:s}]".format(wake_model)] = time_function(fun, repeats)
+
+        load_floris(wake_model=wake_model)  # Populate the cache
+        results["load_floris_cached[{:s}]".format(wake_model)] = time_function(
+            lambda: load_floris(wake_model=wake_model), repeats
+        )
+    return results
+
+
+def benchmark_table_build(wake_model, grid_sizes, repeats=1):
+    results = {}
+    fi = load_floris(wake_model=wake_model)
+    for n_wd, n_ws in grid_sizes:
+        wd_array = np.linspace(0.0, 360.0, n_wd)
+        ws_array = np.linspace(1.0, 30.0, n_ws)
+        results["table_build[{:s},{:d}x{:d}]".format(wake_model, n_wd, n_ws)] = time_function(
+            lambda: ftools.calc_floris_approx_table(fi, wd_array=wd_array, ws_array=ws_array, ti_array=[0.06]),
+            repeats,
+        )
+    return results
+
+
+def benchmark_interpolation(df, df_approx, repeats=3):
+    table = df_approx_to_table_array(df_approx)
+    return {
+        "interpolate_floris_from_df_approx": time_function(
+            lambda: ftools.interpolate_floris_from_df_approx(df, df_approx, verbose=False), repeats
+        ),
+        "TableInterpolator.interpolate": time_function(
+            lambda: TableInterpolator(df).interpolate(table), repeats
+        ),
+    }
+
+
+def benchmark_energy_ratios(df, df_fi, fi, test_turbines, N=1, repeats=1):
+    # Same steps as in model_validation/validate_models_with_scada.py
+    df_upstream = ftools.get_upstream_turbs_floris(fi)
+
+    def set_references(df, set_ws=True):
+        if set_ws:
+            df = dfm.set_ws_by_upstream_turbines_in_radius(
+                df, df_upstream, turb_no=test_turbines[0], x_turbs=fi.layout_x, y_turbs=fi.layout_y,
+                max_radius=5000.0, include_itself=True,
+            )
+        return dfm.set_pow_ref_by_upstream_turbines_in_radius(
+            df, df_upstream, turb_no=test_turbines[0], x_turbs=fi.layout_x, y_turbs=fi.layout_y,
+            max_radius=5000.0, include_itself=True,
+        )
+
+    df = set_references(df)
+    df_fi = set_references(df_fi, set_ws=False)
+
+    def fun():
+        s = energy_ratio_suite.energy_ratio_suite(verbose=False)
+        s.add_df(df, "SCADA")
+        s.add_df(df_fi, "FLORIS")
+        s.set_masks(ws_range=(6.0, 12.0))
+        s.get_energy_ratios(
+            test_turbines=test_turbines, wd_step=3.0, ws_step=5.0, wd_bin_width=3.0,
+            N=N, percentiles=[5.0, 95.0], verbose=False,
+        )
+
+    return {
+        "set_references_in_radius": time_function(lambda: set_references(df), repeats),
+        "energy_ratio_suite[N={:d}]".format(N): time_function(fun, repeats),
+    }
+
+
+def benchmark_bias_corrections(df, n_turbines, repeats=3):
+    wd_bias_list = np.linspace(-10.0, 10.0, n_turbines)
+    return {
+        "apply_bias_corrections": time_function(
+            lambda: apply_bias_corrections(df, wd_bias_list, verbose=False), repeats
+        )
+    }
+
+
+def compare_to_baseline(results, baseline, threshold=1.25):
+    """Compare benchmark results to a baseline and print a summary.
+
+    Args:
+        results (dict): Benchmark results, see run_benchmarks(...).
+        baseline (dict): Baseline benchmark results in the same format.
+        threshold (float, optional): Ratio of the median timings above which
+          a benchmark is flagged as a regression. Defaults to 1.25.
+
+    Returns:
+        list: Names of the benchmarks that regressed.
+    """
+    if results["metadata"]["settings"] != baseline["metadata"]["settings"]:
+        print("Warning: benchmark settings differ from those of the baseline.")
+
+    regressions = []
+    print("{:45s} {:>12s} {:>12s} {:>8s}".format("Benchmark", "Baseline (s)", "Current (s)", "Ratio"))
+    for name, timing in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            print("{:45s} {:>12s} {:12.4f} {:>8s}".format(name, "-", timing["median"], "new"))
+            continue
+        t_base = baseline["benchmarks"][name]["median"]
+        ratio = timing["median"] / t_base
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = " <-- regression"
+        print("{:45s} {:12.4f} {:12.4f} {:8.2f}{:s}".format(name, t_base, timing["median"], ratio, flag))
+    return regressions
+
+
+def run_benchmarks(settings):
+    """Run all benchmarks of the analysis pipeline.
+
+    Args:
+        settings (dict): Benchmark settings, see the '__main__' block.
+
+    Returns:
+        dict: Dictionary with the 'metadata' of the run and the timings of
+          all 'benchmarks', see time_function(...).
+    """
+    benchmarks = {}
+    benchmarks.update(benchmark_load_floris(settings["wake_models"], repeats=settings["repeats"]))
+    benchmarks.update(benchmark_table_build(settings["table_wake_model"], settings["table_grid_sizes"]))
+
+    # Synthetic wind farm and dataset of adjustable size
+    n_turbines = settings["n_turbines"]
+    layout_x, layout_y = get_grid_layout(n_turbines)
+    fi = load_floris(wake_model=settings["table_wake_model"])
+    fi.reinitialize(layout_x=layout_x, layout_y=layout_y)
+    df = get_synthetic_scada(layout_x, layout_y, settings["n_samples"], seed=settings["seed"])
+
+    df_approx = ftools.calc_floris_approx_table(
+        fi, wd_array=np.arange(0.0, 360.01, 3.0), ws_array=np.arange(1.0, 30.01, 1.0), ti_array=[0.03, 0.06, 0.09]
+    )
+    benchmarks.update(benchmark_interpolation(df, df_approx, repeats=settings["repeats"]))
+
+    df_fi = TableInterpolator(df).interpolate(df_approx_to_table_array(df_approx))
+    df = dfm.set_wd_by_turbines(df, [0])
+    df_fi["wd"] = df["wd"]
+    benchmarks.update(benchmark_energy_ratios(df, df_fi, fi, test_turbines=[1], N=settings["N_bootstrapping"]))
+    benchmarks.update(benchmark_bias_corrections(df, n_turbines, repeats=settings["repeats"]))
+
+    metadata = {
+        "created": datetime.now().isoformat(),
+        "settings": settings,
+        "platform": platform.platform(),
+        "python_version": platform.python_version(),
+        "numpy_version": np.__version__,
+        "pandas_version": pd.__version__,
+        "floris_version": floris.__version__,
+    }
+    return {"metadata": metadata, "benchmarks": benchmarks}
+
+
+if __name__ == "__main__":
+    # User settings. Scale up 'n_turbines' and 'n_samples' to see how the
+    # pipeline scales with farm size and data length.
+    settings = {
+        "n_turbines": 7,
+        "n_samples": 52560,  # One year of 10-minute data
+        "seed": 0,
+        "repeats": 3,
+        "wake_models": ["jensen", "turbopark", "gch", "cc"],
+        "table_wake_model": "gch",
+        "table_grid_sizes": [[61, 30], [121, 30]],
+        "N_bootstrapping": 1,
+    }
+    update_baseline = False  # Overwrite the baseline with the current results
+    regression_threshold = 1.25  # Flag benchmarks that are 25% slower than the baseline
+
+    # Run the benchmarks and save the results
+    root_path = os.path.dirname(os.path.abspath(__file__))
+    out_path = os.path.join(root_path, "results")
+    os.makedirs(out_path, exist_ok=True)
+    results = run_benchmarks(settings)
+    fn = os.path.join(out_path, "benchmark_{:s}.json".format(datetime.now().strftime("%Y%m%d_%H%M%S")))
+    with open(fn, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Benchmark results saved to '{:s}'.".format(fn))
+
+    # Compare to the baseline
+    fn_baseline = os.path.join(out_path, "baseline.json")
+    if os.path.exists(fn_baseline) and not update_baseline:
+        with open(fn_baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, threshold=regression_threshold)
+        if len(regressions) > 0:
+            print("Found {:d} performance regressions: {}".format(len(regressions), regressions))
+        else:
+            print("No performance regressions found.")
+    else:
+        with open(fn_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Baseline saved to '{:s}'.".format(fn_baseline))
@@ -1,28 +1,21 @@
-import os
-
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 
 from flasc.dataframe_operations import dataframe_manipulations as dfm
-from flasc.energy_ratio import energy_ratio_suite
 from flasc import floris_tools as ftools
 
+from {{cookiecutter.project_slug}}.energy_ratios import EnergyRatioSuite
+from {{cookiecutter.project_slug}}.floris_tables import load_floris_table_array
+from {{cookiecutter.project_slug}}.interpolation import TableInterpolator
 from {{cookiecutter.project_slug}}.models import load_floris
-
-
-def load_data():
-    # Load the data
-    print("Loading .ftr data. This may take a minute or two...")
-    root_path = os.path.dirname(os.path.abspath(__file__))
-    data_path = os.path.join(root_path, "..", "raw_data_processing", "postprocessed")
-    df_scada = pd.read_feather(os.path.join(data_path, "df_scada_data_600s_filtered_and_northing_calibrated.ftr"))
-    return df_scada
+from {{cookiecutter.project_slug}}.scada_store import load_postprocessed_store
+from {{cookiecutter.project_slug}}.upstream import ReferenceWeights, get_upstream_index_in_radius
 
 
 if __name__ == "__main__":
     # User options
     wake_models = ["jensen", "gch", "cc", "turbopark"]  # Wake models to compare to SCADA
+    time_range = [None, None]  # Optionally limit the analysis to a time window, e.g., ["2019-01-01", "2019-07-01"]
 
     # This script demonstrates how we can use the postprocessed data to
     # compare the SCADA data to one of the wake models in FLORIS. This
@@ -39,9 +32,17 @@ if __name__ == "__main__":
     wd_bin_width = 3.0
     N = 1  # Bootstrapping sample size (higher is better for UQ, but slower)
 
-    # Get data and a generic floris object
-    df = load_data()
+    # Get a generic floris object and the data we need: the ambient turbulence
+    # intensity, the wind direction of the measurement turbine, and the wind
+    # speeds and powers of all turbines for the upstream reference signals
     fi = load_floris()
+    nturbs = len(fi.layout_x)
+    columns = (
+        ["ti"]
+        + ["wd_{:03d}".format(ti) for ti in turb_wd_measurement]
+        + ["{:s}_{:03d}".format(v, ti) for v in ["ws", "pow"] for ti in range(nturbs)]
+    )
+    df = load_postprocessed_store(columns=columns, time_range=time_range)
 
     # Visualize layout
     fig, ax = plt.subplots()
@@ -56,57 +57,40 @@ if __name__ == "__main__":
     # Get dataframe defining which turbines are upstream for what wind dirs
     df_upstream = ftools.get_upstream_turbs_floris(fi)
 
-    # Assign a reference wind direction and wind speed
+    # Assign a reference wind direction and wind speed. The reference
+    # turbines are the upstream turbines within 5 km of the test turbine.
+    # Their weights are determined once from the reference wind direction
+    # and reused for the SCADA data and the FLORIS predictions alike.
     print("Processing dataframe: selecting reference wd, ws and pow_ref")
     df = dfm.set_wd_by_turbines(df, turb_wd_measurement)
-    df = dfm.set_ws_by_upstream_turbines_in_radius(
-        df,
+    upstream_index = get_upstream_index_in_radius(
         df_upstream,
-        turb_no=test_turbines[0],
         x_turbs=fi.layout_x,
         y_turbs=fi.layout_y,
+        turb_no=test_turbines[0],
         max_radius=5000.0,
         include_itself=True,
     )
+    reference_weights = ReferenceWeights(upstream_index, df["wd"])
+    df["ws"] = reference_weights.get_column_mean(df, "ws")
 
-    # Get FLORIS predictions for SCADA dataframe
-    root_path = os.path.dirname(os.path.abspath(__file__))
+    # Get FLORIS predictions for SCADA dataframe. The interpolation weights
+    # are calculated once and reused for every wake model with the same grid.
+    interpolator = TableInterpolator(df, method="linear")
     df_fi_list = [None for _ in wake_models]
     for wii, wake_model in enumerate(wake_models):
-        fn = os.path.join(root_path, "..", "setup_floris_model", "df_fi_approx_{:s}.ftr".format(wake_model))
-        if os.path.exists(fn):
-            df_fi_approx = pd.read_feather(fn)
-        else:
-            raise UserWarning("Please run 'setup_floris_model/precalculate_floris_solutions.py' for the appropriate wake models first.")
-
-        df_fi_list[wii] = ftools.interpolate_floris_from_df_approx(
-            df=df, df_approx=df_fi_approx, method="linear", verbose=True
-        )
+        print("Interpolating FLORIS predictions for the '{:s}' model.".format(wake_model))
+        df_fi_list[wii] = interpolator.interpolate(load_floris_table_array(wake_model))
 
     # Set reference power for both our SCADA data and for our FLORIS data
-    df = dfm.set_pow_ref_by_upstream_turbines_in_radius(
-        df,
-        df_upstream,
-        turb_no=test_turbines[0],
-        x_turbs=fi.layout_x,
-        y_turbs=fi.layout_y,
-        max_radius=5000.0,
-        include_itself=True,
-    )
-
+    df["pow_ref"] = reference_weights.get_column_mean(df, "pow")
     for df_fi in df_fi_list:
-        df_fi = dfm.set_pow_ref_by_upstream_turbines_in_radius(
-            df_fi,
-            df_upstream,
-            turb_no=test_turbines[0],
-            x_turbs=fi.layout_x,
-            y_turbs=fi.layout_y,
-            max_radius=5000.0,
-            include_itself=True,
-        )
-
-    # Calculate and plot energy ratios
-    s = energy_ratio_suite.energy_ratio_suite(verbose=False)
+        df_fi["pow_ref"] = reference_weights.get_column_mean(df_fi, "pow")
+
+    # Calculate and plot energy ratios. The SCADA data and the FLORIS
+    # predictions share the same inflow, so they are binned and resampled
+    # only once.
+    s = EnergyRatioSuite()
     s.add_df(df, "SCADA data (wind direction uncalibrated)")
     for wii, df_fi in enumerate(df_fi_list):
         s.add_df(df_fi, "FLORIS: {:s}".format(wake_models[wii]))
@@ -121,7 +105,6 @@ if __name__ == "__main__":
         wd_bin_width=wd_bin_width,
         N=N,
         percentiles=[5.0, 95.0],
-        verbose=True,
     )
     ax = s.plot_energy_ratios()
     ax[0].set_title("Energy ratios; test_turbines = {}".format(test_turbines))
@@ -1,10 +1,15 @@
-import os
 import numpy as np
 from time import perf_counter as timerpc
 
 from floris.tools import ParallelComputingInterface
-from flasc import floris_tools as ftools
 
+from {{cookiecutter.project_slug}}.floris_tables import (
+    calc_floris_approx_table_adaptive,
+    calc_floris_approx_tables_parallel,
+    find_floris_table,
+    get_chunk_path,
+    save_floris_table,
+)
 from {{cookiecutter.project_slug}}.models import load_floris
 
 
@@ -12,28 +17,78 @@ if __name__ == "__main__":
     # User settings
     max_workers = 16
     wake_models = ["jensen", "turbopark", "gch", "cc"]
+    table_mode = "uniform"  # Options are "uniform" and "adaptive"
 
-    root_path = os.path.dirname(os.path.abspath(__file__))
+    # The tables of all wake models are calculated in chunks by a single
+    # pool of workers. Chunks are written to disk as soon as they finish.
+    # Rerunning this script after a crash, or after extending the grid below,
+    # only calculates the solutions that are missing. Finished tables are
+    # stored under a hash of the model configuration and grid, and registered
+    # in a manifest. Tables for other configurations are kept side by side.
+    wd_array = np.arange(0.0, 360.01, 3.0)
+    ws_array = np.arange(1.0, 30.01, 1.0)
+    ti_array = [0.03, 0.06, 0.09, 0.12, 0.15]
+
+    # Alternatively, in the "adaptive" mode, the table starts from a coarse
+    # grid that is refined near turbine alignment directions and near rated
+    # wind speed until linear interpolation in the table is accurate to
+    # within 'tolerance' times the rated power. This typically gives the same
+    # accuracy with far fewer FLORIS evaluations. The solutions are also
+    # written to disk in chunks, so an interrupted refinement resumes from
+    # the solutions calculated so far.
+    adaptive_options = {
+        "mode": "adaptive",
+        "wd_step_initial": 15.0,
+        "tolerance": 0.005,
+        "wd_step_min": 0.5,
+        "ws_step_min": 0.25,
+    }
+    if table_mode == "adaptive":
+        wd_array = np.arange(0.0, 360.0, adaptive_options["wd_step_initial"])
+        ws_array = np.arange(1.0, 30.01, 2.0)
+        options = adaptive_options
+    else:
+        options = None
+
+    # Skip the wake models for which an up-to-date table exists
+    wake_models_todo = []
     for wake_model in wake_models:
-        fn = os.path.join(root_path, "df_fi_approx_{:s}.ftr".format(wake_model))
-        if os.path.exists(fn):
-            print("FLORIS table for '{:s}' model exists. Skipping...".format(wake_model))
-            continue
-
-        start_time = timerpc()
-        print("Precalculating FLORIS table for '{:s}' model...".format(wake_model))
-        fi_pci = ParallelComputingInterface(
-            fi=load_floris(wake_model=wake_model),
+        fn = find_floris_table(wake_model, wd_array=wd_array, ws_array=ws_array, ti_array=ti_array, options=options)
+        if fn is not None:
+            print("Up-to-date FLORIS table for '{:s}' model exists. Skipping...".format(wake_model))
+        else:
+            wake_models_todo.append(wake_model)
+
+    if (table_mode == "uniform") and (len(wake_models_todo) > 0):
+        calc_floris_approx_tables_parallel(
+            wake_models=wake_models_todo,
+            wd_array=wd_array,
+            ws_array=ws_array,
+            ti_array=ti_array,
             max_workers=max_workers,
-            n_wind_direction_splits=max_workers,
-            print_timings=True,
         )
-        df_fi_approx = ftools.calc_floris_approx_table(
-            fi=fi_pci,
-            wd_array=np.arange(0.0, 360.01, 3.0),
-            ws_array=np.arange(1.0, 30.01, 1.0),
-            ti_array=[0.03, 0.06, 0.09, 0.12, 0.15],
-        )
-        end_time = timerpc()
-        print("Computation time: {:.2f} s".format(end_time - start_time))
-        df_fi_approx.to_feather(fn)
+
+    elif table_mode == "adaptive":
+        for wake_model in wake_models_todo:
+            start_time = timerpc()
+            print("Precalculating adaptive FLORIS table for '{:s}' model...".format(wake_model))
+            fi_pci = ParallelComputingInterface(
+                fi=load_floris(wake_model=wake_model),
+                max_workers=max_workers,
+                n_wind_direction_splits=max_workers,
+                print_timings=True,
+            )
+            df_fi_approx = calc_floris_approx_table_adaptive(
+                fi=fi_pci,
+                wd_step_initial=adaptive_options["wd_step_initial"],
+                ws_array_initial=ws_array,
+                ti_array=ti_array,
+                tolerance=adaptive_options["tolerance"],
+                wd_step_min=adaptive_options["wd_step_min"],
+                ws_step_min=adaptive_options["ws_step_min"],
+                chunk_path=get_chunk_path(wake_model),
+            )
+            end_time = timerpc()
+            print("Computation time: {:.2f} s".format(end_time - start_time))
+            fn = save_floris_table(df_fi_approx, wake_model, wd_array, ws_array, ti_array, options=options)
+            print("FLORIS table saved to '{:s}'.".format(fn))
@@ -0,0 +1,138 @@
+from contextlib import redirect_stdout
+from datetime import timedelta as td
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from flasc import time_operations as fto
+
+from {{cookiecutter.project_slug}}.downsampling import (
+    StreamingDownsampler,
+    df_downsample,
+    downsample_csv,
+    get_high_resolution_flags,
+)
+
+
+def get_high_resolution_data(n_samples=20000, n_turbines=2, seed=0):
+    """Random 1 Hz data with missing timestamps, a two-hour gap and NaNs."""
+    rng = np.random.default_rng(seed)
+    time = pd.date_range("2020-01-01 00:00:07", periods=n_samples, freq="1s")
+    df = pd.DataFrame({"time": time})
+    for ti in range(n_turbines):
+        df["wd_{:03d}".format(ti)] = np.mod(rng.normal(0.0, 20.0, n_samples), 360.0)
+        df["ws_{:03d}".format(ti)] = rng.normal(8.0, 1.0, n_samples)
+    df.loc[rng.random(n_samples) < 0.1, "ws_001"] = np.nan
+    df.loc[1000:1700, "wd_000"] = np.nan
+    df = df[rng.random(n_samples) > 0.05]
+    df = df[(df["time"] < "2020-01-01 02:00") | (df["time"] > "2020-01-01 04:00")]
+    return df.reset_index(drop=True)
+
+
+def assert_downsampled_equal(df_out, df_ref, atol=1e-9):
+    np.testing.assert_array_equal(df_out["time"].to_numpy(), df_ref["time"].to_numpy())
+    for c in df_out.columns[1:]:
+        a = df_out[c].to_numpy(dtype=float)
+        b = df_ref[c].to_numpy(dtype=float)
+        np.testing.assert_array_equal(np.isnan(a), np.isnan(b), err_msg=c)
+        if c.startswith("wd_"):
+            a = b + np.mod(a - b + 180.0, 360.0) - 180.0
+        np.testing.assert_allclose(a, b, rtol=0.0, atol=atol, err_msg=c)
+
+
+class TestDownsampling(unittest.TestCase):
+    def test_matches_flasc_df_downsample(self):
+        df = get_high_resolution_data()
+        cols_angular = ["wd_000", "wd_001"]
+        with redirect_stdout(io.StringIO()):
+            df_ref, mapping_ref = fto.df_downsample(
+                df, cols_angular, window_width=td(seconds=600), return_index_mapping=True
+            )
+
+        # flasc also returns the empty windows, as rows of NaNs
+        df_ref = df_ref.reset_index() if "time" not in df_ref.columns else df_ref
+        is_valid = mapping_ref[:, 0] >= 0
+        df_ref = df_ref[is_valid].reset_index(drop=True)
+
+        df_out, index_mapping = df_downsample(df, cols_angular, window_width=td(seconds=600), chunksize=3000)
+        assert_downsampled_equal(df_out, df_ref[df_out.columns])
+        np.testing.assert_array_equal(index_mapping[:, 0], mapping_ref[is_valid, 0])
+        np.testing.assert_array_equal(index_mapping[:, 1], mapping_ref[is_valid].max(axis=1))
+
+    def test_chunk_boundaries(self):
+        df = get_high_resolution_data(n_samples=600)
+        kw = {"cols_angular": ["wd_000", "wd_001"], "window_width": td(seconds=60)}
+        df_ref, mapping_ref = df_downsample(df, chunksize=df.shape[0], **kw)
+        for chunksize in [1, 2, 7, 59, 60, 61]:
+            df_out, index_mapping = df_downsample(df, chunksize=chunksize, **kw)
+            pd.testing.assert_frame_equal(df_out, df_ref)
+            np.testing.assert_array_equal(index_mapping, mapping_ref)
+
+        # Split the data at every row, reusing the downsampler after flush()
+        downsampler = StreamingDownsampler(**kw)
+        for split in range(df.shape[0] + 1):
+            outputs = [downsampler.update(df.iloc[:split]), downsampler.update(df.iloc[split:]), downsampler.flush()]
+            df_out = pd.concat([o[0] for o in outputs], ignore_index=True)
+            assert_downsampled_equal(df_out, df_ref)
+            np.testing.assert_array_equal(np.vstack([o[1] for o in outputs]), mapping_ref)
+
+    def test_high_resolution_flags(self):
+        df = get_high_resolution_data()
+        df_out, index_mapping = df_downsample(df, ["wd_000", "wd_001"])
+        flags = (df_out["ws_001"] > 8.05).to_numpy()
+
+        # Each row gets the flag of the window that it falls in, which is
+        # labelled by its right edge
+        window_labels = df["time"].dt.floor("600s") + td(seconds=600)
+        expected = pd.Series(flags, index=df_out["time"]).reindex(window_labels).to_numpy()
+        flags_out = get_high_resolution_flags(flags, index_mapping)
+        np.testing.assert_array_equal(flags_out, expected)
+
+        # Chunk by chunk
+        n_rows = df.shape[0]
+        flags_chunked = [
+            get_high_resolution_flags(flags, index_mapping, ii, min(5000, n_rows - ii)) for ii in range(0, n_rows, 5000)
+        ]
+        np.testing.assert_array_equal(np.concatenate(flags_chunked), expected)
+
+        # Dataframes with several flags
+        df_flags = df_out[["ws_000", "ws_001"]].isna()
+        df_flags_out = get_high_resolution_flags(df_flags, index_mapping)
+        self.assertEqual(list(df_flags_out.columns), ["ws_000", "ws_001"])
+        self.assertEqual(df_flags_out.shape[0], n_rows)
+
+    def test_high_resolution_flags_empty_mapping(self):
+        index_mapping = np.zeros((0, 2), dtype=np.int64)
+        self.assertEqual(get_high_resolution_flags(np.zeros(0, dtype=bool), index_mapping).shape, (0,))
+        flags_out = get_high_resolution_flags(np.zeros(0, dtype=bool), index_mapping, row_start=10, n_rows=5)
+        np.testing.assert_array_equal(flags_out, np.zeros(5, dtype=bool))
+        df_flags_out = get_high_resolution_flags(pd.DataFrame({"a": [], "b": []}, dtype=bool), [], n_rows=3)
+        self.assertEqual(df_flags_out.shape, (3, 2))
+        self.assertFalse(df_flags_out.to_numpy().any())
+
+    def test_downsample_csv(self):
+        df = get_high_resolution_data(n_samples=5000)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fn_csv = os.path.join(tmp_dir, "data.csv")
+            df.to_csv(fn_csv, index=False)
+            df_out, index_mapping = downsample_csv(fn_csv, chunksize=777)
+
+            fn_empty = os.path.join(tmp_dir, "empty.csv")
+            open(fn_empty, "w").close()
+            df_empty, mapping_empty = downsample_csv(fn_empty)
+
+        # The .csv data is cast to 32-bit floats
+        df_ref, mapping_ref = df_downsample(df, ["wd_000", "wd_001"])
+        assert_downsampled_equal(df_out, df_ref, atol=1e-4)
+        np.testing.assert_array_equal(index_mapping, mapping_ref)
+
+        self.assertEqual(df_empty.shape[0], 0)
+        self.assertEqual(mapping_empty.shape, (0, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
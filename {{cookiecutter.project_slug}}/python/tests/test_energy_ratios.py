@@ -0,0 +1,160 @@
+from contextlib import redirect_stdout
+import io
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from flasc.energy_ratio.energy_ratio import energy_ratio
+from flasc.energy_ratio.energy_ratio_suite import energy_ratio_suite
+
+from {{cookiecutter.project_slug}}.energy_ratios import (
+    EnergyRatioHistogram,
+    EnergyRatioSuite,
+    bootstrap_energy_ratios,
+    get_bootstrap_weights,
+    get_energy_ratios,
+    get_wd_bins,
+    get_ws_bins,
+    iterate_bootstrap_weights,
+)
+
+
+def get_random_data(n_samples=20000, n_turbines=4, seed=0):
+    """Random 600 s data in the common FLASC format, with NaNs."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "time": pd.date_range("2020-01-01", periods=n_samples, freq="600s"),
+        "wd": rng.uniform(0.0, 360.0, n_samples),
+        "ws": np.where(rng.random(n_samples) < 0.02, np.nan, rng.uniform(0.0, 32.0, n_samples)),
+    })
+    for ti in range(n_turbines):
+        pw = rng.uniform(0.0, 1000.0, n_samples)
+        pw[rng.random(n_samples) < 0.05] = np.nan
+        df["pow_{:03d}".format(ti)] = pw
+    df["pow_ref"] = np.where(rng.random(n_samples) < 0.03, np.nan, rng.uniform(100.0, 1000.0, n_samples))
+    return df
+
+
+def assert_energy_ratios_equal(df_out, df_ref):
+    """Compare energy ratio results on the bins that flasc reports."""
+    df = df_ref.merge(df_out, on="wd_bin", how="left", suffixes=("_ref", ""))
+    np.testing.assert_allclose(df["baseline"], df["baseline_ref"], rtol=1e-12)
+    np.testing.assert_array_equal(df["bin_count"], df["bin_count_ref"])
+
+
+class TestEnergyRatios(unittest.TestCase):
+    def test_matches_energy_ratio_suite(self):
+        df = get_random_data()
+        kw = {"test_turbines": [1], "wd_step": 3.0, "ws_step": 5.0, "wd_bin_width": 6.0}
+        with redirect_stdout(io.StringIO()):
+            s_ref = energy_ratio_suite(verbose=False)
+            s_ref.add_df(df, "baseline")
+            s_ref.set_masks(ws_range=(6.0, 12.0))
+            s_ref.get_energy_ratios(N=1, verbose=False, **kw)
+        df_ref = s_ref.df_list[0]["er_results"]
+
+        # Functional interface
+        df_masked = df[(df["ws"] > 6.0) & (df["ws"] <= 12.0)]
+        assert_energy_ratios_equal(get_energy_ratios(df_masked, **kw)[1], df_ref)
+
+        # Suite interface
+        s = EnergyRatioSuite()
+        s.add_df(df, "baseline")
+        s.set_masks(ws_range=(6.0, 12.0))
+        s.get_energy_ratios(N=1, verbose=False, **kw)
+        df_out = s.df_list[0]["er_results"]
+        self.assertEqual(df_out.shape[0], df_ref.shape[0])
+        assert_energy_ratios_equal(df_out, df_ref)
+
+    def test_bootstrap_energy_ratios_nominal(self):
+        df = get_random_data(n_samples=5000)
+        test_cols = ["pow_001", "pow_003"]
+        for kw in [
+            {"wd_step": 3.0, "ws_step": 5.0, "wd_bin_width": 6.0},
+            {"wd_bins": [[352.3, 367.1]], "ws_bins": [[6.0, 10.0]]},
+        ]:
+            _, wd_bins = get_wd_bins(kw.get("wd_step", 2.0), kw.get("wd_bin_width"), kw.get("wd_bins"))
+            _, ws_bins = get_ws_bins(kw.get("ws_step", 1.0), kw.get("ws_bins"))
+            for chunksize in [None, 1000]:
+                bin_count, energy_ratios = bootstrap_energy_ratios(
+                    df["wd"], df["ws"], df[test_cols].values, df["pow_ref"], wd_bins, ws_bins, N=1, chunksize=chunksize
+                )
+                for ii, ti in enumerate([1, 3]):
+                    df_ref = energy_ratio(df, verbose=False).get_energy_ratio([ti], **kw)
+                    is_used = (bin_count > 0)
+                    np.testing.assert_allclose(energy_ratios[ii, is_used, 0], df_ref["baseline"], rtol=1e-12)
+                    np.testing.assert_array_equal(bin_count[is_used], df_ref["bin_count"])
+
+    def test_bootstrap_bounds(self):
+        df = get_random_data(n_samples=5000)
+        _, wd_bins = get_wd_bins(30.0)
+        _, ws_bins = get_ws_bins(5.0)
+        args = (df["wd"], df["ws"], df["pow_001"], df["pow_ref"], wd_bins, ws_bins)
+        _, nominal = bootstrap_energy_ratios(*args, N=1)
+        for method in ["poisson", "multinomial"]:
+            _, energy_ratios = bootstrap_energy_ratios(*args, N=50, method=method, seed=0, chunksize=333)
+            np.testing.assert_allclose(energy_ratios[..., 0], nominal[..., 0], rtol=1e-12)
+            self.assertTrue(np.all(energy_ratios[..., 1] <= energy_ratios[..., 0]))
+            self.assertTrue(np.all(energy_ratios[..., 2] >= energy_ratios[..., 0]))
+            self.assertTrue(np.all(energy_ratios[..., 2] > energy_ratios[..., 1]))
+
+
+class TestEnergyRatioHistogram(unittest.TestCase):
+    def test_matches_energy_ratio(self):
+        df = get_random_data(n_samples=5000)
+        h = EnergyRatioHistogram(df, wd_resolution=0.5, ws_resolution=0.5)
+        for kw, wd_offset in [
+            ({"wd_step": 2.0, "ws_step": 1.0}, 0.0),
+            ({"wd_step": 3.0, "ws_step": 5.0, "wd_bin_width": 6.0}, 0.0),
+            ({"wd_bins": [[352.5, 367.5]], "ws_bins": [[6.0, 10.0]]}, 0.0),
+            ({"wd_step": 2.0, "ws_step": 2.0}, -7.5),
+        ]:
+            results = h.get_energy_ratios(test_turbines=[1, 3], wd_offset=wd_offset, **kw)
+            df_shifted = df.copy()
+            df_shifted["wd"] = np.mod(df_shifted["wd"] + wd_offset, 360.0)
+            for ti in [1, 3]:
+                df_ref = energy_ratio(df_shifted, verbose=False).get_energy_ratio(test_turbines=[ti], **kw)
+                assert_energy_ratios_equal(results[ti], df_ref)
+
+
+class TestBootstrapWeights(unittest.TestCase):
+    def test_chunks(self):
+        n_samples, N = 1000, 20
+        for method in ["poisson", "multinomial"]:
+            for num_blocks in [-1, 7]:
+                weights = get_bootstrap_weights(n_samples, N, num_blocks=num_blocks, method=method, seed=0)
+                self.assertEqual(weights.shape, (N, n_samples))
+                np.testing.assert_array_equal(weights[0], 1)
+
+                for chunksize in [1, 33, 5000]:
+                    chunks = list(iterate_bootstrap_weights(
+                        n_samples, N, num_blocks=num_blocks, method=method, seed=0, chunksize=chunksize
+                    ))
+                    starts = [start for start, _ in chunks]
+                    weights = np.concatenate([w for _, w in chunks], axis=1)
+                    self.assertEqual(weights.shape, (N, n_samples))
+                    np.testing.assert_array_equal(np.diff(starts + [n_samples]), [w.shape[1] for _, w in chunks])
+
+                    # Blocks are resampled as a whole, and never split
+                    w_units = weights
+                    if num_blocks > 0:
+                        block_ids = np.arange(n_samples) * num_blocks // n_samples
+                        for b in range(num_blocks):
+                            w = weights[:, block_ids == b]
+                            np.testing.assert_array_equal(w, np.repeat(w[:, :1], w.shape[1], axis=1))
+                        w_units = weights[:, np.searchsorted(block_ids, np.arange(num_blocks))]
+
+                    # Every multinomial resample has as many measurements (or blocks) as the data
+                    if method == "multinomial":
+                        np.testing.assert_array_equal(w_units.sum(axis=1), w_units.shape[1])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            get_bootstrap_weights(10, 5, method="normal")
+        with self.assertRaises(ValueError):
+            get_bootstrap_weights(10, 5, num_blocks=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+from contextlib import redirect_stdout
+import io
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from flasc.turbine_analysis import find_sensor_faults as fsf
+from flasc.turbine_analysis import ws_pow_filtering as wspf
+
+from {{cookiecutter.project_slug}}.filtering import (
+    SensorStuckDetector,
+    apply_filter_rules,
+    filter_turbines_parallel,
+    find_sensor_stuck_faults,
+    get_sensor_stuck_rule,
+)
+from {{cookiecutter.project_slug}}.synthetic_data import SyntheticScadaGenerator, get_grid_layout
+
+
+def get_scada_data(n_turbines=4, n_samples=3000, seed=3):
+    """Generate synthetic SCADA data with sensor-stuck faults, in which the
+    wind speeds are rounded such that stuck windows are exactly constant."""
+    layout_x, layout_y = get_grid_layout(n_turbines)
+    fault_options = {"stuck_ws_rate": 1.0, "stuck_wd_rate": 1.0}
+    g = SyntheticScadaGenerator(layout_x, layout_y, seed=seed, dt=600.0, fault_options=fault_options)
+    df, _ = g.get_chunk(n_samples)
+    df = df.drop(columns=[c for c in df.columns if c.endswith("_truth")])
+    for c in df.columns:
+        if c.startswith(("wd_", "ws_", "pow_")):
+            df[c] = df[c].astype(float)
+        if c.startswith("ws_"):
+            df[c] = df[c].round(3)
+    df.loc[np.random.default_rng(seed).random(n_samples) < 0.05, "ws_001"] = np.nan
+    return df
+
+
+class TestFilterRules(unittest.TestCase):
+    def test_rules_match_filter_by_condition(self):
+        df = get_scada_data()
+        n_turbines = 4
+        rules = [
+            {"label": "nan", "condition": "isnan(ws) | isnan(pow)"},
+            {"label": "negative power", "condition": "pow < -1e-6"},
+            {"label": "self-flagged", "condition": "is_operation_normal == False"},
+            {"label": "curtailed", "condition": "(ws > 10.2) & (pow < 3200.0)"},
+        ]
+
+        with redirect_stdout(io.StringIO()):
+            ref = wspf.ws_pw_curve_filtering(df=df.copy())
+            for ti in range(n_turbines):
+                ws = ref.df["ws_{:03d}".format(ti)]
+                pw = ref.df["pow_{:03d}".format(ti)]
+                ref.filter_by_condition(ws.isna() | pw.isna(), "nan", ti)
+                ref.filter_by_condition(pw < -1e-6, "negative power", ti)
+                ref.filter_by_condition(
+                    ref.df["is_operation_normal_{:03d}".format(ti)] == False, "self-flagged", ti  # noqa: E712
+                )
+                ref.filter_by_condition((ws > 10.2) & (pw < 3200.0), "curtailed", ti)
+
+            out = wspf.ws_pw_curve_filtering(df=df.copy())
+            apply_filter_rules(out, rules)
+
+        np.testing.assert_array_equal(out.df_filters.to_numpy(), ref.df_filters.to_numpy())
+        cols = [c for c in df.columns if c.startswith(("wd_", "ws_", "pow_"))]
+        np.testing.assert_allclose(out.df[cols].to_numpy(float), ref.df[cols].to_numpy(float))
+        self.assertTrue((out.df_filters != "clean").to_numpy().any())
+
+
+class TestFilterTurbinesParallel(unittest.TestCase):
+    def test_matches_sequential_filters(self):
+        df = get_scada_data(n_turbines=3, n_samples=4000, seed=1)
+        n_turbines = 3
+        sensor_stuck_options = {"n_consecutive_measurements": 3, "stddev_threshold": 0.001}
+        power_curve_options = {"ws_deadband": 1.5, "pow_deadband": 70.0, "cutoff_ws": 20.0, "m_pow_rb": 0.97}
+
+        with redirect_stdout(io.StringIO()):
+            ref = wspf.ws_pw_curve_filtering(df=df.copy())
+            for ti in range(n_turbines):
+                columns = ["wd_{:03d}".format(ti), "ws_{:03d}".format(ti)]
+                ref.filter_by_sensor_stuck_faults(columns=columns, ti=ti, plot=False, **sensor_stuck_options)
+            for ti in range(n_turbines):
+                ref.filter_by_power_curve(ti=ti, **power_curve_options)
+
+        out = wspf.ws_pw_curve_filtering(df=df.copy())
+        filter_turbines_parallel(out, sensor_stuck_options=sensor_stuck_options, max_workers=2, verbose=False)
+        filter_turbines_parallel(out, power_curve_options=power_curve_options, max_workers=2, verbose=False)
+
+        np.testing.assert_array_equal(out.df_filters.to_numpy(), ref.df_filters.to_numpy())
+        cols = [c for c in df.columns if c.startswith(("wd_", "ws_", "pow_"))]
+        np.testing.assert_allclose(out.df[cols].to_numpy(float), ref.df[cols].to_numpy(float))
+        np.testing.assert_allclose(out.pw_curve_df.to_numpy(float), ref.pw_curve_df.to_numpy(float))
+        self.assertTrue((out.df_filters == "Sensor-stuck fault").to_numpy().any())
+
+
+def get_random_series(rng, n):
+    """Random series with NaNs and constant runs of various lengths."""
+    x = np.round(rng.normal(size=n), 1)
+    x[rng.random(n) < 0.2] = np.nan
+    for _ in range(3):
+        ii = rng.integers(0, n)
+        x[ii:ii + rng.integers(1, 6)] = x[ii]
+    return x
+
+
+def get_flasc_stuck_flags(x, n_consecutive_measurements, stddev_threshold):
+    ids = fsf._find_sensor_stuck_single_timearray(
+        x, no_consecutive_measurements=n_consecutive_measurements, stddev_threshold=stddev_threshold
+    )
+    flags = np.zeros(len(x), dtype=bool)
+    flags[np.asarray(ids, dtype=int)] = True
+    return flags
+
+
+class TestSensorStuckDetector(unittest.TestCase):
+    def test_matches_flasc_single_timearray(self):
+        rng = np.random.default_rng(0)
+        for _ in range(100):
+            x = get_random_series(rng, int(rng.integers(1, 80)))
+            nw = int(rng.integers(2, 6))
+            ref = get_flasc_stuck_flags(x, nw, 0.001)
+            df = pd.DataFrame({"a": x})
+            for chunksize in [None, 1, 2, 3, 7]:
+                flags = find_sensor_stuck_faults(df, ["a"], nw, 0.001, chunksize=chunksize)["a"].to_numpy()
+                np.testing.assert_array_equal(flags, ref, err_msg="nw={}, chunksize={}".format(nw, chunksize))
+
+    def test_chunk_boundaries(self):
+        # A stuck run and a NaN gap, split at every possible position
+        x = np.array([0.1, 0.4, 0.2, 0.2, 0.2, 0.2, 0.7, np.nan, 0.7, 0.7, 0.3, 0.5, 0.5])
+        values = np.column_stack([x, x[::-1]])
+        for nw in [2, 3, 4]:
+            ref = np.column_stack([get_flasc_stuck_flags(v, nw, 0.001) for v in values.T])
+            self.assertTrue(ref.any())
+            for split in range(values.shape[0] + 1):
+                detector = SensorStuckDetector(2, nw, 0.001)
+                flags = np.vstack([detector.update(values[:split]), detector.update(values[split:]), detector.flush()])
+                np.testing.assert_array_equal(flags, ref, err_msg="nw={}, split={}".format(nw, split))
+
+            # Row by row, with a reused detector
+            flags = np.vstack([detector.update(values[ii:ii + 1]) for ii in range(values.shape[0])] + [detector.flush()])
+            np.testing.assert_array_equal(flags, ref)
+
+    def test_sensor_stuck_rule(self):
+        df = get_scada_data(n_turbines=3)
+        with redirect_stdout(io.StringIO()):
+            ref = wspf.ws_pw_curve_filtering(df=df.copy())
+            for ti in range(3):
+                flags = np.zeros(df.shape[0], dtype=bool)
+                for c in ["wd_{:03d}".format(ti), "ws_{:03d}".format(ti)]:
+                    ids = fsf.find_sensor_stuck_faults(
+                        ref.df, [c], ti=ti, stddev_threshold=0.001, n_consecutive_measurements=3, plot_figures=False
+                    )
+                    flags[np.asarray(ids, dtype=int)] = True
+                ref.filter_by_condition(flags, "Sensor-stuck fault", ti)
+
+            out = wspf.ws_pw_curve_filtering(df=df.copy())
+            apply_filter_rules(out, [get_sensor_stuck_rule()])
+
+        np.testing.assert_array_equal(out.df_filters.to_numpy(), ref.df_filters.to_numpy())
+        self.assertTrue((out.df_filters == "Sensor-stuck fault").to_numpy().any())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from floris.utilities import wrap_360
+
+from flasc import floris_tools as ftools
+from flasc.dataframe_operations import dataframe_manipulations as dfm
+
+from {{cookiecutter.project_slug}}.models import load_floris
+from {{cookiecutter.project_slug}}.upstream import (
+    ReferenceWeights,
+    UpstreamTurbineIndex,
+    get_upstream_index_in_radius,
+    set_pow_ref_by_upstream_turbines,
+    set_ws_by_upstream_turbines,
+)
+
+
+def get_random_data(wd, num_turbines, seed=0):
+    """Random wind speeds and powers of all turbines, with NaNs."""
+    rng = np.random.default_rng(seed)
+    n = len(wd)
+    df = pd.DataFrame({"wd": wd})
+    for ti in range(num_turbines):
+        df["ws_{:03d}".format(ti)] = np.where(rng.random(n) < 0.1, np.nan, rng.uniform(3.0, 12.0, n))
+        df["pow_{:03d}".format(ti)] = np.where(rng.random(n) < 0.1, np.nan, rng.uniform(0.0, 5000.0, n))
+        df["wd_{:03d}".format(ti)] = rng.uniform(0.0, 360.0, n)
+    return df
+
+
+class TestUpstreamTurbineIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.fi = load_floris()
+        cls.num_turbines = len(cls.fi.layout_x)
+        cls.df_upstream = ftools.get_upstream_turbs_floris(cls.fi, wake_slope=0.3)
+
+        # Random wind directions, the bounds of all ranges and NaNs. The one
+        # intentional difference with flasc, at exactly 0 deg, is tested
+        # separately.
+        rng = np.random.default_rng(1)
+        bounds = np.hstack([cls.df_upstream["wd_min"], cls.df_upstream["wd_max"]])
+        wd = np.hstack([rng.uniform(0.0, 360.0, 5000), bounds, np.nextafter(bounds, 360.0), [np.nan] * 10])
+        cls.df = get_random_data(wd[wd != 0.0], cls.num_turbines)
+
+    def assert_mean_equal(self, a, b, circular=False):
+        np.testing.assert_array_equal(np.isnan(a), np.isnan(b))
+        if circular:
+            a = b + wrap_360(a - b + 180.0) - 180.0
+        np.testing.assert_allclose(a, b, rtol=1e-12, equal_nan=True)
+
+    def test_matches_flasc(self):
+        upstream_index = UpstreamTurbineIndex(self.df_upstream, self.num_turbines)
+        df_ref = dfm.set_ws_by_upstream_turbines(self.df.copy(), self.df_upstream)
+        df_ref = dfm.set_pow_ref_by_upstream_turbines(df_ref, self.df_upstream)
+        df_out = set_ws_by_upstream_turbines(self.df.copy(), upstream_index)
+        df_out = set_pow_ref_by_upstream_turbines(df_out, upstream_index)
+        self.assert_mean_equal(df_out["ws"].to_numpy(), df_ref["ws"].to_numpy())
+        self.assert_mean_equal(df_out["pow_ref"].to_numpy(), df_ref["pow_ref"].to_numpy())
+
+        for wd in [7.3, 180.0, 341.5]:
+            ref = self.df_upstream.loc[
+                (self.df_upstream["wd_min"] < wd) & (self.df_upstream["wd_max"] >= wd), "turbines"
+            ].values[-1]
+            self.assertEqual(upstream_index.get_upstream_turbines(wd), sorted(ref))
+
+    def test_exclude_turbs_and_circular_mean(self):
+        exclude_turbs = [1, 4]
+        upstream_index = UpstreamTurbineIndex(self.df_upstream, self.num_turbines, exclude_turbs=exclude_turbs)
+        ref = dfm._set_col_by_upstream_turbines(
+            "wd_mean", "wd", self.df.copy(), self.df_upstream, True, exclude_turbs=exclude_turbs
+        )["wd_mean"].to_numpy()
+        for chunksize in [100000, 7]:
+            wd_mean = upstream_index.get_column_mean(self.df, "wd", circular_mean=True, chunksize=chunksize)
+            self.assert_mean_equal(wd_mean, ref, circular=True)
+
+    def test_wrapped_and_overlapping_ranges(self):
+        df_upstream = pd.DataFrame({
+            "wd_min": [0.0, 90.0, 300.0, 120.0],
+            "wd_max": [180.0, 270.0, 20.0, 150.0],
+            "turbines": [[0, 1], [1, 2], [2], [0]],
+        })
+        upstream_index = UpstreamTurbineIndex(df_upstream, 3)
+        df = get_random_data(np.hstack([np.arange(0.5, 360.0, 0.5), [90.0, 150.0, 270.0, 285.0]]), 3)
+        df_ref = dfm.set_ws_by_upstream_turbines(df.copy(), df_upstream)
+        self.assert_mean_equal(upstream_index.get_column_mean(df, "ws"), df_ref["ws"].to_numpy())
+
+    def test_zero_wind_direction(self):
+        # Unlike flasc, a wind direction of 0 deg equals one of 360 deg and
+        # falls in the range ending at 360 deg, rather than outside all ranges
+        upstream_index = UpstreamTurbineIndex(self.df_upstream, self.num_turbines)
+        df = get_random_data([0.0, 360.0, -360.0], self.num_turbines)
+        ws = set_ws_by_upstream_turbines(df.copy(), upstream_index)["ws"].to_numpy()
+        df_360 = df.assign(wd=360.0)
+        ws_ref = dfm.set_ws_by_upstream_turbines(df_360, self.df_upstream)["ws"].to_numpy()
+        self.assertFalse(np.isnan(ws).any())
+        self.assert_mean_equal(ws, ws_ref)
+        self.assertEqual(upstream_index.get_upstream_turbines(0.0), upstream_index.get_upstream_turbines(360.0))
+
+    def test_upstream_index_in_radius(self):
+        x, y = self.fi.layout_x, self.fi.layout_y
+        for turb_no, max_radius in [(1, 5000.0), (3, 600.0), (0, 800.0)]:
+            ref = dfm.set_ws_by_upstream_turbines_in_radius(
+                self.df.copy(), self.df_upstream, turb_no=turb_no, x_turbs=x, y_turbs=y,
+                max_radius=max_radius, include_itself=True,
+            )["ws"].to_numpy()
+            upstream_index = get_upstream_index_in_radius(self.df_upstream, x, y, turb_no, max_radius, True)
+            self.assert_mean_equal(upstream_index.get_column_mean(self.df, "ws"), ref)
+            weights = ReferenceWeights(upstream_index, self.df["wd"])
+            self.assert_mean_equal(weights.get_column_mean(self.df, "ws"), ref)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,34 +11,19 @@
 # the License.
 
 
-import os
-
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
 from flasc.dataframe_operations import dataframe_manipulations as dfm
-from flasc.energy_ratio import energy_ratio_suite
 from flasc.visualization import plot_floris_layout
 
 from floris.tools.visualization import visualize_cut_plane
 from floris.utilities import wrap_360
 
+from {{cookiecutter.project_slug}}.energy_ratios import get_energy_ratios
 from {{cookiecutter.project_slug}}.models import load_floris
-
-
-def load_data():
-    # Load the data
-    print("Loading .ftr data. This may take a minute or two...")
-    root_path = os.path.dirname(os.path.abspath(__file__))
-    data_path = os.path.join(root_path, "..", "raw_data_processing", "postprocessed")
-    f = os.path.join(data_path, "df_scada_data_600s_filtered_and_northing_calibrated.ftr")
-    if os.path.exists(f):
-        df_scada = pd.read_feather(f)
-    else:
-        raise UserWarning("Please run the scripts in 'raw_data_processing' first.")
-
-    return df_scada
+from {{cookiecutter.project_slug}}.scada_store import load_postprocessed_store
 
 
 def _get_angle(fi, turbine_array):
@@ -64,9 +49,6 @@ def _calculate_energy_ratios(df, test_turbines, wd_bins, N=1):
     # wake overlap, thus close to the value returned by _get_angle(). Then,
     # N defines the bootstrapping sample size, defaulting to 1.
 
-    # Load an energy ratio suite from FLASC
-    s = energy_ratio_suite.energy_ratio_suite(verbose=False)
-
     # Designate a reference wind turbine, being the most upstream in the array
     # in our case. Thus, the energy ratio of the most upstream turbine will
     # always be 1.0, and the energy ratios of the other turbines are normalized
@@ -80,27 +62,20 @@ def _calculate_energy_ratios(df, test_turbines, wd_bins, N=1):
     # We filter the data to a subset of wind speeds, from 6 to 10 m/s
     df = dfm.filter_df_by_ws(df, [6, 10])
 
-    # Finally, we add the dataframe to the energy ratio suite.
-    s.add_df(df, 'data')
-
     # Now, we calculate the energy ratio for each turbine for the one wind
-    # direction and wind speed bin. We save those values to
-    # 'results_energy_ratio'.
-    results_energy_ratio = []
-    for ti in test_turbines:
-        # Get energy ratios
-        er = s.get_energy_ratios(
-            test_turbines=ti,
-            ws_bins=[[6.0, 10.0]],
-            wd_bins=wd_bins,
-            N=N,
-            percentiles=[5.0, 95.0],
-            verbose=False
-        )
-        results_energy_ratio.append(er[0]["er_results"].loc[0])
+    # direction and wind speed bin. All turbines are calculated at once,
+    # sharing the binning of the data and the bootstrap samples.
+    er = get_energy_ratios(
+        df,
+        test_turbines=test_turbines,
+        ws_bins=[[6.0, 10.0]],
+        wd_bins=wd_bins,
+        N=N,
+        percentiles=[5.0, 95.0],
+    )
 
     # Finally, combine all results into a single dataframe
-    results_energy_ratio = pd.concat(results_energy_ratio, axis=1).T
+    results_energy_ratio = pd.concat([er[ti].loc[0] for ti in test_turbines], axis=1).T
     return results_energy_ratio
 
 
@@ -151,17 +126,21 @@ if __name__ == "__main__":
     # N_bootstrapping to a value larger than 1.
     N_bootstrapping = 50
 
-    # Load FLORIS and load SCADA data
+    # Load FLORIS and define wind direction that perfectly aligns turbine array
     fi = load_floris()
-    df = load_data()
+    wd = _get_angle(fi, turbine_array)
+
+    # Load the SCADA data of the turbines in the array. Note that the store is
+    # partitioned by the farm-wide wind direction, whereas we bin the data on
+    # the wind direction of the first turbine in the array below. These can
+    # differ by more than any fixed margin, so we do not select wind direction
+    # sectors of the store here.
+    df = load_postprocessed_store(turbines=turbine_array)
 
     # Note that we normalize everything in our results to the first turbine in the array
     t0 = turbine_array[0]
     df = dfm.set_wd_by_turbines(df, t0)
 
-    # Define wind direction that perfectly aligns turbine array
-    wd = _get_angle(fi, turbine_array)
-
     # Calculate energy ratio for narrow bin near 'wd'
     results_energy_ratio = _calculate_energy_ratios(
         df=df,
@@ -12,8 +12,6 @@
 
 
 import matplotlib.pyplot as plt
-import os
-import pandas as pd
 
 from floris import tools as wfct
 from flasc.energy_ratio import energy_ratio
@@ -21,26 +19,16 @@ from flasc.dataframe_operations import dataframe_manipulations as dfm
 from flasc import floris_tools as fsatools
 
 from {{cookiecutter.project_slug}}.models import load_floris
-
-
-def load_data():
-    # Load the data
-    print("Loading .ftr data. This may take a minute or two...")
-    root_path = os.path.dirname(os.path.abspath(__file__))
-    data_path = os.path.join(root_path, "..", "raw_data_processing", "postprocessed")
-    f = os.path.join(data_path, "df_scada_data_600s_filtered_and_northing_calibrated.ftr")
-    if os.path.exists(f):
-        df_scada = pd.read_feather(f)
-    else:
-        raise UserWarning("Please run the scripts in 'raw_data_processing' first.")
-
-    return df_scada
+from {{cookiecutter.project_slug}}.scada_store import load_postprocessed_store
+from {{cookiecutter.project_slug}}.upstream import UpstreamTurbineIndex, set_ws_by_upstream_turbines
 
 
 if __name__ == '__main__':
-    # Load data and floris object
-    df = load_data()
+    # Load floris object and the wind directions, wind speeds and powers of
+    # all turbines in the data, for wind directions between 20 and 90 deg
     fi = load_floris()
+    columns = ["{:s}_{:03d}".format(v, ti) for v in ["wd", "ws", "pow"] for ti in range(len(fi.layout_x))]
+    df = load_postprocessed_store(columns=columns, wd_range=[20.0, 90.0])
 
     # Visualize layout
     fig, ax = plt.subplots()
@@ -71,7 +59,8 @@ if __name__ == '__main__':
     # as the average power production of turbines 0 and 6, which are
     # always upstream for wind directions between 20 and 90 deg.
     df_upstream = fsatools.get_upstream_turbs_floris(fi)
-    df = dfm.set_ws_by_upstream_turbines(df, df_upstream)
+    upstream_index = UpstreamTurbineIndex(df_upstream, num_turbines=len(fi.layout_x))
+    df = set_ws_by_upstream_turbines(df, upstream_index)
     df = dfm.set_pow_ref_by_turbines(df, turbine_numbers=[0, 6])
 
     # # Initialize energy ratio object for the dataframe
@@ -12,109 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 
-from floris.utilities import wrap_360
-
-from flasc.dataframe_operations import dataframe_manipulations as dfm
 from flasc import floris_tools as ftools
-from flasc.energy_ratio import energy_ratio_suite
 from flasc.visualization import plot_floris_layout
 
+from {{cookiecutter.project_slug}}.heterogeneity import estimate_heterogeneity
 from {{cookiecutter.project_slug}}.models import load_floris
-
-
-def load_data():
-    # Load the data
-    print("Loading .ftr data. This may take a minute or two...")
-    root_path = os.path.dirname(os.path.abspath(__file__))
-    data_path = os.path.join(root_path, "..", "raw_data_processing", "postprocessed")
-    f = os.path.join(data_path, "df_scada_data_600s_filtered_and_northing_calibrated.ftr")
-    if os.path.exists(f):
-        df_scada = pd.read_feather(f)
-    else:
-        raise UserWarning("Please run the scripts in 'raw_data_processing' first.")
-
-    return df_scada
-
-
-def get_energy_ratio(df, ti, wd_bins):
-    # Calculate and plot energy ratios
-    s = energy_ratio_suite.energy_ratio_suite(verbose=False)
-    s.add_df(df, 'Raw data (wind direction calibrated)')
-    return s.get_energy_ratios(
-        test_turbines=ti,
-        ws_bins=[[6.0, 10.0]],
-        wd_bins=wd_bins,
-        N=1,
-        percentiles=[5., 95.],
-        verbose=False,
-        balance_bins_between_dfs=False,
-    )
-
-
-def _process_single_wd(wd, wd_bin_width, turb_wd_measurement, df_upstream, df):
-    # In this function, we calculate the energy ratios of all upstream
-    # turbines for a single wind direction bin and single wind speed bin.
-    # The difference in energy ratios between different upstream turbines
-    # gives a strong indication of the heterogeneity in the inflow wind
-    # speeds for that mean inflow wind direction.
-    print("Processing wind direction = {:.1f} deg.".format(wd))
-    wd_bins = [[wd - wd_bin_width / 2.0, wd + wd_bin_width / 2.0]]
-
-    # Determine which turbines are upstream
-    if wd > df_upstream.iloc[0]["wd_max"]:
-        turbine_array = df_upstream.loc[
-            (wd > df_upstream["wd_min"]) & (wd <= df_upstream["wd_max"]),
-            "turbines"
-        ].values[0]
-
-    # deal with wd = 0 deg (or close to 0.0)
-    else:
-        turbine_array = df_upstream.loc[
-            (wrap_360(wd + 180) > wrap_360(df_upstream["wd_min"] + 180.0)) &
-            (wrap_360(wd + 180) <= wrap_360(df_upstream["wd_max"] + 180)),
-            "turbines"
-        ].values[0]
-
-    # Load data and limit region
-    df = df.copy()
-    pow_cols = ["pow_{:03d}".format(t) for t in turbine_array]
-    df = df.dropna(subset=pow_cols)
-
-    # Filter dataframe and set a reference wd and ws
-    df = dfm.set_wd_by_turbines(df, turb_wd_measurement)
-    df = dfm.filter_df_by_wd(df, [wd - wd_bin_width, wd + wd_bin_width])
-    df = dfm.set_ws_by_turbines(df, turbine_array)
-    df = dfm.filter_df_by_ws(df, [6, 10])
-
-    # Set reference power for df and df_fi as the average power
-    # of all upstream turbines
-    df = dfm.set_pow_ref_by_turbines(df, turbine_array)
-
-    results_scada = []
-    for ti in turbine_array:
-        # Get energy ratios
-        er = get_energy_ratio(df, ti, wd_bins)
-        results_scada.append(er[0]["er_results"].loc[0])
-
-    results_scada = pd.concat(results_scada, axis=1).T
-    energy_ratios = np.array(results_scada["baseline"], dtype=float)
-    energy_ratios_lb = np.array(results_scada["baseline_lb"], dtype=float)
-    energy_ratios_ub = np.array(results_scada["baseline_ub"], dtype=float)
-
-    return pd.DataFrame({
-            "wd": [wd],
-            "wd_bin_width": [wd_bin_width],
-            "upstream_turbines": [turbine_array],
-            "energy_ratios": [energy_ratios],
-            "energy_ratios_lb": [energy_ratios_lb],
-            "energy_ratios_ub": [energy_ratios_ub],
-            "ws_ratios": [energy_ratios**(1/3)],
-    })
+from {{cookiecutter.project_slug}}.scada_store import load_postprocessed_store
 
 
 def _plot_single_wd(df):
@@ -144,8 +50,9 @@ if __name__ == "__main__":
     fi = load_floris()
     plot_floris_layout(fi, plot_terrain=False)
 
-    # Load the SCADA data
-    df_full = load_data()
+    # Load the wind directions, wind speeds and powers of all turbines
+    columns = ["{:s}_{:03d}".format(v, ti) for v in ["wd", "ws", "pow"] for ti in range(len(fi.layout_x))]
+    df_full = load_postprocessed_store(columns=columns)
 
     # Now specify which turbines we want to use in the analysis. Basically,
     # we want to use all the turbines besides the ones that we know have
@@ -169,14 +76,27 @@ if __name__ == "__main__":
     # all upstream turbines. That gives a good idea of the heterogeneity
     # in the inflow wind speeds. Namely, turbines that consistently see
     # a higher energy ratio, also likely consistently see a higher wind speed.
-    df_list = []
-    for wd in np.arange(0.0, 360.0, 15.0):
-        df = _process_single_wd(wd, wd_bin_width, turb_wd_measurement, df_upstream, df_full)
-        fig, ax  = _plot_single_wd(df)  # Plot the results
-        df_list.append(df)
-
-    # Finally merge the results to a single dataframe and print
-    df = pd.concat(df_list).reset_index(drop=True)
+    # The wind directions are processed in parallel, using 'max_workers'
+    # processes. Since each wind direction only touches its own sector of
+    # the data, finer steps, e.g., 2 deg, are affordable too. The shaded
+    # areas in the plots show the 5 % to 95 % confidence bounds from 'N'
+    # bootstrap evaluations.
+    max_workers = 8
+    N = 50
+    df = estimate_heterogeneity(
+        df_full,
+        df_upstream,
+        turb_wd_measurement,
+        wd_array=np.arange(0.0, 360.0, 15.0),
+        wd_bin_width=wd_bin_width,
+        N=N,
+        percentiles=[5.0, 95.0],
+        max_workers=max_workers,
+    )
+    for ii in range(df.shape[0]):
+        fig, ax = _plot_single_wd(df.iloc[[ii]].reset_index(drop=True))  # Plot the results
+
+    # Print the merged results
     print(df)
 
     plt.show()
\ No newline at end of file
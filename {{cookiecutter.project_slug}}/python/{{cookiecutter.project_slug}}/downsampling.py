@@ -0,0 +1,295 @@
+from datetime import timedelta as td
+
+import numpy as np
+import pandas as pd
+
+from {{cookiecutter.project_slug}}.scada_store import format_chunk
+
+
+class StreamingDownsampler:
+    """Downsample high-resolution data, e.g., 1 Hz measurements, to window
+    averages, e.g., 600 s, one chunk at a time. Like flasc's
+    time_operations.df_downsample(...), windows are closed on the left and
+    labelled by their right edge, and angular columns are averaged through
+    the means of their sine and cosine components. Windows are aligned to
+    the Unix epoch, which equals the alignment of pandas for window widths
+    that divide a day. Windows without any data are omitted rather than
+    returned as rows of NaNs.
+
+    The data must be sorted by time. Per window, only sums and counts are
+    kept, so memory use is bounded by the chunk size. The last window of a
+    chunk is carried over to the next chunk, as it may not be complete yet.
+    Call flush() after the last chunk to obtain the final window.
+
+    Since each window covers a contiguous range of rows, the mapping between
+    the downsampled and the original data is returned as the first and last
+    row number of each window, counted from the start of the data stream.
+
+    Args:
+        cols_angular (list): Columns with angles in degrees, e.g., 'wd_###'
+          and 'yaw_###'.
+        window_width (td, optional): Width of the averaging windows.
+          Defaults to td(seconds=600).
+        min_periods (int, optional): Minimum number of valid measurements for
+          a window average, below which it is marked as NaN. Defaults to 1.
+        center (bool, optional): Label the windows by their center rather
+          than their right edge. Defaults to False.
+        time_col (str, optional): Name of the time column. Defaults to "time".
+    """
+    def __init__(self, cols_angular, window_width=td(seconds=600), min_periods=1, center=False, time_col="time"):
+        self.cols_angular = list(cols_angular)
+        self.window_width = pd.Timedelta(window_width)
+        self.min_periods = min_periods
+        self.center = center
+        self.time_col = time_col
+        self.reset()
+
+    def reset(self):
+        self.columns = None
+        self._n_rows = 0  # Number of rows processed so far
+        self._carry = None  # Sums and counts of the last window
+
+    def _set_columns(self, df):
+        self.columns = [c for c in df.columns if c != self.time_col]
+        self._cols_regular = [c for c in self.columns if c not in self.cols_angular]
+        self._cols_angular = [c for c in self.columns if c in self.cols_angular]
+
+    def update(self, df):
+        """Process the next chunk of data.
+
+        Args:
+            df (pd.DataFrame): Chunk of data with a time column.
+
+        Returns:
+            df_out (pd.DataFrame): Averages of the windows that are complete.
+            index_mapping (np.array): Integer array of shape (n_windows, 2)
+              with the first and last row number of each window in the data
+              stream.
+        """
+        if self.columns is None:
+            self._set_columns(df)
+        if df.shape[0] == 0:
+            return self._get_output(*self._get_empty_windows())
+
+        # Assign each measurement to a window
+        w = self.window_width.value
+        time = df[self.time_col]
+        if not pd.api.types.is_datetime64_any_dtype(time):
+            time = pd.to_datetime(time)
+        time = time.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        window_ids = time // w
+        if np.any(np.diff(window_ids) < 0) or (
+            (self._carry is not None) and (window_ids[0] < self._carry["window_ids"][0])
+        ):
+            raise ValueError("The data must be sorted by time.")
+
+        # Sum the values and the sine and cosine components of the angles
+        angles = np.deg2rad(df[self._cols_angular].to_numpy(dtype=np.float64))
+        values = np.hstack([
+            df[self._cols_regular].to_numpy(dtype=np.float64), np.sin(angles), np.cos(angles)
+        ])
+        is_valid = ~np.isnan(values)
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(window_ids)) + 1])
+        windows = {
+            "window_ids": window_ids[starts],
+            "sums": np.add.reduceat(np.where(is_valid, values, 0.0), starts, axis=0),
+            "counts": np.add.reduceat(is_valid.astype(np.int64), starts, axis=0),
+            "row_first": self._n_rows + starts,
+            "row_last": self._n_rows + np.append(starts[1:], df.shape[0]) - 1,
+        }
+        self._n_rows += df.shape[0]
+
+        # Merge with the window carried over from the previous chunk
+        if self._carry is not None:
+            if self._carry["window_ids"][0] == windows["window_ids"][0]:
+                windows["sums"][0] += self._carry["sums"][0]
+                windows["counts"][0] += self._carry["counts"][0]
+                windows["row_first"][0] = self._carry["row_first"][0]
+            else:
+                windows = {k: np.concatenate([self._carry[k], v]) for k, v in windows.items()}
+
+        # The last window may continue in the next chunk
+        self._carry = {k: v[-1:] for k, v in windows.items()}
+        return self._get_output(*[v[:-1] for v in windows.values()])
+
+    def flush(self):
+        """Return the last window and reset the downsampler.
+
+        Returns:
+            df_out (pd.DataFrame): Averages of the last window.
+            index_mapping (np.array): Integer array of shape (1, 2) with the
+              first and last row number of the last window.
+        """
+        if self._carry is None:
+            windows = self._get_empty_windows()
+        else:
+            windows = self._carry.values()
+        output = self._get_output(*windows)
+        columns = self.columns
+        self.reset()
+        self.columns = columns
+        return output
+
+    def _get_empty_windows(self):
+        n_values = len(self._cols_regular) + 2 * len(self._cols_angular)
+        return (
+            np.zeros(0, dtype=np.int64),
+            np.zeros((0, n_values)),
+            np.zeros((0, n_values), dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+        )
+
+    def _get_output(self, window_ids, sums, counts, row_first, row_last):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = sums / counts
+        means[counts < max(self.min_periods, 1)] = np.nan
+
+        # Angular means from the mean sine and cosine components
+        n_reg = len(self._cols_regular)
+        n_ang = len(self._cols_angular)
+        angles = np.rad2deg(np.arctan2(means[:, n_reg:n_reg + n_ang], means[:, n_reg + n_ang:]))
+
+        w = self.window_width.value
+        time = (window_ids + 1) * w
+        if self.center:
+            time = time - w // 2
+        df_out = pd.DataFrame(
+            np.hstack([means[:, :n_reg], np.mod(angles, 360.0)]),
+            columns=self._cols_regular + self._cols_angular,
+        )
+        df_out = df_out[self.columns]
+        df_out.insert(0, self.time_col, pd.to_datetime(time))
+        return df_out, np.vstack([row_first, row_last]).T
+
+
+def df_downsample(df, cols_angular, window_width=td(seconds=600), min_periods=1, center=False, chunksize=100000):
+    """Downsample a dataframe to window averages, see StreamingDownsampler.
+    This is a faster, chunked alternative to flasc's
+    time_operations.df_downsample(...) with return_index_mapping=True.
+
+    Args:
+        df (pd.DataFrame): Dataframe with a 'time' column, sorted by time.
+        cols_angular (list): Columns with angles in degrees.
+        window_width (td, optional): Width of the averaging windows.
+          Defaults to td(seconds=600).
+        min_periods (int, optional): Minimum number of valid measurements for
+          a window average. Defaults to 1.
+        center (bool, optional): Label the windows by their center. Defaults
+          to False.
+        chunksize (int, optional): Number of rows processed at once. Defaults
+          to 100000.
+
+    Returns:
+        df_out (pd.DataFrame): Downsampled dataframe.
+        index_mapping (np.array): Integer array of shape (n_windows, 2) with
+          the first and last row number in 'df' of each window.
+    """
+    downsampler = StreamingDownsampler(cols_angular, window_width, min_periods, center)
+    outputs = [downsampler.update(df.iloc[ii:ii + chunksize]) for ii in range(0, df.shape[0], chunksize)]
+    outputs.append(downsampler.flush())
+    df_out = pd.concat([o[0] for o in outputs], ignore_index=True)
+    return df_out, np.vstack([o[1] for o in outputs])
+
+
+def downsample_csv(
+    fn_csv,
+    cols_angular=None,
+    column_mapping=None,
+    window_width=td(seconds=600),
+    min_periods=1,
+    center=False,
+    chunksize=500000,
+):
+    """Downsample a large .csv file with high-resolution data, streaming it
+    in chunks so that it is never loaded in full. Each chunk is formatted
+    with scada_store.format_chunk(...).
+
+    Args:
+        fn_csv (str): Path to the .csv file, sorted by time.
+        cols_angular (list, optional): Columns with angles in degrees, after
+          renaming. Defaults to None, meaning all 'wd_###' and 'yaw_###'
+          columns.
+        column_mapping (dict, optional): Mapping of the raw to the new column
+          names, e.g., scada_store.get_scada_dict(...). Defaults to None.
+        window_width (td, optional): Width of the averaging windows.
+          Defaults to td(seconds=600).
+        min_periods (int, optional): Minimum number of valid measurements for
+          a window average. Defaults to 1.
+        center (bool, optional): Label the windows by their center. Defaults
+          to False.
+        chunksize (int, optional): Number of rows read at once. Defaults to
+          500000.
+
+    Returns:
+        df_out (pd.DataFrame): Downsampled dataframe.
+        index_mapping (np.array): Integer array of shape (n_windows, 2) with
+          the first and last row number in the .csv file of each window.
+    """
+    try:
+        reader = pd.read_csv(fn_csv, chunksize=chunksize)
+    except pd.errors.EmptyDataError:
+        reader = []  # File without any content
+
+    downsampler = None
+    outputs = []
+    for df in reader:
+        df = format_chunk(df, column_mapping=column_mapping)
+        if downsampler is None:
+            if cols_angular is None:
+                cols_angular = [c for c in df.columns if c.startswith(("wd_", "yaw_"))]
+            downsampler = StreamingDownsampler(cols_angular, window_width, min_periods, center)
+        outputs.append(downsampler.update(df))
+    if downsampler is None:  # No chunks to downsample
+        return pd.DataFrame({"time": pd.to_datetime([])}), np.zeros((0, 2), dtype=np.int64)
+
+    outputs.append(downsampler.flush())
+    df_out = pd.concat([o[0] for o in outputs], ignore_index=True)
+    return df_out, np.vstack([o[1] for o in outputs])
+
+
+def get_high_resolution_flags(flags, index_mapping, row_start=0, n_rows=None):
+    """Project flags decided on downsampled data, e.g., faulty 600 s
+    averages, back onto the rows of the original high-resolution data. The
+    high-resolution data can be processed chunk by chunk, by passing the row
+    number of the first row of each chunk.
+
+    Args:
+        flags (np.array | pd.DataFrame): Flags of shape (n_windows,) or
+          (n_windows, n_flags), e.g., df_filtered[cols].isna() on the
+          downsampled and filtered dataframe.
+        index_mapping (np.array): Mapping of each window to its first and
+          last row, see StreamingDownsampler.
+        row_start (int, optional): Row number of the first high-resolution
+          row to get the flags for. Defaults to 0.
+        n_rows (int, optional): Number of high-resolution rows. Defaults to
+          None, meaning up to the last row in the mapping.
+
+    Returns:
+        flags_out (np.array | pd.DataFrame): Flags of the high-resolution rows.
+          Rows that are not part of any window are False.
+    """
+    index_mapping = np.asarray(index_mapping, dtype=np.int64).reshape(-1, 2)
+    values = np.asarray(flags, dtype=bool)
+    n_windows = index_mapping.shape[0]
+    if n_rows is None:
+        n_rows = 0 if n_windows == 0 else int(index_mapping[-1, 1]) + 1 - row_start
+        n_rows = max(n_rows, 0)
+    rows = row_start + np.arange(n_rows)
+
+    if n_windows == 0:
+        # Nothing was downsampled, so none of the rows are part of a window
+        flags_out = np.zeros((n_rows,) + values.shape[1:], dtype=bool)
+    else:
+        # Find the window that each row belongs to
+        ids = np.searchsorted(index_mapping[:, 1], rows, side="left")
+        is_mapped = (ids < n_windows)
+        ids = np.clip(ids, 0, n_windows - 1)
+        is_mapped &= (index_mapping[ids, 0] <= rows)
+
+        flags_out = values[ids]
+        flags_out[~is_mapped] = False
+
+    if isinstance(flags, pd.DataFrame):
+        return pd.DataFrame(flags_out, columns=flags.columns)
+    return flags_out
@@ -0,0 +1,912 @@
+import warnings as wn
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from floris.utilities import wrap_360
+
+from flasc.energy_ratio import energy_ratio_visualization as vis
+
+
+def get_ws_bins(ws_step=1.0, ws_bins=None):
+    """Get the wind speed bins in the same way as flasc's energy_ratio
+    class: bins of width 'ws_step' from 0 m/s, up to 30 m/s, unless the bins
+    are specified directly.
+
+    Args:
+        ws_step (float, optional): Wind speed bin width. Ignored if 'ws_bins'
+          is provided. Defaults to 1.0.
+        ws_bins (array, optional): Array with the lower and upper bound of
+          each wind speed bin. Defaults to None.
+
+    Returns:
+        ws_labels (np.array): Center of each wind speed bin.
+        ws_bins (np.array): Array of shape (n_bins, 2) with the bounds of
+          each wind speed bin.
+    """
+    if ws_bins is None:
+        ws_step = float(ws_step)
+        ws_labels = np.arange(ws_step / 2.0, 30.0001, ws_step)
+        ws_bins = np.vstack([ws_labels - ws_step / 2.0, ws_labels + ws_step / 2.0]).T
+    else:
+        ws_bins = np.array(ws_bins, dtype=float).reshape(-1, 2)
+        ws_labels = np.mean(ws_bins, axis=1)
+    return ws_labels, ws_bins
+
+
+def get_wd_bins(wd_step=2.0, wd_bin_width=None, wd_bins=None):
+    """Get the wind direction bins in the same way as flasc's energy_ratio
+    class. Bins can overlap if 'wd_bin_width' is larger than 'wd_step'.
+
+    Args:
+        wd_step (float, optional): Wind direction step between the bin
+          centers. Ignored if 'wd_bins' is provided. Defaults to 2.0.
+        wd_bin_width (float, optional): Width of each wind direction bin.
+          Defaults to None, meaning equal to 'wd_step'.
+        wd_bins (array, optional): Array with the lower and upper bound of
+          each wind direction bin. Defaults to None.
+
+    Returns:
+        wd_labels (np.array): Center of each wind direction bin.
+        wd_bins (np.array): Array of shape (n_bins, 2) with the bounds of
+          each wind direction bin.
+    """
+    if wd_bins is None:
+        wd_step = float(wd_step)
+        if wd_bin_width is None:
+            wd_bin_width = wd_step
+        wd_bin_width = float(wd_bin_width)
+        wd_min = np.min([wd_step / 2.0, wd_bin_width / 2.0])
+        wd_labels = np.arange(wd_min, 360.0001, wd_step)
+        wd_bins = np.vstack([wd_labels - wd_bin_width / 2.0, wd_labels + wd_bin_width / 2.0]).T
+    else:
+        wd_bins = np.array(wd_bins, dtype=float).reshape(-1, 2)
+        wd_labels = np.mean(wd_bins, axis=1)
+    return wd_labels, wd_bins
+
+
+def get_bin_assignment(wd, ws, wd_bins, ws_bins):
+    """Assign measurements to wind direction and wind speed bins, following
+    flasc's energy_ratio class. Bins are closed on the left, wind direction
+    bins may wrap around 360 deg and may overlap, in which case a measurement
+    is assigned to multiple bins.
+
+    Args:
+        wd (np.array): Wind directions in [deg].
+        ws (np.array): Wind speeds in [m/s].
+        wd_bins (np.array): Array of shape (n_wd_bins, 2) with the bounds of
+          each wind direction bin, see get_wd_bins(...).
+        ws_bins (np.array): Array of shape (n_ws_bins, 2) with the bounds of
+          each wind speed bin, see get_ws_bins(...).
+
+    Returns:
+        sample_ids (np.array): Index of the measurement of each assignment.
+        wd_bin_ids (np.array): Wind direction bin of each assignment.
+        ws_bin_ids (np.array): Wind speed bin of each assignment, or -1 if
+          the wind speed is outside of all wind speed bins.
+    """
+    wd = np.mod(np.asarray(wd, dtype=float), 360.0)
+    ws = np.asarray(ws, dtype=float)
+
+    # Wind speed bins do not overlap
+    ws_ids = np.full(len(ws), -1, dtype=np.int64)
+    for jj, (lb, ub) in enumerate(ws_bins):
+        ws_ids[(ws >= lb) & (ws < ub)] = jj
+
+    # Find the measurements of each wind direction bin in the sorted data
+    order = np.argsort(wd, kind="stable")
+    wd_sorted = wd[order]
+    n_valid = np.count_nonzero(~np.isnan(wd))
+    sample_ids = []
+    wd_bin_ids = []
+    for ii, (lb, ub) in enumerate(wd_bins):
+        lb = wrap_360(lb)
+        ub = wrap_360(ub)
+        i_lb, i_ub = np.searchsorted(wd_sorted[:n_valid], [lb, ub], side="left")
+        if ub < lb:  # Deal with angle wrapping
+            ids = np.concatenate([order[i_lb:n_valid], order[:i_ub]])
+        else:
+            ids = order[i_lb:max(i_ub, i_lb)]
+        sample_ids.append(np.sort(ids))
+        wd_bin_ids.append(np.full(len(ids), ii, dtype=np.int64))
+
+    sample_ids = np.concatenate(sample_ids)
+    return sample_ids, np.concatenate(wd_bin_ids), ws_ids[sample_ids]
+
+
+def iterate_bootstrap_weights(n_samples, N, num_blocks=-1, method="poisson", seed=None, chunksize=None):
+    """Draw the weights of all bootstrap resamples, chunk by chunk of
+    consecutive measurements, so that only the weights of a single chunk are
+    in memory at once. Each weight is the number of times a measurement
+    appears in a resample. The first resample is the original data, i.e.,
+    all weights equal to one.
+
+    With block bootstrapping, the measurements are split into 'num_blocks'
+    blocks of consecutive measurements that are resampled as a whole. This
+    preserves the autocorrelation of, e.g., 600 s data within each block.
+    Chunks never split a block.
+
+    Every chunk has its own random number generator, spawned from 'seed', so
+    the weights of a chunk don't depend on how many values were drawn for
+    the chunks before it. With 'multinomial', the number of draws that fall
+    in each chunk is drawn first, conditional on the draws in the earlier
+    chunks, which gives the same distribution as drawing all weights at once.
+
+    Args:
+        n_samples (int): Number of measurements.
+        N (int): Number of resamples, including the original data.
+        num_blocks (int, optional): Number of blocks for block bootstrapping.
+          Defaults to -1, meaning every measurement is resampled on its own.
+        method (str, optional): Distribution of the weights. With
+          'multinomial', every resample has exactly as many measurements (or
+          blocks) as the original data, like sampling with replacement. With
+          'poisson', the weights are drawn independently from a Poisson
+          distribution with a mean of one. Defaults to 'poisson'.
+        seed (int, optional): Seed of the random number generator. Defaults
+          to None.
+        chunksize (int, optional): Approximate number of measurements per
+          chunk. Defaults to None, meaning about 1e7 weights per chunk.
+
+    Yields:
+        start (int): Index of the first measurement of the chunk.
+        weights (np.array): Integer array of shape (N, n_chunk) with the
+          weights of the measurements in the chunk.
+    """
+    if method not in ["poisson", "multinomial"]:
+        raise ValueError("Bootstrap method must be 'poisson' or 'multinomial'.")
+    if (num_blocks > n_samples) or (num_blocks in [0, 1]) or (num_blocks < -1):
+        raise ValueError(
+            "num_blocks should either be -1 (don't use block bootstrapping) or else a number between 2 and n_samples."
+        )
+
+    n_units = n_samples if num_blocks < 0 else num_blocks
+    if n_units == 0:
+        return  # No measurements to resample
+    if chunksize is None:
+        chunksize = max(1, int(1.0e7 / N))
+
+    # Number of blocks (or measurements) per chunk, and the first measurement
+    # of each block. Blocks have (nearly) equal length.
+    units_per_chunk = max(1, int(chunksize) * n_units // n_samples)
+    unit_starts = -(-np.arange(n_units + 1) * n_samples // n_units)
+
+    chunk_starts = np.arange(0, n_units, units_per_chunk)
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(chunk_starts))]
+    n_remaining = np.full(N - 1, n_units, dtype=np.int64)  # Multinomial draws left per resample
+    for u_start, rng in zip(chunk_starts, rngs):
+        u_end = min(u_start + units_per_chunk, n_units)
+        n_chunk = u_end - u_start
+        weights = np.ones((N, n_chunk), dtype=np.uint16)
+        if N > 1:
+            if method == "poisson":
+                weights[1:] = rng.poisson(1.0, size=(N - 1, n_chunk))
+            else:
+                n_drawn = rng.binomial(n_remaining, n_chunk / (n_units - u_start))
+                n_remaining -= n_drawn
+                weights[1:] = rng.multinomial(n_drawn, np.full(n_chunk, 1.0 / n_chunk))
+
+        if num_blocks > 0:
+            lengths = np.diff(unit_starts[u_start:u_end + 1])
+            weights = np.repeat(weights, lengths, axis=1)
+        yield int(unit_starts[u_start]), weights
+
+
+def get_bootstrap_weights(n_samples, N, num_blocks=-1, method="poisson", seed=None):
+    """Draw the weights of all bootstrap resamples at once, see
+    iterate_bootstrap_weights(...). Only meant for small datasets, as the
+    full weight matrix is kept in memory.
+
+    Args:
+        n_samples (int): Number of measurements.
+        N (int): Number of resamples, including the original data.
+        num_blocks (int, optional): Number of blocks for block bootstrapping.
+          Defaults to -1, meaning no block bootstrapping.
+        method (str, optional): Distribution of the weights, 'poisson' or
+          'multinomial'. Defaults to 'poisson'.
+        seed (int, optional): Seed of the random number generator. Defaults
+          to None.
+
+    Returns:
+        np.array: Integer array of shape (N, n_samples) with the weights.
+    """
+    weights = [
+        w for _, w in iterate_bootstrap_weights(n_samples, N, num_blocks=num_blocks, method=method, seed=seed)
+    ]
+    if len(weights) == 0:
+        return np.ones((N, 0), dtype=np.uint16)
+    return np.concatenate(weights, axis=1)
+
+
+def _bootstrap_binned_energy_ratios(
+    bin_assignment,
+    pow_test,
+    pow_ref,
+    n_wd_bins,
+    n_ws_bins,
+    N=1,
+    percentiles=[5.0, 95.0],
+    num_blocks=-1,
+    method="poisson",
+    seed=None,
+    chunksize=None,
+):
+    # Energy ratios with bootstrapping for measurements that are already
+    # assigned to their bins, see get_bin_assignment(...). Every column of
+    # 'pow_test' is a separate test, with its own reference power if
+    # 'pow_ref' has as many columns, and all tests share the resamples.
+    pow_test = np.asarray(pow_test, dtype=float)
+    if pow_test.ndim == 1:
+        pow_test = pow_test[:, None]
+    pow_ref = np.asarray(pow_ref, dtype=float)
+    if pow_ref.ndim == 1:
+        pow_ref = pow_ref[:, None]
+    n_tests = pow_test.shape[1]
+    n_cells = n_wd_bins * n_ws_bins
+
+    sample_ids, wd_bin_ids, ws_bin_ids = bin_assignment
+    bin_count = np.bincount(wd_bin_ids, minlength=n_wd_bins)
+    is_binned = (ws_bin_ids >= 0)
+    sample_ids = sample_ids[is_binned]
+    cell_ids = wd_bin_ids[is_binned] * n_ws_bins + ws_bin_ids[is_binned]
+    n_rows = np.bincount(cell_ids, minlength=n_cells)
+
+    # Only the binned measurements are resampled, in their original order
+    samples, sample_ids = np.unique(sample_ids, return_inverse=True)
+    N = max(N, 1)
+
+    # Sparse matrix with for every measurement its valid count, test power
+    # and reference power in the columns of its bins, for every test
+    is_valid = ~np.isnan(pow_test[samples]) & ~np.isnan(pow_ref[samples])
+    values = np.stack([
+        is_valid,
+        np.where(is_valid, pow_test[samples], 0.0),
+        np.where(is_valid, pow_ref[samples], 0.0),
+    ])  # Shape (3, n_samples, n_tests)
+    values = values[:, sample_ids, :]
+    cols = (np.arange(3)[:, None, None] * n_tests + np.arange(n_tests)) * n_cells + cell_ids[:, None]
+    rows = np.broadcast_to(sample_ids[:, None], values.shape)
+    M = sparse.csr_matrix(
+        (values.ravel(), (rows.ravel(), np.broadcast_to(cols, values.shape).ravel())),
+        shape=(len(samples), 3 * n_tests * n_cells),
+    )
+
+    # Binned sums of every resample, drawing the weights chunk by chunk
+    sums = np.zeros((N, 3 * n_tests * n_cells))
+    weight_chunks = iterate_bootstrap_weights(
+        len(samples), N, num_blocks=num_blocks, method=method, seed=seed, chunksize=chunksize
+    )
+    for ii, weights in weight_chunks:
+        sums += np.asarray(weights.astype(float) @ M[ii:ii + weights.shape[1]])
+    sums = sums.reshape(-1, 3, n_tests, n_wd_bins, n_ws_bins)
+    n_valid, sum_test, sum_ref = sums[:, 0], sums[:, 1], sums[:, 2]
+
+    # Weigh the mean power in each wind speed bin by its original frequency
+    n_rows = n_rows.reshape(n_wd_bins, n_ws_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        freq_weights = np.where(n_valid > 0, n_rows / n_valid, 0.0)
+        results = np.sum(freq_weights * sum_test, axis=3) / np.sum(freq_weights * sum_ref, axis=3)
+    results[np.sum(n_valid, axis=3) == 0] = np.nan
+
+    energy_ratios = np.repeat(results[0][:, :, None], 3, axis=2)
+    if N > 1:
+        with wn.catch_warnings():
+            wn.simplefilter("ignore", category=RuntimeWarning)  # All-NaN bins
+            energy_ratios[:, :, 1:] = np.moveaxis(np.nanpercentile(results, percentiles, axis=0), 0, -1)
+    return bin_count, energy_ratios
+
+
+def bootstrap_energy_ratios(
+    wd,
+    ws,
+    pow_test,
+    pow_ref,
+    wd_bins,
+    ws_bins,
+    N=1,
+    percentiles=[5.0, 95.0],
+    num_blocks=-1,
+    method="poisson",
+    seed=None,
+    chunksize=None,
+):
+    """Calculate energy ratios with bootstrapping for uncertainty
+    quantification. Rather than repeating the energy ratio calculation for
+    every resample, like flasc's energy_ratio class, the resample weights
+    are drawn chunk by chunk, see iterate_bootstrap_weights(...), and the
+    binned power sums of every resample follow from the product of each
+    chunk of weights with a sparse matrix that holds the binned powers of
+    each measurement.
+
+    As in flasc, the frequency of each (wd, ws) bin is that of the original
+    data for all resamples, and the percentiles include the nominal result.
+    The measurements are resampled across all bins at once rather than per
+    wind direction bin. Measurements must be sorted by time for block
+    bootstrapping.
+
+    Args:
+        wd (np.array): Wind directions in [deg].
+        ws (np.array): Wind speeds in [m/s].
+        pow_test (np.array): Test powers of shape (n_samples,) or
+          (n_samples, n_tests), e.g., for multiple test turbines.
+        pow_ref (np.array): Reference powers of shape (n_samples,), or
+          (n_samples, n_tests) for a separate reference power per test.
+        wd_bins (np.array): Bounds of each wind direction bin.
+        ws_bins (np.array): Bounds of each wind speed bin.
+        N (int, optional): Number of bootstrap evaluations. If N=1, no
+          uncertainty quantification is performed. Defaults to 1.
+        percentiles (list, optional): Confidence bounds in percents.
+          Defaults to [5.0, 95.0].
+        num_blocks (int, optional): Number of blocks for block bootstrapping.
+          Defaults to -1, meaning no block bootstrapping.
+        method (str, optional): Distribution of the resample weights,
+          'poisson' or 'multinomial'. Defaults to 'poisson'.
+        seed (int, optional): Seed of the random number generator. Defaults
+          to None.
+        chunksize (int, optional): Number of measurements for which the
+          weights are drawn and multiplied at once, to limit memory usage.
+          Defaults to None, meaning about 1e7 weights at once.
+
+    Returns:
+        bin_count (np.array): Number of measurements in each wind direction
+          bin, at any wind speed.
+        energy_ratios (np.array): Array of shape (n_tests, n_wd_bins, 3) with
+          the nominal energy ratio and the lower and upper bound. Without
+          measurements, the energy ratio is NaN.
+    """
+    return _bootstrap_binned_energy_ratios(
+        get_bin_assignment(wd, ws, wd_bins, ws_bins),
+        pow_test,
+        pow_ref,
+        n_wd_bins=len(wd_bins),
+        n_ws_bins=len(ws_bins),
+        N=N,
+        percentiles=percentiles,
+        num_blocks=num_blocks,
+        method=method,
+        seed=seed,
+        chunksize=chunksize,
+    )
+
+
+def get_energy_ratios(
+    df,
+    test_turbines,
+    wd_step=2.0,
+    ws_step=1.0,
+    wd_bin_width=None,
+    wd_bins=None,
+    ws_bins=None,
+    N=1,
+    percentiles=[5.0, 95.0],
+    num_blocks=-1,
+    method="poisson",
+    seed=None,
+):
+    """Calculate the energy ratios of multiple test turbines at once. This
+    replaces calling flasc's energy_ratio_suite.get_energy_ratios(...) for
+    one test turbine at a time: the measurements are binned once and all
+    test turbines share the same bootstrap resamples, so that the cost
+    hardly grows with the number of test turbines. See
+    bootstrap_energy_ratios(...) for the details.
+
+    Args:
+        df (pd.DataFrame): Dataframe with the columns 'wd', 'ws', 'pow_ref'
+          and 'pow_###' of the test turbines, sorted by time.
+        test_turbines (list): Turbines to calculate the energy ratios of.
+          Every turbine gets its own energy ratios.
+        wd_step (float, optional): Wind direction step between the bins.
+          Defaults to 2.0.
+        ws_step (float, optional): Wind speed bin width. Defaults to 1.0.
+        wd_bin_width (float, optional): Wind direction bin width. Defaults
+          to None, meaning equal to 'wd_step'.
+        wd_bins (array, optional): Bounds of each wind direction bin,
+          overriding 'wd_step' and 'wd_bin_width'. Defaults to None.
+        ws_bins (array, optional): Bounds of each wind speed bin, overriding
+          'ws_step'. Defaults to None.
+        N (int, optional): Number of bootstrap evaluations. Defaults to 1.
+        percentiles (list, optional): Confidence bounds in percents.
+          Defaults to [5.0, 95.0].
+        num_blocks (int, optional): Number of blocks for block bootstrapping.
+          Defaults to -1, meaning no block bootstrapping.
+        method (str, optional): Distribution of the resample weights,
+          'poisson' or 'multinomial'. Defaults to 'poisson'.
+        seed (int, optional): Seed of the random number generator. Defaults
+          to None.
+
+    Returns:
+        dict: Dictionary with for each test turbine a dataframe with the
+          columns 'baseline', 'baseline_lb', 'baseline_ub', 'wd_bin' and
+          'bin_count', like the 'er_results' of flasc's
+          energy_ratio_suite. Bins without measurements are omitted.
+    """
+    if "pow_ref" not in df.columns:
+        raise ValueError("Your dataframe is missing a column called 'pow_ref'.")
+    test_turbines = [int(ti) for ti in np.atleast_1d(test_turbines)]
+
+    wd_labels, wd_bins = get_wd_bins(wd_step, wd_bin_width, wd_bins)
+    _, ws_bins = get_ws_bins(ws_step, ws_bins)
+    bin_count, energy_ratios = bootstrap_energy_ratios(
+        wd=df["wd"].to_numpy(dtype=float),
+        ws=df["ws"].to_numpy(dtype=float),
+        pow_test=df[["pow_{:03d}".format(ti) for ti in test_turbines]].to_numpy(dtype=float),
+        pow_ref=df["pow_ref"].to_numpy(dtype=float),
+        wd_bins=wd_bins,
+        ws_bins=ws_bins,
+        N=N,
+        percentiles=percentiles,
+        num_blocks=num_blocks,
+        method=method,
+        seed=seed,
+    )
+
+    is_used = (bin_count > 0)
+    results = {}
+    for ii, ti in enumerate(test_turbines):
+        results[ti] = pd.DataFrame({
+            "baseline": energy_ratios[ii, is_used, 0],
+            "baseline_lb": energy_ratios[ii, is_used, 1],
+            "baseline_ub": energy_ratios[ii, is_used, 2],
+            "wd_bin": wd_labels[is_used],
+            "bin_count": bin_count[is_used].astype(int),
+        })
+    return results
+
+
+class EnergyRatioHistogram:
+    """Pre-binned representation of a dataframe for repeated energy ratio
+    calculations. The data is aggregated once into fine (wd, ws) cells,
+    storing per cell the number of measurements and, for every test turbine,
+    the number of valid measurements and the sums of the test and reference
+    power. Energy ratios for any binning that is aligned with the cells, any
+    subset of the test turbines and any wind direction offset that is a
+    multiple of the cell width are then calculated from these sums alone,
+    without touching the measurements again.
+
+    The energy ratios equal those of flasc's energy_ratio class with N=1:
+    within each wind direction bin, the mean test and reference powers per
+    wind speed bin are weighted by the number of measurements in that wind
+    speed bin. The reference power is the 'pow_ref' column, which therefore
+    cannot depend on the wind direction offset. Where it does, e.g., in the
+    northing calibration, one histogram per reference can be combined cell
+    by cell through get_cell_sums(...), as in the coarse search of
+    northing_calibration.estimate_wd_bias_coarse_to_fine(...).
+
+    Args:
+        df (pd.DataFrame, optional): Dataframe with the columns 'wd', 'ws',
+          'pow_ref' and 'pow_###' of the test turbines. More data can be
+          added with add_df(...). Defaults to None.
+        test_turbines (list, optional): Turbines to store the power sums of.
+          Defaults to None, meaning all 'pow_###' columns of the first
+          dataframe.
+        wd_resolution (float, optional): Width of the wind direction cells
+          in [deg]. Must divide 360 deg. Defaults to 1.0.
+        ws_resolution (float, optional): Width of the wind speed cells in
+          [m/s]. Defaults to 1.0.
+        ws_max (float, optional): Upper bound of the last wind speed cell.
+          Measurements at higher wind speeds are ignored. Defaults to 30.0.
+    """
+    def __init__(self, df=None, test_turbines=None, wd_resolution=1.0, ws_resolution=1.0, ws_max=30.0):
+        n_wd = 360.0 / wd_resolution
+        if np.abs(n_wd - np.round(n_wd)) > 1.0e-6:
+            raise ValueError("The wind direction resolution must divide 360 deg.")
+
+        self.test_turbines = None if test_turbines is None else [int(ti) for ti in test_turbines]
+        self.wd_resolution = float(wd_resolution)
+        self.ws_resolution = float(ws_resolution)
+        self.n_wd = int(np.round(n_wd))
+        self.n_ws = int(np.ceil(ws_max / ws_resolution - 1.0e-6))
+        self.wd_edges = self.wd_resolution * np.arange(self.n_wd + 1)
+        self.ws_edges = self.ws_resolution * np.arange(self.n_ws + 1)
+
+        self.n_rows = np.zeros((self.n_wd, self.n_ws), dtype=np.int64)
+        self.n_rows_wd = np.zeros(self.n_wd, dtype=np.int64)  # Including all wind speeds
+        self.n_valid = None  # Shape (n_turbines, n_wd, n_ws)
+        self.sum_test = None
+        self.sum_ref = None
+        if df is not None:
+            self.add_df(df)
+
+    def _allocate(self, df):
+        if self.test_turbines is None:
+            self.test_turbines = sorted(
+                int(c[4:]) for c in df.columns if c.startswith("pow_") and c[4:].isdigit()
+            )
+        shape = (len(self.test_turbines), self.n_wd, self.n_ws)
+        self.n_valid = np.zeros(shape, dtype=np.int64)
+        self.sum_test = np.zeros(shape)
+        self.sum_ref = np.zeros(shape)
+
+    def add_df(self, df):
+        """Add the measurements of a dataframe to the histogram. This allows
+        building the histogram chunk by chunk, e.g., from a data store.
+
+        Args:
+            df (pd.DataFrame): Dataframe with the columns 'wd', 'ws',
+              'pow_ref' and 'pow_###' of the test turbines.
+        """
+        if "pow_ref" not in df.columns:
+            raise ValueError("Your dataframe is missing a column called 'pow_ref'.")
+        if self.n_valid is None:
+            self._allocate(df)
+
+        # Assign each measurement to a cell
+        wd = np.mod(df["wd"].to_numpy(dtype=float), 360.0)
+        ws = df["ws"].to_numpy(dtype=float)
+        is_binned = ~np.isnan(wd) & (ws >= 0.0) & (ws < self.ws_edges[-1])
+        wd_ids = np.minimum(np.floor(wd[~np.isnan(wd)] / self.wd_resolution).astype(np.int64), self.n_wd - 1)
+        self.n_rows_wd += np.bincount(wd_ids, minlength=self.n_wd)
+        wd_ids = wd_ids[is_binned[~np.isnan(wd)]]
+        ws_ids = np.minimum(np.floor(ws[is_binned] / self.ws_resolution).astype(np.int64), self.n_ws - 1)
+        cell_ids = wd_ids * self.n_ws + ws_ids
+        n_cells = self.n_wd * self.n_ws
+        self.n_rows += np.bincount(cell_ids, minlength=n_cells).reshape(self.n_wd, self.n_ws)
+
+        # Sum the valid test and reference powers of each turbine
+        pow_ref = df["pow_ref"].to_numpy(dtype=float)[is_binned]
+        for ii, ti in enumerate(self.test_turbines):
+            pow_test = df["pow_{:03d}".format(ti)].to_numpy(dtype=float)[is_binned]
+            is_valid = ~np.isnan(pow_test) & ~np.isnan(pow_ref)
+            ids = cell_ids[is_valid]
+            self.n_valid[ii] += np.bincount(ids, minlength=n_cells).reshape(self.n_wd, self.n_ws)
+            self.sum_test[ii] += np.bincount(ids, weights=pow_test[is_valid], minlength=n_cells).reshape(self.n_wd, self.n_ws)
+            self.sum_ref[ii] += np.bincount(ids, weights=pow_ref[is_valid], minlength=n_cells).reshape(self.n_wd, self.n_ws)
+
+    def _get_cell_ids(self, bounds, resolution, name):
+        # Convert bin bounds to cell indices, requiring them to be aligned
+        # with the cell edges
+        x = np.asarray(bounds, dtype=float) / resolution
+        if np.any(np.abs(x - np.round(x)) > 1.0e-6):
+            raise ValueError(
+                "The {:s} bins must be aligned with the cells of {:.3f}.".format(name, resolution)
+            )
+        return np.round(x).astype(np.int64)
+
+    def _get_wd_matrix(self, wd_bins):
+        # Matrix of shape (n_bins, n_wd) selecting the cells of each wind
+        # direction bin
+        ids = self._get_cell_ids(wd_bins, self.wd_resolution, "wind direction")
+        A = np.zeros((len(ids), self.n_wd))
+        for ii, (lb, ub) in enumerate(ids):
+            A[ii, np.mod(np.arange(lb, ub), self.n_wd)] = 1.0
+        return A
+
+    def _get_ws_matrix(self, ws_bins):
+        ids = self._get_cell_ids(ws_bins, self.ws_resolution, "wind speed")
+        A = np.zeros((len(ids), self.n_ws))
+        for ii, (lb, ub) in enumerate(ids):
+            A[ii, np.clip(lb, 0, self.n_ws):np.clip(ub, 0, self.n_ws)] = 1.0
+        return A
+
+    def get_cell_sums(self, wd_offset=0.0):
+        """Get the counts and power sums of every cell, with the measured
+        wind directions shifted by an offset. A measurement in the cell at
+        'wd' moves to the cell at 'wd + wd_offset'.
+
+        Args:
+            wd_offset (float, optional): Offset added to the measured wind
+              directions, a multiple of the cell width. Defaults to 0.0.
+
+        Returns:
+            dict: Dictionary with the arrays 'n_rows' and 'n_rows_wd' and,
+              with a leading turbine axis, 'n_valid', 'sum_test' and
+              'sum_ref'.
+        """
+        if self.n_valid is None:
+            raise UserWarning("Please add data to the histogram with add_df(...) first.")
+        shift = int(self._get_cell_ids(wd_offset, self.wd_resolution, "wind direction offset"))
+        return {
+            "n_rows": np.roll(self.n_rows, shift, axis=0),
+            "n_rows_wd": np.roll(self.n_rows_wd, shift),
+            "n_valid": np.roll(self.n_valid, shift, axis=1),
+            "sum_test": np.roll(self.sum_test, shift, axis=1),
+            "sum_ref": np.roll(self.sum_ref, shift, axis=1),
+        }
+
+    def get_energy_ratios(
+        self,
+        test_turbines=None,
+        wd_step=2.0,
+        ws_step=1.0,
+        wd_bin_width=None,
+        wd_bins=None,
+        ws_bins=None,
+        wd_offset=0.0,
+        fast=False,
+        cell_sums=None,
+    ):
+        """Calculate the energy ratios from the histogram.
+
+        Args:
+            test_turbines (list, optional): Turbines to calculate the energy
+              ratios of. Defaults to None, meaning all turbines.
+            wd_step (float, optional): Wind direction step between the bins.
+              Defaults to 2.0.
+            ws_step (float, optional): Wind speed bin width. Defaults to 1.0.
+            wd_bin_width (float, optional): Wind direction bin width.
+              Defaults to None, meaning equal to 'wd_step'.
+            wd_bins (array, optional): Bounds of each wind direction bin,
+              overriding 'wd_step' and 'wd_bin_width'. Defaults to None.
+            ws_bins (array, optional): Bounds of each wind speed bin,
+              overriding 'ws_step'. Defaults to None.
+            wd_offset (float, optional): Offset added to the measured wind
+              directions, e.g., minus a northing bias. Defaults to 0.0.
+            fast (bool, optional): Ignore the frequency weighting of the wind
+              speed bins, like flasc's get_energy_ratio_fast(...), though
+              still only using measurements within the wind speed bins.
+              Defaults to False.
+            cell_sums (dict, optional): Cell counts and power sums to use
+              instead of those of this histogram, e.g., combined from several
+              histograms, see get_cell_sums(...). 'wd_offset' is then
+              ignored. Defaults to None.
+
+        Returns:
+            dict: Dictionary with for each test turbine a dataframe with the
+              columns 'wd_bin', 'bin_count', 'baseline', 'baseline_lb' and
+              'baseline_ub', being the bin center, the number of
+              measurements in the wind direction bin at any wind speed and
+              the energy ratio. Bins without measurements are omitted.
+        """
+        if cell_sums is None:
+            cell_sums = self.get_cell_sums(wd_offset)
+        if test_turbines is None:
+            test_turbines = self.test_turbines
+        turbine_ids = [self.test_turbines.index(ti) for ti in test_turbines]
+
+        wd_labels, wd_bins = get_wd_bins(wd_step, wd_bin_width, wd_bins)
+        _, ws_bins = get_ws_bins(ws_step, ws_bins)
+        A_wd = self._get_wd_matrix(wd_bins)
+        A_ws = self._get_ws_matrix(ws_bins)
+
+        # Aggregate the cells to bins of shape (n_turbines, n_wd_bins, n_ws_bins)
+        n_rows = A_wd @ cell_sums["n_rows"] @ A_ws.T
+        n_valid = A_wd @ cell_sums["n_valid"][turbine_ids] @ A_ws.T
+        sum_test = A_wd @ cell_sums["sum_test"][turbine_ids] @ A_ws.T
+        sum_ref = A_wd @ cell_sums["sum_ref"][turbine_ids] @ A_ws.T
+
+        if fast:
+            energy_test = np.sum(sum_test, axis=2)
+            energy_ref = np.sum(sum_ref, axis=2)
+        else:
+            # Weigh the mean power in each wind speed bin by its frequency
+            with np.errstate(invalid="ignore", divide="ignore"):
+                weights = np.where(n_valid > 0, n_rows / n_valid, 0.0)
+            energy_test = np.sum(weights * sum_test, axis=2)
+            energy_ref = np.sum(weights * sum_ref, axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            energy_ratios = energy_test / energy_ref
+        energy_ratios[np.sum(n_valid, axis=2) == 0] = np.nan
+
+        bin_count = A_wd @ cell_sums["n_rows_wd"]
+        is_used = (bin_count > 0)
+        results = {}
+        for ii, ti in enumerate(test_turbines):
+            results[ti] = pd.DataFrame({
+                "wd_bin": wd_labels[is_used],
+                "bin_count": bin_count[is_used].astype(int),
+                "baseline": energy_ratios[ii, is_used],
+                "baseline_lb": energy_ratios[ii, is_used],
+                "baseline_ub": energy_ratios[ii, is_used],
+            })
+        return results
+
+
+class EnergyRatioSuite:
+    """Energy ratios of several dataframes, e.g., the SCADA data and the
+    FLORIS predictions of several wake models for that data, as a faster
+    alternative to flasc's energy_ratio_suite. Dataframes that share the same
+    inflow after masking, i.e., equal 'wd', 'ws' and, if present, 'time'
+    columns, are binned together: the bin assignment and the bootstrap
+    resamples are calculated once per group and applied to the powers of
+    every dataframe in it, see bootstrap_energy_ratios(...). Comparing
+    several models then costs about as much as a single dataframe.
+
+    The masks are only applied when the energy ratios are calculated. Within
+    a group, all dataframes see the same bin frequencies and resamples, which
+    equals the result of flasc without rebalancing. Dataframes with a
+    different inflow form their own group and are not rebalanced.
+    """
+    def __init__(self):
+        self.df_list = []
+        self.ws_range = None
+        self.wd_range = None
+        self.ti_range = None
+
+    def add_df(self, df, name, color=None):
+        """Add a dataframe to the suite.
+
+        Args:
+            df (pd.DataFrame): Dataframe with the columns 'wd', 'ws',
+              'pow_ref' and 'pow_###' of the test turbines, sorted by time.
+            name (str): Label of the dataframe.
+            color (str, optional): Color of the dataframe in the plots.
+              Defaults to None.
+        """
+        for c in ["wd", "ws", "pow_ref"]:
+            if c not in df.columns:
+                raise ValueError("Your dataframe is missing a column called '{:s}'.".format(c))
+        self.df_list.append({"df": df, "name": name, "color": color})
+
+    def set_masks(self, ws_range=None, wd_range=None, ti_range=None):
+        """Mask all dataframes to a subset of the data. Like flasc, each
+        range is open on the left and closed on the right.
+
+        Args:
+            ws_range (list, optional): Lower and upper bound of the wind
+              speed. Defaults to None, meaning no mask.
+            wd_range (list, optional): Lower and upper bound of the wind
+              direction. Defaults to None, meaning no mask.
+            ti_range (list, optional): Lower and upper bound of the
+              turbulence intensity. Defaults to None, meaning no mask.
+        """
+        self.ws_range = ws_range
+        self.wd_range = wd_range
+        self.ti_range = ti_range
+
+    def _get_mask(self, df):
+        mask = np.ones(df.shape[0], dtype=bool)
+        for c, x_range in [("ws", self.ws_range), ("wd", self.wd_range), ("ti", self.ti_range)]:
+            if x_range is not None:
+                x = df[c].to_numpy(dtype=float)
+                mask &= (x > x_range[0]) & (x <= x_range[1])
+        return mask
+
+    def _get_groups(self):
+        # Group the dataframes by their masked inflow
+        groups = []
+        for ii, d in enumerate(self.df_list):
+            df = d["df"]
+            mask = self._get_mask(df)
+            inflow = {c: df[c].to_numpy()[mask] for c in ["time", "wd", "ws"] if c in df.columns}
+            for group in groups:
+                if (group["inflow"].keys() == inflow.keys()) and all(
+                    np.array_equal(group["inflow"][c], inflow[c], equal_nan=(c != "time"))
+                    for c in inflow.keys()
+                ):
+                    group["df_ids"].append(ii)
+                    group["masks"].append(mask)
+                    break
+            else:
+                groups.append({"inflow": inflow, "df_ids": [ii], "masks": [mask]})
+        return groups
+
+    def get_energy_ratios(
+        self,
+        test_turbines,
+        wd_step=3.0,
+        ws_step=5.0,
+        wd_bin_width=None,
+        wd_bins=None,
+        ws_bins=None,
+        N=1,
+        percentiles=[5.0, 95.0],
+        num_blocks=-1,
+        method="poisson",
+        seed=None,
+        verbose=True,
+    ):
+        """Calculate the energy ratios of all dataframes. The results are
+        written to the entries of 'df_list', as 'er_results' and 'df_freq',
+        like flasc's energy_ratio_suite.
+
+        Args:
+            test_turbines (list): Test turbines, of which the average power
+              is the test power.
+            wd_step (float, optional): Wind direction step between the bins.
+              Defaults to 3.0.
+            ws_step (float, optional): Wind speed bin width. Defaults to 5.0.
+            wd_bin_width (float, optional): Wind direction bin width.
+              Defaults to None, meaning equal to 'wd_step'.
+            wd_bins (array, optional): Bounds of each wind direction bin,
+              overriding 'wd_step' and 'wd_bin_width'. Defaults to None.
+            ws_bins (array, optional): Bounds of each wind speed bin,
+              overriding 'ws_step'. Defaults to None.
+            N (int, optional): Number of bootstrap evaluations. Defaults to 1.
+            percentiles (list, optional): Confidence bounds in percents.
+              Defaults to [5.0, 95.0].
+            num_blocks (int, optional): Number of blocks for block
+              bootstrapping. Defaults to -1, meaning no block bootstrapping.
+            method (str, optional): Distribution of the resample weights,
+              'poisson' or 'multinomial'. Defaults to 'poisson'.
+            seed (int, optional): Seed of the random number generator.
+              Defaults to None.
+            verbose (bool, optional): Print progress. Defaults to True.
+
+        Returns:
+            list: The 'df_list' with the results of every dataframe.
+        """
+        if len(self.df_list) < 1:
+            raise UserWarning("Please add a dataframe with add_df(...) first.")
+        test_cols = ["pow_{:03d}".format(int(ti)) for ti in np.atleast_1d(test_turbines)]
+        wd_labels, wd_bins = get_wd_bins(wd_step, wd_bin_width, wd_bins)
+        ws_labels, ws_bins = get_ws_bins(ws_step, ws_bins)
+        n_wd_bins = len(wd_bins)
+        n_ws_bins = len(ws_bins)
+
+        groups = self._get_groups()
+        if verbose and (len(groups) > 1):
+            print("Dataframes differ in wd and ws. Calculating {:d} groups without rebalancing.".format(len(groups)))
+        for group in groups:
+            if verbose:
+                print("Calculating energy ratios for: {}".format([self.df_list[ii]["name"] for ii in group["df_ids"]]))
+
+            # Test and reference powers of every dataframe as separate tests
+            pow_test = []
+            pow_ref = []
+            for ii, mask in zip(group["df_ids"], group["masks"]):
+                df = self.df_list[ii]["df"]
+                with wn.catch_warnings():
+                    wn.simplefilter("ignore", category=RuntimeWarning)  # All-NaN rows
+                    pow_test.append(np.nanmean(df[test_cols].to_numpy(dtype=float)[mask], axis=1))
+                pow_ref.append(df["pow_ref"].to_numpy(dtype=float)[mask])
+
+            bin_assignment = get_bin_assignment(group["inflow"]["wd"], group["inflow"]["ws"], wd_bins, ws_bins)
+            bin_count, energy_ratios = _bootstrap_binned_energy_ratios(
+                bin_assignment,
+                np.vstack(pow_test).T,
+                np.vstack(pow_ref).T,
+                n_wd_bins=n_wd_bins,
+                n_ws_bins=n_ws_bins,
+                N=N,
+                percentiles=percentiles,
+                num_blocks=num_blocks,
+                method=method,
+                seed=seed,
+            )
+
+            # Frequency of each (wd, ws) bin with data, for the bar plots
+            _, wd_bin_ids, ws_bin_ids = bin_assignment
+            is_binned = (ws_bin_ids >= 0)
+            freq = np.bincount(
+                wd_bin_ids[is_binned] * n_ws_bins + ws_bin_ids[is_binned], minlength=n_wd_bins * n_ws_bins
+            )
+            wd_ids, ws_ids = np.divmod(np.flatnonzero(freq), n_ws_bins)
+            df_freq = pd.DataFrame({
+                "ws_bin": ws_labels[ws_ids],
+                "wd_bin": wd_labels[wd_ids],
+                "freq": freq[freq > 0],
+                "ws_bin_edges": [pd.Interval(*ws_bins[jj], closed="left") for jj in ws_ids],
+                "wd_bin_edges": [pd.Interval(*wd_bins[jj], closed="left") for jj in wd_ids],
+            })
+
+            is_used = (bin_count > 0)
+            for jj, ii in enumerate(group["df_ids"]):
+                self.df_list[ii]["er_results"] = pd.DataFrame({
+                    "baseline": energy_ratios[jj, is_used, 0],
+                    "baseline_lb": energy_ratios[jj, is_used, 1],
+                    "baseline_ub": energy_ratios[jj, is_used, 2],
+                    "wd_bin": wd_labels[is_used],
+                    "bin_count": bin_count[is_used].astype(int),
+                })
+                self.df_list[ii]["df_freq"] = df_freq
+                self.df_list[ii]["er_test_turbines"] = test_turbines
+        return self.df_list
+
+    def plot_energy_ratios(self, hide_uq_labels=True, polar_plot=False, axarr=None, show_barplot_legend=True):
+        """Plot the energy ratios of all dataframes in one figure, with flasc's
+        energy_ratio_visualization.plot(...).
+
+        Args:
+            hide_uq_labels (bool, optional): Hide the legend entries of the
+              uncertainty bounds. Defaults to True.
+            polar_plot (bool, optional): Plot in polar coordinates. Defaults
+              to False.
+            axarr (list, optional): Axes to plot on. Defaults to None.
+            show_barplot_legend (bool, optional): Show the legend of the bin
+              frequencies. Defaults to True.
+
+        Returns:
+            list: Axes of the figure.
+        """
+        if any("er_results" not in d for d in self.df_list):
+            raise UserWarning("Please run get_energy_ratios(...) first.")
+        return vis.plot(
+            energy_ratios=[d["er_results"] for d in self.df_list],
+            df_freqs=[d["df_freq"] for d in self.df_list],
+            labels=[d["name"] for d in self.df_list],
+            colors=[d["color"] for d in self.df_list],
+            hide_uq_labels=hide_uq_labels,
+            polar_plot=polar_plot,
+            axarr=axarr,
+            show_barplot_legend=show_barplot_legend,
+        )
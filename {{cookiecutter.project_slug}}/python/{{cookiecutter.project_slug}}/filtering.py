@@ -0,0 +1,451 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import io
+from multiprocessing import shared_memory
+import re
+
+import numpy as np
+import pandas as pd
+
+from flasc.turbine_analysis import ws_pow_filtering as wspf
+
+
+# Functions available in the filter rule expressions, next to the turbine variables
+_EXPRESSION_NAMESPACE = {
+    "__builtins__": {},
+    "np": np,
+    "isnan": np.isnan,
+    "abs": np.abs,
+}
+
+
+def get_turbine_blocks(df):
+    """Collect the turbine-specific columns of a dataframe, e.g., 'ws_000',
+    'ws_001', ..., into one (time x turbines) array per variable.
+
+    Args:
+        df (pd.DataFrame): Dataframe in the common FLASC format.
+
+    Returns:
+        blocks (dict): Dictionary with a float array of shape (n_time,
+          n_turbines) for each variable, e.g., 'ws', 'pow' and
+          'is_operation_normal'. Boolean columns are cast to 0.0/1.0, such
+          that faulty measurements can be marked as NaN.
+        columns (dict): Dictionary with the column names of each block.
+    """
+    columns = {}
+    for c in df.columns:
+        m = re.match(r"^(.*)_(\d{3})$", c)
+        if m is not None:
+            columns.setdefault(m.group(1), []).append((int(m.group(2)), c))
+
+    blocks = {}
+    for var in list(columns.keys()):
+        cols = [c for _, c in sorted(columns[var])]
+        columns[var] = cols
+        blocks[var] = df[cols].to_numpy(dtype=float)
+    return blocks, columns
+
+
+def evaluate_filter_rules(df, rules, verbose=True):
+    """Apply a list of declarative filter rules to the measurements of all
+    turbines at once. Each rule consists of a 'label' and a 'condition',
+    being an expression over the turbine variables, e.g.,
+
+        {"label": "Power below 1 kW while wind speed above 4 m/s",
+         "condition": "(ws > 4.0) & (pow < 1.0)"}
+
+    in which 'ws' and 'pow' are (time x turbines) arrays with the columns
+    'ws_###' and 'pow_###', see get_turbine_blocks(...). The condition may
+    also be a function that takes the dictionary of arrays and returns a
+    boolean array. Optionally, 'turbines' limits a rule to a list of turbines.
+
+    The rules are applied one after another. Like in
+    flasc's ws_pw_curve_filtering.filter_by_condition(...), all measurements
+    of a turbine that meet a condition are marked as NaN, and later rules are
+    evaluated on the already filtered data. The outcome therefore equals
+    calling filter_by_condition(...) for every rule and every turbine, but
+    costs a single array operation per rule.
+
+    Args:
+        df (pd.DataFrame): Dataframe in the common FLASC format.
+        rules (list): List of dictionaries with the filter rules.
+        verbose (bool, optional): Print the fraction of faulty measurements
+          per turbine after each rule. Defaults to True.
+
+    Returns:
+        blocks (dict): Filtered arrays, see get_turbine_blocks(...).
+        columns (dict): Column names of each array.
+        flags (np.array): Array of shape (n_time, n_turbines) with the label of
+          the last rule that flagged each measurement, or 'clean'.
+        df_counts (pd.DataFrame): Number of faulty measurements per turbine
+          after each rule, based on NaNs in the power, like
+          flasc.dataframe_operations.dataframe_filtering.df_get_no_faulty_measurements(...).
+    """
+    blocks, columns = get_turbine_blocks(df)
+    n_time, n_turbines = blocks["pow"].shape
+    flags = np.full((n_time, n_turbines), "clean", dtype=object)
+
+    counts = []
+    for rule in rules:
+        condition = rule["condition"]
+        with np.errstate(invalid="ignore"):
+            if callable(condition):
+                cond = np.asarray(condition(blocks), dtype=bool)
+            else:
+                cond = np.asarray(eval(condition, _EXPRESSION_NAMESPACE, dict(blocks)), dtype=bool)
+        cond = np.broadcast_to(cond, (n_time, n_turbines)).copy()
+        if rule.get("turbines") is not None:
+            cond[:, np.setdiff1d(np.arange(n_turbines), rule["turbines"])] = False
+
+        # Mark all measurements of the flagged turbines as faulty
+        for var in blocks.keys():
+            blocks[var][cond] = np.nan
+        flags[cond] = rule["label"]
+        counts.append(np.sum(np.isnan(blocks["pow"]), axis=0))
+
+    df_counts = pd.DataFrame(
+        np.array(counts, dtype=int).reshape(len(rules), n_turbines),
+        index=[rule["label"] for rule in rules],
+        columns=["WTG_{:03d}".format(ti) for ti in range(n_turbines)],
+    )
+    if verbose:
+        print("Faulty measurements (%) per turbine after each filter rule:")
+        print((100.0 * df_counts / n_time).round(3).to_string())
+
+    return blocks, columns, flags, df_counts
+
+
+def apply_filter_rules(ws_pow_filtering, rules, verbose=True):
+    """Apply a list of declarative filter rules, see evaluate_filter_rules(...),
+    to a flasc ws_pw_curve_filtering object. The filtered data, the filter
+    labels used in its plotting functions and its mean power curves are
+    updated, as if filter_by_condition(...) was called for every rule and
+    every turbine. The filtered 'is_operation_normal_###' flags are stored
+    as floats, with NaN for faulty measurements.
+
+    Args:
+        ws_pow_filtering (ws_pw_curve_filtering): flasc filtering object.
+        rules (list): List of dictionaries with the filter rules.
+        verbose (bool, optional): Print the fraction of faulty measurements
+          per turbine after each rule. Defaults to True.
+
+    Returns:
+        df_counts (pd.DataFrame): Number of faulty measurements per turbine
+          after each rule.
+    """
+    df = ws_pow_filtering.df
+    blocks, columns, flags, df_counts = evaluate_filter_rules(df, rules, verbose=verbose)
+
+    # Write the filtered data and labels back to the filtering object
+    for var, cols in columns.items():
+        df[cols] = blocks[var]
+    is_flagged = flags != "clean"
+    df_filters = ws_pow_filtering.df_filters
+    ws_pow_filtering.df_filters = pd.DataFrame(
+        np.where(is_flagged, flags, df_filters.to_numpy()), index=df_filters.index, columns=df_filters.columns
+    )
+
+    # Clear the mean power curves of the turbines with newly flagged data
+    for ti in np.where(np.any(is_flagged, axis=0))[0]:
+        ws_pow_filtering.pw_curve_df["pow_{:03d}".format(ti)] = None
+
+    return df_counts
+
+
+class SensorStuckDetector:
+    """Detect sensor-stuck faults in many columns at once, in a single pass
+    over the data. Like flasc's find_sensor_stuck_faults(...), NaNs are
+    skipped and every window of 'n_consecutive_measurements' consecutive
+    valid measurements with a standard deviation below 'stddev_threshold'
+    marks all measurements in that window as faulty. The cost is linear in
+    the number of rows and no per-turbine loop is needed.
+
+    The data can be fed in chunks through update(...). The last valid
+    measurements of each column are carried over to the next chunk, so that
+    windows spanning a chunk boundary are detected too. Since such windows
+    may still flag the last measurements of a chunk, the flags of a row are
+    only returned once no later window can contain it. Call flush() after
+    the last chunk to obtain the flags of the remaining rows.
+
+    Args:
+        n_columns (int): Number of columns, e.g., the wind direction and
+          wind speed of all turbines.
+        n_consecutive_measurements (int, optional): Window length. Defaults to 3.
+        stddev_threshold (float, optional): Standard deviation below which a
+          window is considered stuck. Defaults to 0.001.
+    """
+    def __init__(self, n_columns, n_consecutive_measurements=3, stddev_threshold=0.001):
+        self.n_columns = n_columns
+        self.n_consecutive_measurements = int(n_consecutive_measurements)
+        self.stddev_threshold = stddev_threshold
+        self.reset()
+
+    def reset(self):
+        # Last (n_consecutive_measurements - 1) valid values of each column
+        # and their positions in the buffer of pending rows (-1 if none)
+        nc = self.n_consecutive_measurements - 1
+        self._carry_values = np.full((nc, self.n_columns), np.nan)
+        self._carry_positions = np.full((nc, self.n_columns), -1, dtype=int)
+        self._pending_flags = np.zeros((0, self.n_columns), dtype=bool)
+
+    def update(self, values):
+        """Process the next chunk of data.
+
+        Args:
+            values (np.array): Array of shape (n_rows, n_columns).
+
+        Returns:
+            flags (np.array): Boolean array of shape (n_final, n_columns)
+              with the sensor-stuck faults of the next 'n_final' rows of the
+              data stream whose flags are final. Rows are returned in order.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        n_rows = values.shape[0]
+        nw = self.n_consecutive_measurements
+        n_pending = self._pending_flags.shape[0]
+        flags = np.vstack([self._pending_flags, np.zeros((n_rows, self.n_columns), dtype=bool)])
+
+        # Move the valid measurements of each column to the front, keeping
+        # their order, after the valid measurements of the previous chunk.
+        # Columns are stored along the first axis, such that each column is
+        # contiguous in memory.
+        y = np.hstack([self._carry_values.T, values.T])
+        pos = np.hstack([
+            self._carry_positions.T,
+            np.broadcast_to(n_pending + np.arange(n_rows), (self.n_columns, n_rows)),
+        ])
+        is_nan = np.isnan(y)
+        n_valid = y.shape[1] - np.sum(is_nan, axis=1)
+        for ci in np.where(n_valid < y.shape[1])[0]:
+            order = np.argsort(is_nan[ci], kind="stable")
+            y[ci] = y[ci, order]
+            pos[ci] = pos[ci, order]
+
+        # A window can only be stuck if all steps between its consecutive
+        # measurements are small: for a standard deviation below the
+        # threshold, no measurement deviates more than stddev_threshold *
+        # sqrt(nw - 1) from the window mean. The exact standard deviation is
+        # then only calculated for windows inside runs of small steps.
+        n_windows = y.shape[1] - nw + 1
+        if n_windows > 0:
+            max_step = 2.0 * self.stddev_threshold * np.sqrt(nw - 1) * (1.0 + 1.0e-9)
+            with np.errstate(invalid="ignore"):
+                is_small_step = (np.abs(np.diff(y, axis=1)) <= max_step)
+            is_candidate = (np.arange(n_windows)[None, :] + nw <= n_valid[:, None])
+            for j in range(nw - 1):
+                is_candidate &= is_small_step[:, j:j + n_windows]
+            ids_col, ids_win = np.nonzero(is_candidate)
+            ids_row = ids_win[:, None] + np.arange(nw)[None, :]
+            is_stuck = (np.std(y[ids_col[:, None], ids_row], axis=1) < self.stddev_threshold)
+
+            # Mark all measurements inside stuck windows as faulty
+            ids_col = np.repeat(ids_col[is_stuck], nw)
+            flags[pos[ids_col, ids_row[is_stuck].flatten()], ids_col] = True
+
+        # Carry over the last valid measurements of each column
+        ids_carry = n_valid[:, None] - (nw - 1) + np.arange(nw - 1)[None, :]
+        has_carry = (ids_carry >= 0)
+        ids_carry = np.clip(ids_carry, 0, None)
+        self._carry_values = np.where(has_carry, np.take_along_axis(y, ids_carry, axis=1), np.nan).T
+        self._carry_positions = np.where(has_carry, np.take_along_axis(pos, ids_carry, axis=1), -1).T
+        has_carry = has_carry.T
+
+        # Rows before the first carried measurement can no longer change
+        if np.any(has_carry):
+            n_final = np.min(self._carry_positions[has_carry])
+        else:
+            n_final = flags.shape[0]
+        self._carry_positions[has_carry] -= n_final
+        self._pending_flags = flags[n_final:]
+        return flags[:n_final]
+
+    def flush(self):
+        """Return the flags of all remaining rows and reset the detector.
+
+        Returns:
+            flags (np.array): Boolean array of shape (n_remaining, n_columns).
+        """
+        flags = self._pending_flags
+        self.reset()
+        return flags
+
+
+def find_sensor_stuck_faults(
+    df, columns, n_consecutive_measurements=3, stddev_threshold=0.001, chunksize=None
+):
+    """Find sensor-stuck faults in a set of columns of a dataframe, see
+    SensorStuckDetector.
+
+    Args:
+        df (pd.DataFrame): Dataframe with the measurements.
+        columns (list): Columns to evaluate, e.g., ['wd_000', 'ws_000', ...].
+        n_consecutive_measurements (int, optional): Window length. Defaults to 3.
+        stddev_threshold (float, optional): Standard deviation below which a
+          window is considered stuck. Defaults to 0.001.
+        chunksize (int, optional): Number of rows processed at once, to limit
+          the memory use on long datasets. Defaults to None, meaning all rows.
+
+    Returns:
+        df_flags (pd.DataFrame): Boolean dataframe with the same index as 'df'
+          and the 'columns', which is True for sensor-stuck measurements.
+    """
+    detector = SensorStuckDetector(len(columns), n_consecutive_measurements, stddev_threshold)
+    if chunksize is None:
+        chunksize = max(df.shape[0], 1)
+    flags = []
+    for ii in range(0, df.shape[0], chunksize):
+        flags.append(detector.update(df[columns].iloc[ii:ii + chunksize].to_numpy(dtype=np.float64)))
+    flags.append(detector.flush())
+    return pd.DataFrame(np.vstack(flags), index=df.index, columns=columns)
+
+
+def get_sensor_stuck_rule(variables=["wd", "ws"], n_consecutive_measurements=3, stddev_threshold=0.001):
+    """Get a filter rule, see evaluate_filter_rules(...), that marks the
+    measurements of a turbine as faulty when any of its 'variables' is
+    stuck, see SensorStuckDetector. Note that flasc's
+    filter_by_sensor_stuck_faults(...) only uses the faults found in the
+    last of its columns, whereas this rule combines all variables.
+
+    Args:
+        variables (list, optional): Turbine variables to evaluate. Defaults
+          to ['wd', 'ws'].
+        n_consecutive_measurements (int, optional): Window length. Defaults to 3.
+        stddev_threshold (float, optional): Standard deviation below which a
+          window is considered stuck. Defaults to 0.001.
+
+    Returns:
+        dict: Filter rule labelled 'Sensor-stuck fault'.
+    """
+    def condition(blocks):
+        values = np.hstack([blocks[var] for var in variables])
+        detector = SensorStuckDetector(values.shape[1], n_consecutive_measurements, stddev_threshold)
+        flags = np.vstack([detector.update(values), detector.flush()])
+        return np.any(flags.reshape(values.shape[0], len(variables), -1), axis=1)
+
+    return {"label": "Sensor-stuck fault", "condition": condition}
+
+
+def _filter_single_turbine(shm_name, shape, ti, sensor_stuck_options, power_curve_options):
+    # Worker function: run the per-turbine filters of flasc on the wind
+    # direction, wind speed and power of a single turbine, read from shared
+    # memory. Returns the filter labels, the mean power curve, the power
+    # curve bounds and the console output of the filters.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        df = pd.DataFrame({
+            "wd_000": block[:, 3 * ti],
+            "ws_000": block[:, 3 * ti + 1],
+            "pow_000": block[:, 3 * ti + 2],
+        })
+    finally:
+        shm.close()
+
+    stdout = io.StringIO()
+    with redirect_stdout(stdout):
+        ws_pow_filtering = wspf.ws_pw_curve_filtering(df=df)
+        if sensor_stuck_options is not None:
+            ws_pow_filtering.filter_by_sensor_stuck_faults(
+                columns=["wd_000", "ws_000"], ti=0, plot=False, **sensor_stuck_options
+            )
+        if power_curve_options is not None:
+            ws_pow_filtering.filter_by_power_curve(ti=0, **power_curve_options)
+
+    bounds = None
+    if power_curve_options is not None:
+        bounds = ws_pow_filtering.pw_curve_df_bounds.copy()
+    return (
+        ws_pow_filtering.df_filters["WTG_000"].to_numpy(),
+        ws_pow_filtering.pw_curve_df["pow_000"].to_numpy(),
+        bounds,
+        stdout.getvalue().replace("WTG 000", "WTG {:03d}".format(ti)),
+    )
+
+
+def filter_turbines_parallel(
+    ws_pow_filtering,
+    sensor_stuck_options=None,
+    power_curve_options=None,
+    turbine_list=None,
+    max_workers=8,
+    verbose=True,
+):
+    """Apply flasc's per-turbine sensor-stuck and/or mean power curve filters
+    to all turbines in parallel. At this stage, the turbines are filtered
+    independently from one another, so each turbine is processed by a
+    separate worker process. The wind directions, wind speeds and powers of
+    all turbines are shared with the workers read-only through shared memory
+    rather than by pickling the dataframe. The resulting filter labels are
+    merged back into 'ws_pow_filtering' in the order of 'turbine_list', so
+    that the outcome equals calling filter_by_sensor_stuck_faults(...) and
+    filter_by_power_curve(...) for each turbine one after another.
+
+    Args:
+        ws_pow_filtering (ws_pw_curve_filtering): flasc filtering object.
+        sensor_stuck_options (dict, optional): Keyword arguments for
+          filter_by_sensor_stuck_faults(...), e.g., {"n_consecutive_measurements": 3,
+          "stddev_threshold": 0.001}. The filter is applied to the wind
+          direction and wind speed of each turbine. Defaults to None, meaning
+          the sensor-stuck filter is skipped.
+        power_curve_options (dict, optional): Keyword arguments for
+          filter_by_power_curve(...), e.g., {"ws_deadband": 1.5}. Defaults to
+          None, meaning the power curve filter is skipped.
+        turbine_list (list, optional): Turbines to filter. Defaults to None,
+          meaning all turbines.
+        max_workers (int, optional): Number of worker processes. Defaults to 8.
+        verbose (bool, optional): Print the output of the filters, in the
+          order of 'turbine_list'. Defaults to True.
+
+    Returns:
+        df (pd.DataFrame): The filtered dataframe, ws_pow_filtering.df.
+    """
+    df = ws_pow_filtering.df
+    n_turbines = ws_pow_filtering.n_turbines
+    if turbine_list is None:
+        turbine_list = list(range(n_turbines))
+
+    # Copy the wind directions, wind speeds and powers into shared memory
+    cols = [
+        "{:s}_{:03d}".format(var, ti) for ti in range(n_turbines) for var in ["wd", "ws", "pow"]
+    ]
+    shape = (df.shape[0], len(cols))
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        block[:] = df[cols].to_numpy(dtype=np.float64)
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(
+                executor.map(
+                    _filter_single_turbine,
+                    [shm.name] * len(turbine_list),
+                    [shape] * len(turbine_list),
+                    turbine_list,
+                    [sensor_stuck_options] * len(turbine_list),
+                    [power_curve_options] * len(turbine_list),
+                )
+            )
+        del block
+    finally:
+        shm.close()
+        shm.unlink()
+
+    # Merge the results in a deterministic order
+    for ti, (labels, pw_curve, bounds, output) in zip(turbine_list, results):
+        if verbose:
+            print(output, end="")
+
+        is_flagged = labels != "clean"
+        turbine_cols = [c for c in df.columns if c[-4::] == "_{:03d}".format(ti)]
+        df.loc[is_flagged, turbine_cols] = np.nan
+        ws_pow_filtering.df_filters.loc[is_flagged, "WTG_{:03d}".format(ti)] = labels[is_flagged]
+        ws_pow_filtering.pw_curve_df["pow_{:03d}".format(ti)] = pw_curve
+
+        if bounds is not None:
+            if not hasattr(ws_pow_filtering, "pw_curve_df_bounds"):
+                ws_pow_filtering.pw_curve_df_bounds = pd.DataFrame({"ws": bounds["ws"]})
+            for c in ["lb", "rb"]:
+                ws_pow_filtering.pw_curve_df_bounds["pow_{:03d}_{:s}".format(ti, c)] = bounds["pow_000_{:s}".format(c)]
+
+    return df
@@ -0,0 +1,919 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from time import perf_counter as timerpc
+
+import floris
+from floris.utilities import wrap_360
+from flasc import floris_tools as ftools
+
+from {{cookiecutter.project_slug}} import models
+
+
+class FlorisTableArray:
+    """Dense representation of a table of FLORIS solutions, as an array of
+    size (len(wd_array), len(ws_array), len(ti_array), len(columns)). When
+    loaded from disk using load_table_array(...), the values are memory-mapped
+    read-only, so that opening a table is zero-copy and its pages are shared
+    between all processes reading the same table.
+
+    Args:
+        wd_array (array): Sorted wind directions of the table in [deg].
+        ws_array (array): Sorted wind speeds of the table in [m/s].
+        ti_array (array): Sorted turbulence intensities of the table in [-].
+        values (array): Array of size (len(wd_array), len(ws_array),
+          len(ti_array), len(columns)) with the FLORIS solutions.
+        columns (list): Names of the variables in the last dimension of
+          'values', e.g., ['pow_000', 'pow_001', ...].
+    """
+
+    def __init__(self, wd_array, ws_array, ti_array, values, columns):
+        self.wd_array = np.asarray(wd_array, dtype=float)
+        self.ws_array = np.asarray(ws_array, dtype=float)
+        self.ti_array = np.asarray(ti_array, dtype=float)
+        self.values = values
+        self.columns = list(columns)
+
+    @property
+    def n_turbines(self):
+        return len([c for c in self.columns if c.startswith("pow_")])
+
+    def get_column_ids(self, varname="pow"):
+        """Return the indices of the columns 'varname_000', 'varname_001', ..."""
+        return [
+            self.columns.index("{:s}_{:03d}".format(varname, ti))
+            for ti in range(self.n_turbines)
+        ]
+
+    def to_dataframe(self):
+        """Convert to a long-format table as returned by
+        flasc.floris_tools.calc_floris_approx_table(...)."""
+        wd_mesh, ws_mesh, ti_mesh = np.meshgrid(self.wd_array, self.ws_array, self.ti_array, indexing="ij")
+        df = pd.DataFrame({"wd": wd_mesh.flatten(), "ws": ws_mesh.flatten(), "ti": ti_mesh.flatten()})
+        values = np.asarray(self.values).reshape(-1, len(self.columns))
+        df = pd.concat([df, pd.DataFrame(values, columns=self.columns)], axis=1)
+        df = df.dropna(subset=self.columns, how="all")
+        return df.sort_values(by=["ti", "ws", "wd"]).reset_index(drop=True)
+
+
+def df_approx_to_table_array(df_approx, dtype=np.float32):
+    """Convert a long-format table of FLORIS solutions, as returned by
+    flasc.floris_tools.calc_floris_approx_table(...), into a dense
+    FlorisTableArray. Grid cells missing from the table are set to NaN.
+
+    Args:
+        df_approx (pd.DataFrame): Table of FLORIS solutions.
+        dtype (type, optional): Data type of the dense array. Defaults to
+          np.float32, which halves the memory footprint without any relevant
+          loss in precision.
+
+    Returns:
+        FlorisTableArray: Dense table of FLORIS solutions.
+    """
+    wd_array = np.sort(df_approx["wd"].unique())
+    ws_array = np.sort(df_approx["ws"].unique())
+    ti_array = np.sort(df_approx["ti"].unique())
+    columns = [c for c in df_approx.columns if c not in ["wd", "ws", "ti"]]
+
+    values = np.full((len(wd_array), len(ws_array), len(ti_array), len(columns)), np.nan, dtype=dtype)
+    i_wd = np.searchsorted(wd_array, df_approx["wd"])
+    i_ws = np.searchsorted(ws_array, df_approx["ws"])
+    i_ti = np.searchsorted(ti_array, df_approx["ti"])
+    values[i_wd, i_ws, i_ti, :] = df_approx[columns].to_numpy(dtype=dtype)
+    return FlorisTableArray(wd_array, ws_array, ti_array, values, columns)
+
+
+def save_table_array(table, fn):
+    """Save a FlorisTableArray as a memory-mappable '.npy' file with the
+    dense values, plus a small '.json' header with the grid and column names.
+
+    Args:
+        table (FlorisTableArray): Dense table of FLORIS solutions.
+        fn (str): Path to the table, without extension.
+    """
+    header = {
+        "wd_array": [float(v) for v in table.wd_array],
+        "ws_array": [float(v) for v in table.ws_array],
+        "ti_array": [float(v) for v in table.ti_array],
+        "columns": table.columns,
+        "shape": list(table.values.shape),
+        "dtype": str(table.values.dtype),
+    }
+    with open(fn + ".npy.tmp", "wb") as f:
+        np.save(f, np.ascontiguousarray(table.values))
+    os.replace(fn + ".npy.tmp", fn + ".npy")
+    with open(fn + ".json", "w") as f:
+        json.dump(header, f, indent=2)
+
+
+def load_table_array(fn, mmap_mode="r"):
+    """Open a FlorisTableArray saved using save_table_array(...). By default,
+    the values are memory-mapped read-only and are not copied into memory.
+
+    Args:
+        fn (str): Path to the table, without extension.
+        mmap_mode (str, optional): Memory-map mode passed to np.load(...).
+          Set to None to load the table into memory. Defaults to "r".
+
+    Returns:
+        FlorisTableArray: Dense table of FLORIS solutions.
+    """
+    with open(fn + ".json", "r") as f:
+        header = json.load(f)
+    values = np.load(fn + ".npy", mmap_mode=mmap_mode)
+    return FlorisTableArray(
+        wd_array=header["wd_array"],
+        ws_array=header["ws_array"],
+        ti_array=header["ti_array"],
+        values=values,
+        columns=header["columns"],
+    )
+
+
+def get_default_table_path():
+    """Return the directory in which the precalculated FLORIS tables are
+    stored by default, being 'setup_floris_model/floris_tables'."""
+    root_path = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(root_path, "..", "setup_floris_model", "floris_tables")
+
+
+def _hash_dict(d):
+    return hashlib.sha1(json.dumps(d, sort_keys=True).encode()).hexdigest()
+
+
+def _format_array(x):
+    return [float(v) for v in np.round(np.sort(np.unique(x)), 6)]
+
+
+def get_model_fingerprint(wake_model, wd_std=0.0):
+    """Describe everything that determines the solutions of a FLORIS model
+    as loaded by models.load_floris(...): the contents of the wake model YAML
+    file, the layout, the turbine type and the FLORIS version.
+
+    Args:
+        wake_model (str): The wake model, e.g., 'cc', 'gch', 'jensen' or 'turbopark'.
+        wd_std (float, optional): Uncertainty; standard deviation in the inflow
+          wind direction in degrees. Defaults to 0.0.
+
+    Returns:
+        dict: Dictionary describing the model configuration.
+    """
+    root_path = os.path.dirname(os.path.abspath(models.__file__))
+    fn = os.path.join(root_path, "{:s}.yaml".format(wake_model))
+    fi = models.load_floris(wake_model=wake_model, wd_std=wd_std)
+    return {
+        "wake_model": wake_model,
+        "wd_std": float(wd_std),
+        "yaml_hash": models._get_yaml_hash(fn),
+        "layout_x": [float(x) for x in fi.layout_x],
+        "layout_y": [float(y) for y in fi.layout_y],
+        "turbine_type": [str(t) for t in fi.floris.farm.turbine_type],
+        "floris_version": str(floris.__version__),
+    }
+
+
+def get_table_key(wake_model, wd_array, ws_array, ti_array, wd_std=0.0, options=None):
+    """Calculate the content-addressed key of a table of FLORIS solutions.
+    The key is a hash of the model configuration, see get_model_fingerprint(...),
+    of the wind direction, wind speed and turbulence intensity arrays, and
+    of any options that were used to generate the table.
+
+    Args:
+        wake_model (str): The wake model, e.g., 'cc', 'gch', 'jensen' or 'turbopark'.
+        wd_array (array): Wind directions of the table in [deg].
+        ws_array (array): Wind speeds of the table in [m/s].
+        ti_array (array): Turbulence intensities of the table in [-].
+        wd_std (float, optional): Uncertainty; standard deviation in the inflow
+          wind direction in degrees. Defaults to 0.0.
+        options (dict, optional): Settings with which the table was generated,
+          e.g., the settings of an adaptive grid refinement. Defaults to None.
+
+    Returns:
+        key (str): Hexadecimal hash uniquely identifying the table.
+        config (dict): Dictionary with the model fingerprint and grid arrays
+          from which the key was calculated.
+    """
+    config = get_model_fingerprint(wake_model=wake_model, wd_std=wd_std)
+    config["wd_array"] = _format_array(wd_array)
+    config["ws_array"] = _format_array(ws_array)
+    config["ti_array"] = _format_array(ti_array)
+    if options is not None:
+        config["options"] = options
+    return _hash_dict(config), config
+
+
+def get_chunk_path(wake_model, wd_std=0.0, table_path=None):
+    """Return the directory in which the chunks of the tables of a FLORIS
+    model are stored. The directory name contains a hash of the model
+    configuration, so that chunks calculated with an outdated YAML file,
+    layout, turbine type or FLORIS version are never reused.
+
+    Args:
+        wake_model (str): The wake model, e.g., 'cc', 'gch', 'jensen' or 'turbopark'.
+        wd_std (float, optional): Uncertainty; standard deviation in the inflow
+          wind direction in degrees. Defaults to 0.0.
+        table_path (str, optional): Table directory. Defaults to the output of
+          get_default_table_path().
+
+    Returns:
+        str: Path to the chunk directory.
+    """
+    if table_path is None:
+        table_path = get_default_table_path()
+    fingerprint = get_model_fingerprint(wake_model=wake_model, wd_std=wd_std)
+    return os.path.join(
+        table_path,
+        "chunks_{:s}_{:s}".format(wake_model, _hash_dict(fingerprint)[0:12])
+    )
+
+
+def load_manifest(table_path=None):
+    """Load the manifest index of all tables stored in 'table_path'.
+
+    Args:
+        table_path (str, optional): Table directory. Defaults to the output of
+          get_default_table_path().
+
+    Returns:
+        dict: Dictionary mapping each table key to its filename and configuration.
+    """
+    if table_path is None:
+        table_path = get_default_table_path()
+    fn = os.path.join(table_path, "manifest.json")
+    if not os.path.exists(fn):
+        return {}
+    with open(fn, "r") as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest, table_path):
+    fn = os.path.join(table_path, "manifest.json")
+    with open(fn + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(fn + ".tmp", fn)
+
+
+def save_floris_table(df_approx, wake_model, wd_array, ws_array, ti_array, wd_std=0.0, options=None, table_path=None):
+    """Save a table of FLORIS solutions under its content-addressed key and
+    register it in the manifest of the table directory. The table is saved
+    both as a long-format '.ftr' file and as a memory-mappable dense array,
+    see save_table_array(...).
+
+    Args:
+        df_approx (pd.DataFrame): Table of FLORIS solutions.
+        wake_model (str): The wake model used to calculate the table.
+        wd_array (array): Wind directions of the table in [deg].
+        ws_array (array): Wind speeds of the table in [m/s].
+        ti_array (array): Turbulence intensities of the table in [-].
+        wd_std (float, optional): Uncertainty; standard deviation in the inflow
+          wind direction in degrees. Defaults to 0.0.
+        options (dict, optional): Settings with which the table was generated.
+          Defaults to None.
+        table_path (str, optional): Table directory. Defaults to the output of
+          get_default_table_path().
+
+    Returns:
+        fn (str): Path to the saved table.
+    """
+    if table_path is None:
+        table_path = get_default_table_path()
+    os.makedirs(table_path, exist_ok=True)
+
+    key, config = get_table_key(wake_model, wd_array, ws_array, ti_array, wd_std=wd_std, options=options)
+    fn = "df_fi_approx_{:s}_{:s}.ftr".format(wake_model, key[0:12])
+    df_approx.reset_index(drop=True).to_feather(os.path.join(table_path, fn))
+    save_table_array(df_approx_to_table_array(df_approx), os.path.join(table_path, fn[:-4]))
+
+    manifest = load_manifest(table_path)
+    manifest[key] = {
+        "filename": fn,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": config,
+    }
+    _save_manifest(manifest, table_path)
+    return os.path.join(table_path, fn)
+
+
+def find_floris_table(wake_model, wd_array=None, ws_array=None, ti_array=None, wd_std=0.0, options=None, table_path=None):
+    """Look up a precalculated table of FLORIS solutions by model configuration.
+    If the grid arrays are specified, only a table with exactly that grid
+    matches. If they are not specified, the most recently created table that
+    matches the current model configuration is returned. Tables calculated
+    with a different YAML file, layout, turbine type or FLORIS version never
+    match.
+
+    Args:
+        wake_model (str): The wake model, e.g., 'cc', 'gch', 'jensen' or 'turbopark'.
+        wd_array (array, optional): Wind directions of the table in [deg].
+          Defaults to None.
+        ws_array (array, optional): Wind speeds of the table in [m/s].
+          Defaults to None.
+        ti_array (array, optional): Turbulence intensities of the table in [-].
+          Defaults to None.
+        wd_std (float, optional): Uncertainty; standard deviation in the inflow
+          wind direction in degrees. Defaults to 0.0.
+        options (dict, optional): Settings with which the table was generated.
+          Only used if the grid arrays are specified. Defaults to None.
+        table_path (str, optional): Table directory. Defaults to the output of
+          get_default_table_path().
+
+    Returns:
+        fn (str): Path to the matching table, or None if no table matches.
+    """
+    if table_path is None:
+        table_path = get_default_table_path()
+    manifest = load_manifest(table_path)
+
+    if (wd_array is not None) and (ws_array is not None) and (ti_array is not None):
+        key, _ = get_table_key(wake_model, wd_array, ws_array, ti_array, wd_std=wd_std, options=options)
+        candidates = [manifest[key]] if key in manifest else []
+    else:
+        fingerprint = get_model_fingerprint(wake_model=wake_model, wd_std=wd_std)
+        candidates = [
+            v for v in manifest.values()
+            if all(v["config"][k] == fingerprint[k] for k in fingerprint.keys())
+        ]
+
+    candidates = [c for c in candidates if os.path.exists(os.path.join(table_path, c["filename"]))]
+    if len(candidates) < 1:
+        return None
+
+    entry = sorted(candidates, key=lambda c: c["created"])[-1]
+    return os.path.join(table_path, entry["filename"])
+
+
+def load_floris_table(wake_model, wd_array=None, ws_array=None, ti_array=None, wd_std=0.0, options=None, table_path=None):
+    """Load a precalculated table of FLORIS solutions by model configuration.
+    See find_floris_table(...) for a description of the inputs.
+
+    Returns:
+        df_approx (pd.DataFrame): Table of FLORIS solutions.
+    """
+    fn = find_floris_table(
+        wake_model=wake_model,
+        wd_array=wd_array,
+        ws_array=ws_array,
+        ti_array=ti_array,
+        wd_std=wd_std,
+        options=options,
+        table_path=table_path,
+    )
+    if fn is None:
+        raise UserWarning(
+            "No up-to-date FLORIS table found for the '{:s}' model. ".format(wake_model) +
+            "Please run 'setup_floris_model/precalculate_floris_solutions.py' for the appropriate wake models first."
+        )
+    return pd.read_feather(fn)
+
+
+def load_floris_table_array(wake_model, wd_array=None, ws_array=None, ti_array=None, wd_std=0.0, options=None, table_path=None):
+    """Open a precalculated table of FLORIS solutions by model configuration
+    as a memory-mapped FlorisTableArray. If only the '.ftr' version of the
+    table exists, the dense array is created from it first. See
+    find_floris_table(...) for a description of the inputs.
+
+    Returns:
+        FlorisTableArray: Dense, memory-mapped table of FLORIS solutions.
+    """
+    fn = find_floris_table(
+        wake_model=wake_model,
+        wd_array=wd_array,
+        ws_array=ws_array,
+        ti_array=ti_array,
+        wd_std=wd_std,
+        options=options,
+        table_path=table_path,
+    )
+    if fn is None:
+        raise UserWarning(
+            "No up-to-date FLORIS table found for the '{:s}' model. ".format(wake_model) +
+            "Please run 'setup_floris_model/precalculate_floris_solutions.py' for the appropriate wake models first."
+        )
+
+    fn_array = fn[:-4]  # Remove '.ftr' extension
+    if not (os.path.exists(fn_array + ".npy") and os.path.exists(fn_array + ".json")):
+        save_table_array(df_approx_to_table_array(pd.read_feather(fn)), fn_array)
+    return load_table_array(fn_array)
+
+
+def _get_chunk_filename(chunk_path, wd_array, ws_array, ti):
+    # The hash of the grid distinguishes chunks with the same bounds, e.g.,
+    # the non-uniform grids of calc_floris_approx_table_adaptive(...)
+    grid_hash = _hash_dict({"wd_array": _format_array(wd_array), "ws_array": _format_array(ws_array)})
+    return os.path.join(
+        chunk_path,
+        "chunk_ti{:.4f}_wd{:07.3f}-{:07.3f}_ws{:06.3f}-{:06.3f}_n{:d}x{:d}_{:s}.ftr".format(
+            ti, wd_array[0], wd_array[-1], ws_array[0], ws_array[-1], len(wd_array), len(ws_array), grid_hash[0:8]
+        )
+    )
+
+
+def load_table_chunks(chunk_path):
+    """Load and merge all previously computed chunks of a FLORIS table.
+
+    Args:
+        chunk_path (str): Directory in which the table chunks are stored.
+
+    Returns:
+        df_approx (pd.DataFrame): All solutions found in the chunk directory,
+          without duplicates, sorted by 'ti', 'ws' and 'wd'. Returns None if
+          no chunks were found.
+    """
+    files = sorted(glob.glob(os.path.join(chunk_path, "chunk_*.ftr")))
+    if len(files) < 1:
+        return None
+
+    df_approx = pd.concat([pd.read_feather(f) for f in files], axis=0)
+    df_approx = df_approx.drop_duplicates(subset=["wd", "ws", "ti"], keep="last")
+    df_approx = df_approx.sort_values(by=["ti", "ws", "wd"]).reset_index(drop=True)
+    return df_approx
+
+
+def _get_missing_cells(df_existing, wd_array, ws_array, ti):
+    # Returns a boolean matrix of size (len(wd_array), len(ws_array)) marking
+    # the grid cells that have not yet been calculated for this ti value.
+    is_missing = np.ones((len(wd_array), len(ws_array)), dtype=bool)
+    if df_existing is None:
+        return is_missing
+
+    df_ti = df_existing[np.isclose(df_existing["ti"], ti)]
+    if df_ti.shape[0] < 1:
+        return is_missing
+
+    existing = set(zip(np.round(df_ti["wd"], 6), np.round(df_ti["ws"], 6)))
+    for ii, wd in enumerate(np.round(wd_array, 6)):
+        for jj, ws in enumerate(np.round(ws_array, 6)):
+            is_missing[ii, jj] = (wd, ws) not in existing
+    return is_missing
+
+
+def get_table_chunks(wd_array, ws_array, ti_array, wd_chunk_size=None, df_existing=None):
+    """Split a rectangular wd x ws x ti grid into chunks of work, leaving
+    out the grid cells that are already present in 'df_existing'.
+
+    Each chunk covers a single turbulence intensity and a sector of wind
+    directions. Since FLORIS evaluates rectangular wd x ws grids, a chunk
+    covers all wind directions and wind speeds in its sector for which at
+    least one combination is missing.
+
+    Args:
+        wd_array (array): Wind directions of the table in [deg].
+        ws_array (array): Wind speeds of the table in [m/s].
+        ti_array (array): Turbulence intensities of the table in [-].
+        wd_chunk_size (int, optional): Number of wind directions per chunk.
+          If None, each chunk covers all wind directions, i.e., there is one
+          chunk per turbulence intensity. Defaults to None.
+        df_existing (pd.DataFrame, optional): Previously calculated solutions.
+          Defaults to None.
+
+    Returns:
+        chunks (list): List of dictionaries with keys 'wd_array', 'ws_array'
+          and 'ti', each describing one chunk of work.
+    """
+    wd_array = np.sort(np.unique(wd_array))
+    ws_array = np.sort(np.unique(ws_array))
+    ti_array = np.sort(np.unique(ti_array))
+    if wd_chunk_size is None:
+        wd_chunk_size = len(wd_array)
+
+    chunks = []
+    for ti in ti_array:
+        is_missing = _get_missing_cells(df_existing, wd_array, ws_array, ti)
+        for i0 in range(0, len(wd_array), wd_chunk_size):
+            is_missing_sector = is_missing[i0:i0 + wd_chunk_size, :]
+            if not is_missing_sector.any():
+                continue
+            wd_ids = np.where(is_missing_sector.any(axis=1))[0] + i0
+            ws_ids = np.where(is_missing_sector.any(axis=0))[0]
+            chunks.append({
+                "wd_array": wd_array[wd_ids],
+                "ws_array": ws_array[ws_ids],
+                "ti": float(ti),
+            })
+
+    return chunks
+
+
+def calc_floris_approx_table_chunked(
+    fi,
+    chunk_path,
+    wd_array=np.arange(0.0, 360.01, 3.0),
+    ws_array=np.arange(1.0, 30.01, 1.0),
+    ti_array=[0.03, 0.06, 0.09, 0.12, 0.15],
+    wd_chunk_size=None,
+    verbose=True,
+):
+    """Calculate a table of FLORIS solutions in chunks, writing each chunk
+    to disk as soon as it finishes. When called again, only the grid cells
+    that are not yet present in 'chunk_path' are calculated. This allows
+    resuming a crashed or killed run, and extending the grid, e.g., with an
+    additional turbulence intensity, at the cost of only the new cells.
+
+    Args:
+        fi (FlorisInterface): FlorisInterface or ParallelComputingInterface
+          object used to calculate the solutions.
+        chunk_path (str): Directory to which the table chunks are written.
+          This directory should be unique for every FLORIS model.
+        wd_array (array, optional): Wind directions to evaluate in [deg].
+          Defaults to np.arange(0.0, 360.01, 3.0).
+        ws_array (array, optional): Wind speeds to evaluate in [m/s].
+          Defaults to np.arange(1.0, 30.01, 1.0).
+        ti_array (array, optional): Turbulence intensities to evaluate in [-].
+          Defaults to [0.03, 0.06, 0.09, 0.12, 0.15].
+        wd_chunk_size (int, optional): Number of wind directions per chunk.
+          If None, there is one chunk per turbulence intensity. Defaults to None.
+        verbose (bool, optional): Print progress to the console. Defaults to True.
+
+    Returns:
+        df_approx (pd.DataFrame): Table of FLORIS solutions covering exactly
+          the requested grid, in the same format as the output of
+          flasc.floris_tools.calc_floris_approx_table(...).
+    """
+    os.makedirs(chunk_path, exist_ok=True)
+    df_existing = load_table_chunks(chunk_path)
+    chunks = get_table_chunks(
+        wd_array=wd_array,
+        ws_array=ws_array,
+        ti_array=ti_array,
+        wd_chunk_size=wd_chunk_size,
+        df_existing=df_existing,
+    )
+
+    if verbose:
+        print("Found {:d} chunks of FLORIS solutions left to calculate.".format(len(chunks)))
+
+    for ii, chunk in enumerate(chunks):
+        start_time = timerpc()
+        df_chunk = ftools.calc_floris_approx_table(
+            fi=fi,
+            wd_array=chunk["wd_array"],
+            ws_array=chunk["ws_array"],
+            ti_array=[chunk["ti"]],
+        )
+
+        # Write to a temporary file first so that a killed run never leaves
+        # a partially written chunk behind
+        fn = _get_chunk_filename(chunk_path, chunk["wd_array"], chunk["ws_array"], chunk["ti"])
+        df_chunk.to_feather(fn + ".tmp")
+        os.replace(fn + ".tmp", fn)
+        if verbose:
+            print(
+                "Finished chunk {:d}/{:d} (ti={:.3f}, {:d} cases) in {:.2f} s.".format(
+                    ii + 1, len(chunks), chunk["ti"], df_chunk.shape[0], timerpc() - start_time
+                )
+            )
+
+    # Merge all chunks and limit to the requested grid
+    return _limit_table_to_grid(load_table_chunks(chunk_path), wd_array, ws_array, ti_array)
+
+
+def _limit_table_to_grid(df_approx, wd_array, ws_array, ti_array):
+    ids = (
+        np.isin(np.round(df_approx["wd"], 6), np.round(wd_array, 6)) &
+        np.isin(np.round(df_approx["ws"], 6), np.round(ws_array, 6)) &
+        np.isin(np.round(df_approx["ti"], 6), np.round(ti_array, 6))
+    )
+    return df_approx[ids].reset_index(drop=True)
+
+
+# Rough computational cost of each wake model relative to the Jensen model,
+# used to schedule the most expensive chunks first
+WAKE_MODEL_COSTS = {"jensen": 1.0, "turbopark": 4.0, "gch": 3.0, "cc": 6.0}
+
+
+def _calc_table_chunk(wake_model, wd_array, ws_array, ti, chunk_path):
+    # Worker function: calculate a single chunk and write it to disk. The
+    # FLORIS model is served from the process-level cache in models.py after
+    # the first chunk a worker calculates for this wake model.
+    start_time = timerpc()
+    df_chunk = ftools.calc_floris_approx_table(
+        fi=models.load_floris(wake_model=wake_model),
+        wd_array=wd_array,
+        ws_array=ws_array,
+        ti_array=[ti],
+    )
+    fn = _get_chunk_filename(chunk_path, wd_array, ws_array, ti)
+    df_chunk.to_feather(fn + ".tmp")
+    os.replace(fn + ".tmp", fn)
+    return wake_model, timerpc() - start_time
+
+
+def calc_floris_approx_tables_parallel(
+    wake_models,
+    wd_array=np.arange(0.0, 360.01, 3.0),
+    ws_array=np.arange(1.0, 30.01, 1.0),
+    ti_array=[0.03, 0.06, 0.09, 0.12, 0.15],
+    max_workers=16,
+    wd_chunk_size=12,
+    table_path=None,
+):
+    """Calculate the tables of FLORIS solutions for multiple wake models
+    using a single, persistent pool of worker processes. The grids of all
+    wake models are split into chunks, see get_table_chunks(...), which are
+    all submitted to the same pool with the most expensive chunks first.
+    Cheap chunks (e.g., of the Jensen model) thereby fill the workers that
+    would otherwise idle at the end of the expensive chunks (e.g., of the
+    cumulative curl model). Like calc_floris_approx_table_chunked(...), each
+    chunk is written to disk as soon as it finishes and only missing chunks
+    are calculated. The finished tables are saved using save_floris_table(...).
+
+    Args:
+        wake_models (list): Wake models to calculate the tables for, e.g.,
+          ['jensen', 'turbopark', 'gch', 'cc'].
+        wd_array (array, optional): Wind directions to evaluate in [deg].
+          Defaults to np.arange(0.0, 360.01, 3.0).
+        ws_array (array, optional): Wind speeds to evaluate in [m/s].
+          Defaults to np.arange(1.0, 30.01, 1.0).
+        ti_array (array, optional): Turbulence intensities to evaluate in [-].
+          Defaults to [0.03, 0.06, 0.09, 0.12, 0.15].
+        max_workers (int, optional): Number of worker processes. Defaults to 16.
+        wd_chunk_size (int, optional): Number of wind directions per chunk.
+          Smaller chunks balance the load better. Defaults to 12.
+        table_path (str, optional): Table directory. Defaults to the output of
+          get_default_table_path().
+
+    Returns:
+        dict: Dictionary with the path to the saved table for each wake model.
+    """
+    # Collect the work of all wake models
+    work_items = []
+    for wake_model in wake_models:
+        chunk_path = get_chunk_path(wake_model, table_path=table_path)
+        os.makedirs(chunk_path, exist_ok=True)
+        chunks = get_table_chunks(
+            wd_array=wd_array,
+            ws_array=ws_array,
+            ti_array=ti_array,
+            wd_chunk_size=wd_chunk_size,
+            df_existing=load_table_chunks(chunk_path),
+        )
+        for chunk in chunks:
+            cost = len(chunk["wd_array"]) * len(chunk["ws_array"]) * WAKE_MODEL_COSTS.get(wake_model, 1.0)
+            work_items.append((cost, wake_model, chunk, chunk_path))
+    work_items = sorted(work_items, key=lambda w: w[0], reverse=True)
+
+    total_cost = np.sum([w[0] for w in work_items])
+    print(
+        "Calculating {:d} chunks of FLORIS solutions for the wake models {} using {:d} workers.".format(
+            len(work_items), wake_models, max_workers
+        )
+    )
+
+    # Distribute all chunks over a single pool of workers
+    start_time = timerpc()
+    if len(work_items) > 0:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    _calc_table_chunk, wake_model, chunk["wd_array"], chunk["ws_array"], chunk["ti"], chunk_path
+                ): cost
+                for cost, wake_model, chunk, chunk_path in work_items
+            }
+            cost_done = 0.0
+            for ii, future in enumerate(as_completed(futures)):
+                wake_model, _ = future.result()
+                cost_done += futures[future]
+                elapsed = timerpc() - start_time
+                eta = elapsed * (total_cost - cost_done) / cost_done
+                print(
+                    "  Finished chunk {:d}/{:d} ('{:s}'). Elapsed: {:.1f} s, estimated time remaining: {:.1f} s.".format(
+                        ii + 1, len(work_items), wake_model, elapsed, eta
+                    )
+                )
+
+    # Merge the chunks of each wake model into a table
+    fn_dict = {}
+    for wake_model in wake_models:
+        df_approx = _limit_table_to_grid(
+            load_table_chunks(get_chunk_path(wake_model, table_path=table_path)),
+            wd_array,
+            ws_array,
+            ti_array,
+        )
+        fn_dict[wake_model] = save_floris_table(
+            df_approx, wake_model, wd_array, ws_array, ti_array, table_path=table_path
+        )
+    print("Finished calculating all FLORIS tables in {:.2f} s.".format(timerpc() - start_time))
+
+    return fn_dict
+
+
+def get_turbine_alignment_wds(layout_x, layout_y, max_distance=5000.0):
+    """Determine the wind directions at which any two turbines within a
+    distance of 'max_distance' of each other are perfectly aligned, i.e., at
+    which the wake of one turbine hits the rotor center of the other turbine.
+    Wake losses change most rapidly near these wind directions.
+
+    Args:
+        layout_x (array): The x-coordinates of the turbines in [m].
+        layout_y (array): The y-coordinates of the turbines in [m].
+        max_distance (float, optional): Maximum distance between two turbines
+          in [m] for them to be considered. Defaults to 5000.0.
+
+    Returns:
+        wd_array (np.array): Sorted array of unique alignment wind directions
+          in [deg], rounded to 0.1 deg.
+    """
+    layout_x = np.array(layout_x, dtype=float)
+    layout_y = np.array(layout_y, dtype=float)
+    dx = layout_x[None, :] - layout_x[:, None]
+    dy = layout_y[None, :] - layout_y[:, None]
+    dist = np.sqrt(dx**2.0 + dy**2.0)
+    ids = (dist > 0.0) & (dist <= max_distance)
+    wd_array = wrap_360(270.0 - np.arctan2(dy[ids], dx[ids]) * 180.0 / np.pi)
+    return np.unique(np.round(wd_array, 1) % 360.0)
+
+
+def _calc_turbine_powers(fi, wd_array, ws_array, ti_array, chunk_path=None):
+    # Returns an array of size (len(wd_array), len(ws_array), len(ti_array), nturbs).
+    # With a chunk path, the solutions are read from and written to the table
+    # chunks, such that only missing solutions are calculated.
+    if chunk_path is not None:
+        df_approx = calc_floris_approx_table_chunked(
+            fi=fi,
+            chunk_path=chunk_path,
+            wd_array=wd_array,
+            ws_array=ws_array,
+            ti_array=ti_array,
+            verbose=False,
+        )
+        cols = ["pow_{:03d}".format(ti) for ti in range(len(fi.layout_x))]
+        powers = df_approx[cols].to_numpy().reshape(len(ti_array), len(ws_array), len(wd_array), len(cols))
+        return np.transpose(powers, (2, 1, 0, 3))
+
+    out = []
+    for ti in ti_array:
+        fi.reinitialize(wind_directions=wd_array, wind_speeds=ws_array, turbulence_intensity=ti)
+        fi.calculate_wake()
+        out.append(fi.get_turbine_powers())
+    return np.stack(out, axis=2)
+
+
+def _get_refinement_error(x_lb, x_ub, x_mid, y_lb, y_ub, y_mid, axis):
+    # Maximum error of linear interpolation between the interval bounds
+    # compared to the true solution at the interval midpoint, over all
+    # other dimensions of the solution arrays.
+    w = ((x_mid - x_lb) / (x_ub - x_lb)).reshape([-1 if i == axis else 1 for i in range(y_mid.ndim)])
+    y_interp = (1.0 - w) * y_lb + w * y_ub
+    err = np.abs(y_interp - y_mid)
+    return np.max(np.moveaxis(err, axis, 0).reshape(err.shape[axis], -1), axis=1)
+
+
+def calc_floris_approx_table_adaptive(
+    fi,
+    wd_step_initial=15.0,
+    ws_array_initial=np.arange(1.0, 30.01, 2.0),
+    ti_array=[0.03, 0.06, 0.09, 0.12, 0.15],
+    tolerance=0.005,
+    wd_step_min=0.5,
+    ws_step_min=0.25,
+    seed_alignment_wds=True,
+    max_alignment_distance=5000.0,
+    chunk_path=None,
+    verbose=True,
+):
+    """Calculate a table of FLORIS solutions on a non-uniform grid that is
+    refined adaptively until linear interpolation in the table meets an error
+    tolerance. Starting from a coarse grid, every wind direction interval is
+    bisected and the FLORIS solution at the midpoint is compared with the
+    linear interpolation between the interval bounds. Intervals for which the
+    error exceeds the tolerance are bisected again. The same is then done
+    for the wind speeds, which mainly refines the grid near rated wind speed.
+
+    The resulting table remains a rectangular (though non-uniform) grid in
+    wd, ws and ti, and can directly be used in
+    flasc.floris_tools.interpolate_floris_from_df_approx(...).
+
+    Args:
+        fi (FlorisInterface): FlorisInterface, UncertaintyInterface or
+          ParallelComputingInterface object used to calculate the solutions.
+        wd_step_initial (float, optional): Wind direction step of the initial
+          grid in [deg]. Defaults to 15.0.
+        ws_array_initial (array, optional): Wind speeds of the initial grid in
+          [m/s]. Defaults to np.arange(1.0, 30.01, 2.0).
+        ti_array (array, optional): Turbulence intensities to evaluate in [-].
+          These are not refined. Defaults to [0.03, 0.06, 0.09, 0.12, 0.15].
+        tolerance (float, optional): Maximum allowed interpolation error as a
+          fraction of the largest turbine power in the table. Defaults to 0.005.
+        wd_step_min (float, optional): Smallest wind direction step in [deg]
+          the grid is refined to. Defaults to 0.5.
+        ws_step_min (float, optional): Smallest wind speed step in [m/s] the
+          grid is refined to. Defaults to 0.25.
+        seed_alignment_wds (bool, optional): Add the wind directions at which
+          turbines are aligned, see get_turbine_alignment_wds(...), to the
+          initial grid. This avoids that narrow wake peaks fall between two
+          coarse grid points unnoticed. Defaults to True.
+        max_alignment_distance (float, optional): Maximum distance between two
+          turbines in [m] for their alignment direction to be added to the
+          initial grid. Defaults to 5000.0.
+        chunk_path (str, optional): Directory to which the FLORIS solutions
+          are written as table chunks, see calc_floris_approx_table_chunked(...).
+          A crashed or killed refinement then resumes from the solutions
+          found in this directory. Defaults to None, meaning nothing is
+          written to disk.
+        verbose (bool, optional): Print progress to the console. Defaults to True.
+
+    Returns:
+        df_approx (pd.DataFrame): Table of FLORIS solutions, in the same format
+          as the output of flasc.floris_tools.calc_floris_approx_table(...).
+    """
+    fi = fi.copy()  # Create independent copy that we can manipulate
+    ti_array = np.sort(np.unique(ti_array))
+
+    # Set up initial grid. The solution at 360 deg is a copy of 0 deg, such
+    # that the interval between the last wind direction and 360 deg is
+    # also refined.
+    wd_array = np.arange(0.0, 360.0, wd_step_initial)
+    if seed_alignment_wds:
+        wd_array = np.hstack([
+            wd_array,
+            get_turbine_alignment_wds(fi.layout_x, fi.layout_y, max_alignment_distance)
+        ])
+    wd_array = np.unique(np.round(wd_array, 6))
+    ws_array = np.sort(np.unique(ws_array_initial))
+
+    powers = _calc_turbine_powers(fi, wd_array, ws_array, ti_array, chunk_path)
+    n_evals = powers.shape[0] * powers.shape[1] * powers.shape[2]
+    pow_scale = np.max([np.max(powers), 1.0e-6])
+
+    # Refine along wind direction (axis 0) and then along wind speed (axis 1)
+    for axis, step_min in [(0, wd_step_min), (1, ws_step_min)]:
+        x = wd_array if axis == 0 else ws_array
+        refine = np.ones(len(x) - 1 + (axis == 0), dtype=bool)
+        while refine.any():
+            # Add the periodic copy for the wind direction dimension
+            if axis == 0:
+                x_ext = np.hstack([x, 360.0])
+                y_ext = np.concatenate([powers, powers[0:1]], axis=0)
+            else:
+                x_ext = x
+                y_ext = powers
+
+            # Bisect intervals that need refinement and are wide enough
+            ids = np.where(refine & (np.diff(x_ext) > 2.0 * step_min - 1.0e-6))[0]
+            if len(ids) < 1:
+                break
+            x_mid = 0.5 * (x_ext[ids] + x_ext[ids + 1])
+            if axis == 0:
+                y_mid = _calc_turbine_powers(fi, x_mid, ws_array, ti_array, chunk_path)
+            else:
+                y_mid = _calc_turbine_powers(fi, wd_array, x_mid, ti_array, chunk_path)
+            n_evals += y_mid.shape[0] * y_mid.shape[1] * y_mid.shape[2]
+
+            err = _get_refinement_error(
+                x_lb=x_ext[ids],
+                x_ub=x_ext[ids + 1],
+                x_mid=x_mid,
+                y_lb=np.take(y_ext, ids, axis=axis),
+                y_ub=np.take(y_ext, ids + 1, axis=axis),
+                y_mid=y_mid,
+                axis=axis,
+            )
+            needs_refinement = err > tolerance * pow_scale
+            if verbose:
+                print(
+                    "  Refining {:s}: bisected {:d} intervals, of which {:d} exceed the tolerance.".format(
+                        "wd" if axis == 0 else "ws", len(ids), np.sum(needs_refinement)
+                    )
+                )
+
+            # Merge midpoints into the grid. Both halves of an interval that
+            # exceeded the tolerance are candidates for further refinement.
+            x_new = np.hstack([x, x_mid])
+            sort_ids = np.argsort(x_new)
+            x = x_new[sort_ids]
+            powers = np.take(np.concatenate([powers, y_mid], axis=axis), sort_ids, axis=axis)
+            refine_points = np.zeros(len(x_new), dtype=bool)
+            refine_points[len(x) - len(x_mid):] = needs_refinement
+            refine_points = refine_points[sort_ids]
+            refine = np.zeros(len(x) - 1 + (axis == 0), dtype=bool)
+            mid_ids = np.where(refine_points)[0]
+            refine[mid_ids - 1] = True  # Interval left of the midpoint
+            refine[mid_ids] = True  # Interval right of the midpoint
+
+            if axis == 0:
+                wd_array = x
+            else:
+                ws_array = x
+
+    if verbose:
+        n_uniform = (360.0 / wd_step_min) * ((ws_array[-1] - ws_array[0]) / ws_step_min + 1) * len(ti_array)
+        print(
+            "Adaptive table with {:d} wind directions and {:d} wind speeds, ".format(len(wd_array), len(ws_array)) +
+            "calculated with {:d} FLORIS evaluations ({:d} for a uniform grid at the finest resolution).".format(
+                int(n_evals), int(n_uniform)
+            )
+        )
+
+    # Format as a dataframe in the same format as calc_floris_approx_table(...)
+    wd_mesh, ws_mesh, ti_mesh = np.meshgrid(wd_array, ws_array, ti_array, indexing="ij")
+    solutions_dict = {"wd": wd_mesh.flatten(), "ws": ws_mesh.flatten(), "ti": ti_mesh.flatten()}
+    for turbi in range(powers.shape[3]):
+        solutions_dict["pow_{:03d}".format(turbi)] = powers[:, :, :, turbi].flatten()
+    df_approx = pd.DataFrame(solutions_dict).sort_values(by=["ti", "ws", "wd"])
+    return df_approx.reset_index(drop=True)
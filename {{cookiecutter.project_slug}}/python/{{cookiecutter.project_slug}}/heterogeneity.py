@@ -0,0 +1,187 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import warnings as wn
+
+import numpy as np
+import pandas as pd
+
+from floris.utilities import wrap_360
+
+from flasc.dataframe_operations import dataframe_manipulations as dfm
+
+from {{cookiecutter.project_slug}}.energy_ratios import bootstrap_energy_ratios
+from {{cookiecutter.project_slug}}.upstream import UpstreamTurbineIndex
+
+
+# Data shared with the worker processes, see _init_worker(...)
+_worker_data = {}
+
+
+def _init_worker(shm_name, shape):
+    # Runs once in every worker process. The measurements are read from
+    # shared memory, with the reference wind direction in the first column,
+    # followed by the wind speeds and the powers of all turbines. They are
+    # sorted by wind direction, so that the measurements of any sector are a
+    # contiguous slice, or two slices if the sector wraps around 360 deg.
+    _worker_data.update({"shm_name": shm_name, "shape": shape})
+
+
+def _get_sector_slice(wd_sorted, lb, ub):
+    # Indices of the sorted measurements within [lb, ub), wrapping around
+    # 360 deg like dfm.filter_df_by_wd(...)
+    lb = wrap_360(lb)
+    ub = wrap_360(ub)
+    i_lb, i_ub = np.searchsorted(wd_sorted, [lb, ub], side="left")
+    if ub < lb:
+        return np.r_[i_lb:len(wd_sorted), 0:i_ub]
+    return np.arange(i_lb, max(i_lb, i_ub))
+
+
+def _process_sector(wd, wd_bin_width, turbine_array, ws_range, N, percentiles):
+    # Worker function: calculate the energy ratios of all upstream turbines
+    # for a single wind direction bin and single wind speed bin. Only the
+    # measurements within the sector are gathered, and only the columns of
+    # the upstream turbines. Returns the nominal energy ratios and their
+    # lower and upper bounds, in an array of shape (n_turbines, 3).
+    wd_bins = np.array([[wd - wd_bin_width / 2.0, wd + wd_bin_width / 2.0]])
+    turbine_array = np.asarray(turbine_array, dtype=int)
+    num_turbines = (_worker_data["shape"][1] - 1) // 2
+    shm = shared_memory.SharedMemory(name=_worker_data["shm_name"])
+    try:
+        block = np.ndarray(_worker_data["shape"], dtype=np.float64, buffer=shm.buf)
+        ids = _get_sector_slice(block[:, 0], wd_bins[0, 0], wd_bins[0, 1])
+        wd_sector = block[ids, 0]
+        ws = block[np.ix_(ids, 1 + turbine_array)]
+        pow = block[np.ix_(ids, 1 + num_turbines + turbine_array)]
+        del block
+    finally:
+        shm.close()
+
+    # Only keep measurements where all upstream turbines report a power and
+    # use the average wind speed and power of the upstream turbines as the
+    # reference
+    is_valid = ~np.any(np.isnan(pow), axis=1)
+    with wn.catch_warnings():
+        wn.simplefilter("ignore", category=RuntimeWarning)  # All-NaN rows
+        ws_ref = np.nanmean(ws[is_valid], axis=1)
+    pow = pow[is_valid]
+    pow_ref = np.mean(pow, axis=1)
+
+    _, energy_ratios = bootstrap_energy_ratios(
+        wd=wd_sector[is_valid],
+        ws=ws_ref,
+        pow_test=pow,
+        pow_ref=pow_ref,
+        wd_bins=wd_bins,
+        ws_bins=np.array([ws_range], dtype=float),
+        N=N,
+        percentiles=percentiles,
+    )
+    return energy_ratios[:, 0, :]
+
+
+def estimate_heterogeneity(
+    df,
+    df_upstream,
+    turb_wd_measurement,
+    wd_array=np.arange(0.0, 360.0, 15.0),
+    wd_bin_width=15.0,
+    ws_range=[6.0, 10.0],
+    N=1,
+    percentiles=[5.0, 95.0],
+    max_workers=8,
+    verbose=True,
+):
+    """Estimate the heterogeneity in the inflow over all wind directions.
+    For every wind direction, the energy ratios of all upstream turbines are
+    calculated, with respect to their average power. Turbines that see a
+    higher energy ratio likely also see a higher inflow wind speed.
+
+    The reference wind direction is calculated once for all measurements,
+    after which the measurements are sorted by wind direction. Each sector
+    then only gathers its own measurements, rather than copying and
+    filtering the full dataframe, and the sectors are spread over a pool of
+    worker processes. The measurements are shared with the workers
+    read-only through shared memory rather than by pickling them.
+
+    Args:
+        df (pd.DataFrame): Dataframe with the 'wd_###', 'ws_###' and 'pow_###'
+          columns of all turbines.
+        df_upstream (pd.DataFrame): Upstream turbines for each wind direction
+          range, see flasc's floris_tools.get_upstream_turbs_floris(...).
+        turb_wd_measurement (list): Turbines of which the averaged wind
+          direction is used as the reference wind direction.
+        wd_array (np.array, optional): Wind directions to calculate the
+          energy ratios for. Defaults to np.arange(0.0, 360.0, 15.0).
+        wd_bin_width (float, optional): Width of the wind direction bin
+          around each wind direction. Defaults to 15.0.
+        ws_range (list, optional): Range of the reference wind speed.
+          Defaults to [6.0, 10.0].
+        N (int, optional): Number of bootstrap evaluations for the lower and
+          upper bounds of the energy ratios. If N=1, the bounds equal the
+          energy ratios. Defaults to 1.
+        percentiles (list, optional): Confidence bounds in percents.
+          Defaults to [5.0, 95.0].
+        max_workers (int, optional): Number of worker processes. Defaults to 8.
+        verbose (bool, optional): Print progress. Defaults to True.
+
+    Returns:
+        pd.DataFrame: Dataframe with for every wind direction the columns
+          'wd', 'wd_bin_width', 'upstream_turbines', 'energy_ratios',
+          'energy_ratios_lb', 'energy_ratios_ub' and 'ws_ratios'.
+    """
+    # Reference wind direction and the measurements, sorted by it
+    num_turbines = dfm.get_num_turbines(df)
+    wd_ref = dfm.get_column_mean(df, col_prefix="wd", turbine_list=turb_wd_measurement, circular_mean=True)
+    wd_ref = np.asarray(wd_ref, dtype=float)
+    order = np.argsort(wd_ref, kind="stable")
+    order = order[~np.isnan(wd_ref[order])]
+    cols = (
+        ["ws_{:03d}".format(ti) for ti in range(num_turbines)]
+        + ["pow_{:03d}".format(ti) for ti in range(num_turbines)]
+    )
+
+    upstream_index = UpstreamTurbineIndex(df_upstream, num_turbines)
+    turbine_arrays = [upstream_index.get_upstream_turbines(wd) for wd in wd_array]
+
+    # Copy the sorted measurements into shared memory
+    shape = (len(order), 1 + len(cols))
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        block[:, 0] = wd_ref[order]
+        block[:, 1:] = df[cols].to_numpy(dtype=np.float64)[order]
+
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(shm.name, shape),
+        ) as executor:
+            results = executor.map(
+                _process_sector,
+                wd_array,
+                [wd_bin_width] * len(wd_array),
+                turbine_arrays,
+                [ws_range] * len(wd_array),
+                [N] * len(wd_array),
+                [percentiles] * len(wd_array),
+            )
+            df_list = []
+            for wd, turbine_array, energy_ratios in zip(wd_array, turbine_arrays, results):
+                if verbose:
+                    print("Processed wind direction = {:.1f} deg.".format(wd))
+                df_list.append({
+                    "wd": wd,
+                    "wd_bin_width": wd_bin_width,
+                    "upstream_turbines": turbine_array,
+                    "energy_ratios": energy_ratios[:, 0],
+                    "energy_ratios_lb": energy_ratios[:, 1],
+                    "energy_ratios_ub": energy_ratios[:, 2],
+                    "ws_ratios": energy_ratios[:, 0]**(1/3),
+                })
+        del block
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return pd.DataFrame(df_list)
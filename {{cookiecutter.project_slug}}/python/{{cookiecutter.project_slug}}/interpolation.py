@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+from floris.utilities import wrap_360
+
+
+def _get_axis_weights(x, grid, method="linear"):
+    # Returns the lower and upper grid indices and the weight of the upper
+    # grid point for every entry in x. Values outside the grid are clamped
+    # to the nearest grid point, i.e., extrapolated with a constant value.
+    grid = np.asarray(grid, dtype=float)
+    if len(grid) < 2:
+        zeros = np.zeros(len(x), dtype=np.int64)
+        return zeros, zeros, np.zeros(len(x))
+
+    x = np.clip(x, grid[0], grid[-1])
+    i_ub = np.clip(np.searchsorted(grid, x, side="right"), 1, len(grid) - 1)
+    i_lb = i_ub - 1
+    w = (x - grid[i_lb]) / (grid[i_ub] - grid[i_lb])
+    if method == "nearest":
+        w = np.round(w)
+    return i_lb, i_ub, w
+
+
+def _get_wd_axis_weights(wd, wd_grid, method="linear"):
+    # Same as _get_axis_weights, but treating the wind direction as periodic.
+    # The grid is extended with its first point shifted by 360 deg, unless
+    # the grid already covers the full circle, e.g., from 0 to 360 deg.
+    wd_grid = np.asarray(wd_grid, dtype=float)
+    n = len(wd_grid)
+    if wd_grid[-1] < wd_grid[0] + 360.0 - 1.0e-6:
+        wd_grid_ext = np.hstack([wd_grid, wd_grid[0] + 360.0])
+        index_map = np.hstack([np.arange(n), 0])
+    else:
+        wd_grid_ext = wd_grid
+        index_map = np.arange(n)
+
+    wd = wrap_360(np.asarray(wd, dtype=float))
+    wd = np.where(wd < wd_grid_ext[0], wd + 360.0, wd)
+    i_lb, i_ub, w = _get_axis_weights(wd, wd_grid_ext, method=method)
+    return index_map[i_lb], index_map[i_ub], w
+
+
+class TableInterpolator:
+    """Vectorized interpolation of dense FLORIS tables, see
+    floris_tables.FlorisTableArray, for a fixed set of inflow conditions.
+
+    The grid indices and interpolation weights of the inflow conditions are
+    calculated once per table grid and are then reused for every table with
+    the same grid. Interpolating several wake models for the same SCADA
+    dataframe thereby costs a single index pass plus one gather per model.
+    The wind direction is treated as periodic, so that wind directions
+    between the last grid point and 360 deg are interpolated correctly.
+
+    Args:
+        df (pd.DataFrame): Dataframe with the columns 'wd', 'ws' and 'ti',
+          being the ambient wind direction, wind speed and turbulence
+          intensity for which the FLORIS predictions are to be calculated.
+        method (str, optional): Interpolation method, options are 'linear'
+          and 'nearest'. Defaults to 'linear'.
+    """
+
+    def __init__(self, df, method="linear"):
+        for col in ["wd", "ws", "ti"]:
+            if col not in df.columns:
+                raise ValueError("Your SCADA dataframe is missing a column called '{:s}'.".format(col))
+        if method not in ["linear", "nearest"]:
+            raise ValueError("Interpolation method must be 'linear' or 'nearest'.")
+
+        self.df = df
+        self.method = method
+        self.wd = df["wd"].to_numpy(dtype=float)
+        self.ws = df["ws"].to_numpy(dtype=float)
+        self.ti = df["ti"].to_numpy(dtype=float)
+        self.is_valid = ~(np.isnan(self.wd) | np.isnan(self.ws) | np.isnan(self.ti))
+        self._weights_cache = {}
+
+    def _get_weights(self, table):
+        key = (table.wd_array.tobytes(), table.ws_array.tobytes(), table.ti_array.tobytes())
+        if key not in self._weights_cache:
+            ids = self.is_valid
+            axes = [
+                _get_wd_axis_weights(self.wd[ids], table.wd_array, method=self.method),
+                _get_axis_weights(self.ws[ids], table.ws_array, method=self.method),
+                _get_axis_weights(self.ti[ids], table.ti_array, method=self.method),
+            ]
+
+            # Flat indices and weights of the 8 corners of each grid cell
+            shape = (len(table.wd_array), len(table.ws_array), len(table.ti_array))
+            flat_ids = []
+            weights = []
+            for corner in range(8):
+                idx = []
+                w = np.ones(np.sum(ids))
+                for dim in range(3):
+                    i_lb, i_ub, w_ub = axes[dim]
+                    if (corner >> dim) & 1:
+                        idx.append(i_ub)
+                        w = w * w_ub
+                    else:
+                        idx.append(i_lb)
+                        w = w * (1.0 - w_ub)
+                flat_ids.append(np.ravel_multi_index(idx, shape))
+                weights.append(w)
+            self._weights_cache[key] = (np.array(flat_ids), np.array(weights))
+
+        return self._weights_cache[key]
+
+    def interpolate(self, table, varname="pow", mirror_nans=True):
+        """Interpolate a table of FLORIS solutions to the inflow conditions.
+
+        Args:
+            table (FlorisTableArray): Dense table of FLORIS solutions.
+            varname (str, optional): Variable to interpolate. Defaults to 'pow'.
+            mirror_nans (bool, optional): Copy NaNs in the columns of the raw
+              data, e.g., 'pow_000', to the FLORIS predictions, so that the
+              predictions are a fair comparison to the data. Defaults to True.
+
+        Returns:
+            df_out (pd.DataFrame): Dataframe with the columns 'wd', 'ws', 'ti',
+              optionally 'time', and the interpolated variables for each turbine,
+              in the same format as the output of
+              flasc.floris_tools.interpolate_floris_from_df_approx(...).
+        """
+        flat_ids, weights = self._get_weights(table)
+        col_ids = table.get_column_ids(varname)
+        colnames = [table.columns[c] for c in col_ids]
+
+        # Gather the values at the cell corners and sum the weighted values
+        values = np.asarray(table.values).reshape(-1, len(table.columns))[:, col_ids]
+        out = np.full((len(self.wd), len(col_ids)), np.nan)
+        out_valid = np.zeros((flat_ids.shape[1], len(col_ids)))
+        for corner in range(8):
+            w = weights[corner]
+            ids = w > 0.0
+            out_valid[ids] += w[ids, None] * values[flat_ids[corner, ids], :]
+        out[self.is_valid, :] = out_valid
+
+        if mirror_nans:
+            # Copy NaNs in the raw data to the FLORIS predictions
+            for ii, c in enumerate(colnames):
+                if c in self.df.columns:
+                    out[self.df[c].isna().to_numpy(), ii] = np.nan
+
+        cols_to_copy = ["wd", "ws", "ti"]
+        if "time" in self.df.columns:
+            cols_to_copy.append("time")
+        df_out = self.df[cols_to_copy].reset_index(drop=True)
+        df_out = pd.concat([df_out, pd.DataFrame(out, columns=colnames)], axis=1)
+        return df_out
+
+
+def interpolate_floris_from_table_array(df, table, method="linear", mirror_nans=True):
+    """Interpolate a dense table of FLORIS solutions to the inflow conditions
+    in 'df'. This is a shorthand for TableInterpolator(df, method).interpolate(table).
+    When interpolating multiple tables for the same dataframe, use a single
+    TableInterpolator object instead, which reuses the interpolation weights.
+
+    Args:
+        df (pd.DataFrame): Dataframe with the columns 'wd', 'ws' and 'ti'.
+        table (FlorisTableArray): Dense table of FLORIS solutions.
+        method (str, optional): Interpolation method, options are 'linear'
+          and 'nearest'. Defaults to 'linear'.
+        mirror_nans (bool, optional): Copy NaNs in the raw data to the FLORIS
+          predictions. Defaults to True.
+
+    Returns:
+        df_out (pd.DataFrame): Dataframe with the FLORIS predictions.
+    """
+    return TableInterpolator(df, method=method).interpolate(table, mirror_nans=mirror_nans)
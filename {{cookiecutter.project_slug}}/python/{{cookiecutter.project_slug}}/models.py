@@ -1,4 +1,7 @@
+from collections import OrderedDict
+import copy
 import glob
+import hashlib
 import matplotlib.pyplot as plt
 import numpy as np
 import os
@@ -10,9 +13,52 @@ from floris.tools import FlorisInterface, UncertaintyInterface
 from flasc.visualization import plot_floris_layout
 
 
-def load_floris(wake_model="cc", wd_std=0.0):
+# Turbine locations of the wind farm at hand
+LAYOUT_X = [1630.222, 1176.733, 816.389, 755.938, 0.0, 1142.24, 1553.102]
+LAYOUT_Y = [0.0, 297.357, 123.431, 575.544, 647.779, 772.262, 504.711]
+
+# Process-level cache of loaded FLORIS models. Entries are keyed on the wake
+# model, the wind direction uncertainty, the contents of the wake model YAML
+# file and the layout, and are evicted in least-recently-used order.
+FLORIS_CACHE_MAXSIZE = 8
+_floris_cache = OrderedDict()
+_floris_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "load_time": 0.0}
+
+
+def _get_yaml_hash(fn):
+    with open(fn, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def get_floris_cache_info():
+    """Return the hit/miss counters of the FLORIS model cache.
+
+    Returns:
+        dict: Dictionary with the number of cache 'hits', 'misses' and
+          'evictions', the current cache size 'currsize', the maximum cache
+          size 'maxsize', and the total time in seconds spent on loading
+          FLORIS models from their YAML files, 'load_time'.
+    """
+    info = dict(_floris_cache_stats)
+    info["currsize"] = len(_floris_cache)
+    info["maxsize"] = FLORIS_CACHE_MAXSIZE
+    return info
+
+
+def clear_floris_cache():
+    """Empty the FLORIS model cache and reset its counters."""
+    _floris_cache.clear()
+    _floris_cache_stats.update({"hits": 0, "misses": 0, "evictions": 0, "load_time": 0.0})
+
+
+def load_floris(wake_model="cc", wd_std=0.0, use_cache=True):
     """Load a FlorisInterface object for the wind farm at hand.
 
+    Models are cached at the process level, so that repeated calls do not
+    re-parse the wake model YAML file and reinitialize the layout every time.
+    The cache always hands out an independent copy, which callers are free
+    to manipulate, e.g., using fi.reinitialize(...).
+
     Args:
         wake_model (str, optional): The wake model that FLORIS should use. Common
           options are 'cc', 'gch', 'jensen' and 'turbopark'. Defaults to "cc".
@@ -21,6 +67,8 @@ def load_floris(wake_model="cc", wd_std=0.0):
           is in its first operation mode (0). Defaults to None.
         wd_std (float, optional): Uncertainty; standard deviation in the inflow
           wind direction in degrees. Defaults to 0.0 deg meaning no uncertainty.
+        use_cache (bool, optional): Look up and store the FLORIS model in the
+          process-level cache. Defaults to True.
 
     Returns:
         FlorisInterface: Floris object.
@@ -31,10 +79,26 @@ def load_floris(wake_model="cc", wd_std=0.0):
     fn = os.path.join(root_path, "{:s}.yaml".format(wake_model))
 
     # Now assign the turbine locations and information
-    layout_x = [1630.222, 1176.733, 816.389, 755.938, 0.0, 1142.24, 1553.102]
-    layout_y = [0.0, 297.357, 123.431, 575.544, 647.779, 772.262, 504.711]
+    layout_x = LAYOUT_X
+    layout_y = LAYOUT_Y
+
+    # Check if we have already loaded this model before
+    if use_cache:
+        key = (
+            wake_model,
+            float(wd_std),
+            _get_yaml_hash(fn),
+            tuple(layout_x),
+            tuple(layout_y),
+        )
+        if key in _floris_cache:
+            _floris_cache_stats["hits"] += 1
+            _floris_cache.move_to_end(key)
+            return copy.deepcopy(_floris_cache[key])
+        _floris_cache_stats["misses"] += 1
 
     # Initialize FLORIS model and format appropriately
+    t0 = timerpc()
     fi = FlorisInterface(fn)
     fi.reinitialize(
         layout_x=layout_x,
@@ -49,6 +113,14 @@ def load_floris(wake_model="cc", wd_std=0.0):
             "pdf_cutoff": 0.995,  # Probability density function cut-off (-)
         }
         fi = UncertaintyInterface(fi, unc_options=unc_options)
+    _floris_cache_stats["load_time"] += timerpc() - t0
+
+    if use_cache:
+        # Save a private copy to the cache and evict the oldest entries
+        _floris_cache[key] = copy.deepcopy(fi)
+        while len(_floris_cache) > FLORIS_CACHE_MAXSIZE:
+            _floris_cache.popitem(last=False)
+            _floris_cache_stats["evictions"] += 1
 
     return fi
 
@@ -59,6 +131,12 @@ if __name__ == "__main__":
     fi = load_floris()
     print("Time spent to load the FLORIS model: {:.2f} s.".format(timerpc() - t0))
 
+    # Load the FLORIS model a second time, which is served from the cache
+    t0 = timerpc()
+    fi = load_floris()
+    print("Time spent to load the FLORIS model from cache: {:.2f} s.".format(timerpc() - t0))
+    print("FLORIS cache info: {}".format(get_floris_cache_info()))
+
     # Show layout
     plot_floris_layout(fi, plot_terrain=False)
     plt.show()
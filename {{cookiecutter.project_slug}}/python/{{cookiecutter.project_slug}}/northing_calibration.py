@@ -0,0 +1,782 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+import io
+from multiprocessing import shared_memory
+import os
+from time import perf_counter as timerpc
+import warnings as wn
+
+from matplotlib import pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import optimize as opt
+from scipy import stats as spst
+
+from floris.utilities import wrap_360
+
+from flasc import floris_tools as ftools
+from flasc import optimization as flopt
+from flasc.dataframe_operations import dataframe_manipulations as dfm
+from flasc.energy_ratio import energy_ratio_wd_bias_estimation as best
+
+from {{cookiecutter.project_slug}}.energy_ratios import EnergyRatioHistogram
+from {{cookiecutter.project_slug}}.floris_tables import find_floris_table
+from {{cookiecutter.project_slug}}.upstream import get_upstream_index_in_radius
+
+
+def apply_bias_corrections(df_scada, wd_bias_list, verbose=True):
+    """Remove the turbine-individual northing biases from the wind direction
+    measurements of each turbine, i.e., the columns 'wd_000', 'wd_001', ...
+
+    Args:
+        df_scada (pd.DataFrame): Dataframe with the SCADA data.
+        wd_bias_list (array): Northing bias of each turbine in [deg].
+        verbose (bool, optional): Print the bias removed from each turbine.
+          Defaults to True.
+
+    Returns:
+        df_out (pd.DataFrame): Copy of df_scada with bias-corrected wind
+          directions.
+    """
+    # Copy dataframe
+    df_out = df_scada.copy()
+
+    # Load the SCADA data
+    num_turbines = dfm.get_num_turbines(df_scada)
+
+    # Set turbine-individual bias corrections
+    for ti in range(num_turbines):
+        bias = wd_bias_list[ti]
+        if verbose:
+            print("Removing {:.2f} deg bias for ti = {:03d}.".format(bias, ti))
+        df_out["wd_{:03d}".format(ti)] = wrap_360(df_out["wd_{:03d}".format(ti)] - bias)
+
+    return df_out
+
+
+# Process-level caches of the farm-level artifacts used by the bias
+# estimation. Upstream turbines are keyed on the layout, the rotor diameters
+# and the wind direction step, and tables of FLORIS solutions on their
+# filename, which is unique to the model configuration and grid.
+_upstream_cache = {}
+_table_cache = {}
+
+
+def _get_farm_key(fi):
+    return (
+        tuple(float(x) for x in fi.layout_x),
+        tuple(float(y) for y in fi.layout_y),
+        tuple(float(t["rotor_diameter"]) for t in fi.floris.farm.turbine_definitions),
+    )
+
+
+def clear_calibration_cache():
+    """Empty the caches of upstream turbines and tables of FLORIS solutions."""
+    _upstream_cache.clear()
+    _table_cache.clear()
+
+
+class CalibrationContext:
+    """Farm-level artifacts needed by every per-turbine bias estimation, see
+    get_bias_for_single_turbine(...): the upstream turbines for every wind
+    direction, the table of FLORIS solutions, the turbines sorted by distance
+    to each turbine and the index of the upstream turbines within a radius of
+    each turbine. None of these depend on the (shifted) wind direction, so
+    they are calculated once, on first use, and then shared.
+    The upstream turbines and tables are also memoized at the process level,
+    such that a new context for the same FLORIS model reuses them.
+
+    Args:
+        fi (FlorisInterface): FLORIS model of the wind farm.
+        df_approx (pd.DataFrame, optional): Precalculated table of FLORIS
+          solutions. Defaults to None, meaning the table of 'wake_model' is
+          loaded, see floris_tables.load_floris_table(...).
+        wake_model (str, optional): Wake model of the table. Defaults to "gch".
+        wd_step (float, optional): Wind direction step in [deg] with which
+          the upstream turbines are determined. Defaults to 2.0.
+    """
+    def __init__(self, fi, df_approx=None, wake_model="gch", wd_step=2.0):
+        self.fi = fi
+        self.wake_model = wake_model
+        self.wd_step = float(wd_step)
+        self._df_approx = df_approx
+        self._turbines_sorted_by_distance = {}
+        self._upstream_indices = {}
+
+    @property
+    def df_upstream(self):
+        key = (_get_farm_key(self.fi), self.wd_step)
+        if key not in _upstream_cache:
+            _upstream_cache[key] = ftools.get_upstream_turbs_floris(self.fi, wd_step=self.wd_step)
+        return _upstream_cache[key]
+
+    @property
+    def df_approx(self):
+        if self._df_approx is None:
+            fn = find_floris_table(self.wake_model)
+            if fn is None:
+                raise UserWarning(
+                    "No up-to-date FLORIS table found for the '{:s}' model. ".format(self.wake_model) +
+                    "Please run 'setup_floris_model/precalculate_floris_solutions.py' for the appropriate wake models first."
+                )
+            if fn not in _table_cache:
+                _table_cache[fn] = pd.read_feather(fn)
+            self._df_approx = _table_cache[fn]
+        return self._df_approx
+
+    def get_turbines_sorted_by_distance(self, ti):
+        """Get all other turbines, sorted by their distance to turbine 'ti'.
+
+        Args:
+            ti (int): Turbine number.
+
+        Returns:
+            list: Turbine numbers, closest first.
+        """
+        if ti not in self._turbines_sorted_by_distance:
+            self._turbines_sorted_by_distance[ti] = ftools.get_turbs_in_radius(
+                x_turbs=self.fi.layout_x,
+                y_turbs=self.fi.layout_y,
+                turb_no=ti,
+                max_radius=1.0e9,
+                include_itself=False,
+                sort_by_distance=True,
+            )
+        return self._turbines_sorted_by_distance[ti]
+
+    def get_upstream_index(self, ti, max_radius=5000.0):
+        """Get the index of the upstream turbines within a radius of turbine
+        'ti', see upstream.get_upstream_index_in_radius(...).
+
+        Args:
+            ti (int): Turbine number.
+            max_radius (float, optional): Maximum distance to turbine 'ti' in
+              [m]. Defaults to 5000.0.
+
+        Returns:
+            UpstreamTurbineIndex: Index of the upstream turbines in the radius.
+        """
+        key = (ti, float(max_radius))
+        if key not in self._upstream_indices:
+            self._upstream_indices[key] = get_upstream_index_in_radius(
+                self.df_upstream,
+                x_turbs=self.fi.layout_x,
+                y_turbs=self.fi.layout_y,
+                turb_no=ti,
+                max_radius=max_radius,
+                include_itself=True,
+            )
+        return self._upstream_indices[key]
+
+    def prepare(self, turbine_list=None):
+        """Calculate all artifacts up front, e.g., before they are shared
+        with worker processes.
+
+        Args:
+            turbine_list (list, optional): Turbines to sort the other turbines
+              by distance for. Defaults to None, meaning all turbines.
+
+        Returns:
+            self (CalibrationContext): The prepared context.
+        """
+        if turbine_list is None:
+            turbine_list = range(len(self.fi.layout_x))
+        self.df_upstream
+        self.df_approx
+        for ti in turbine_list:
+            self.get_turbines_sorted_by_distance(ti)
+            self.get_upstream_index(ti)
+        return self
+
+
+def _get_bias_cost(fsc, wd_bias, er_options):
+    # Cost of a wind direction bias: the negative Pearson correlation
+    # coefficient between the measured and the FLORIS-predicted energy
+    # ratios, averaged over the test turbines. Same as the cost function in
+    # flasc's bias_estimation.estimate_wd_bias(...).
+    fsc._get_energy_ratios_allbins(wd_bias=wd_bias, fast=True, **er_options)
+    return _get_cost_from_energy_ratios(fsc.energy_ratios_scada, fsc.energy_ratios_floris)
+
+
+def _get_cost_from_energy_ratios(energy_ratios_scada, energy_ratios_floris):
+    # Negative Pearson correlation coefficient between the measured and the
+    # FLORIS-predicted energy ratios, averaged over the test turbines
+    cost_array = np.full(len(energy_ratios_scada), np.nan)
+    for ii in range(len(energy_ratios_scada)):
+        y_scada = np.array(energy_ratios_scada[ii]["baseline"])
+        y_floris = np.array(energy_ratios_floris[ii]["baseline"])
+        ids = ~np.isnan(y_scada) & ~np.isnan(y_floris)
+        if np.sum(ids) > 5:  # At least 6 valid data entries
+            r, _ = spst.pearsonr(y_scada[ids], y_floris[ids])
+        else:
+            r = np.nan
+        cost_array[ii] = -1.0 * r
+    return np.nanmean(cost_array)
+
+
+def _get_bias_costs_from_histograms(fsc, upstream_index, wd_biases, er_options, wd_resolution=0.5, ws_resolution=0.5):
+    # Approximate costs of many wind direction biases at once, see
+    # _get_bias_cost(...), from energy ratio histograms of all measurements.
+    # The reference wind speed and power depend on the upstream turbines,
+    # and thereby on the bias, so one histogram is built for every distinct
+    # set of upstream turbines, binned on the measured wind direction. For a
+    # bias, every cell of the corrected wind direction takes its sums from
+    # the histogram of the upstream turbines at the cell center. The FLORIS
+    # powers are interpolated at the cell centers rather than for every
+    # measurement, and the biases are rounded to the cells, so the costs are
+    # only meant to rank the biases.
+    df = fsc.df
+    test_turbines = [int(ti) for ti in fsc.test_turbines_subset]
+    ws_cols = ["ws_{:03d}".format(ti) for ti in range(upstream_index.num_turbines)]
+    pow_cols = ["pow_{:03d}".format(ti) for ti in range(upstream_index.num_turbines)]
+
+    # Masks on the measurements that do not depend on the bias
+    is_used = ~np.isnan(df["wd"].to_numpy(dtype=float))
+    if er_options["ti_mask"] is not None:
+        ti = df["ti"].to_numpy(dtype=float)
+        is_used &= (ti > er_options["ti_mask"][0]) & (ti <= er_options["ti_mask"][1])
+    if er_options["time_mask"] is not None:
+        time = df["time"]
+        is_used &= ((time >= er_options["time_mask"][0]) & (time <= er_options["time_mask"][1])).to_numpy()
+    df = df[is_used]
+    ws = df[ws_cols].to_numpy(dtype=float)
+    pow = df[pow_cols].to_numpy(dtype=float)
+
+    # Upstream turbines at the center of every wind direction cell
+    n_wd = int(np.round(360.0 / wd_resolution))
+    n_ws = int(np.ceil(30.0 / ws_resolution - 1.0e-6))
+    wd_centers = wd_resolution * (np.arange(n_wd) + 0.5)
+    ws_centers = ws_resolution * (np.arange(n_ws) + 0.5)
+    masks, cell_set_ids = np.unique(upstream_index.get_turbine_masks(wd_centers), axis=0, return_inverse=True)
+    cell_set_ids = np.ravel(cell_set_ids)
+
+    histograms = []
+    for mask in masks:
+        with wn.catch_warnings():
+            wn.simplefilter("ignore", category=RuntimeWarning)  # All-NaN rows
+            ws_ref = np.nanmean(ws[:, mask], axis=1)
+            pow_ref = np.nanmean(pow[:, mask], axis=1)
+        is_valid = ~np.isnan(ws_ref) & ~np.isnan(pow_ref)
+        if er_options["ws_mask"] is not None:
+            is_valid &= (ws_ref > er_options["ws_mask"][0]) & (ws_ref <= er_options["ws_mask"][1])
+        df_set = pd.DataFrame({"wd": df["wd"].to_numpy(dtype=float), "ws": ws_ref, "pow_ref": pow_ref})
+        for ti in test_turbines:
+            df_set["pow_{:03d}".format(ti)] = pow[:, ti]
+        histograms.append(
+            EnergyRatioHistogram(
+                df_set[is_valid],
+                test_turbines=test_turbines,
+                wd_resolution=wd_resolution,
+                ws_resolution=ws_resolution,
+            )
+        )
+
+    # FLORIS powers at the cell centers, and their reference power
+    wd_grid, ws_grid = np.meshgrid(wd_centers, ws_centers, indexing="ij")
+    df_cells = pd.DataFrame({"wd": wd_grid.ravel(), "ws": ws_grid.ravel(), "ti": np.nanmedian(df["ti"])})
+    with redirect_stdout(io.StringIO()):  # Warnings on NaN mirroring and the table range
+        df_cells = ftools.interpolate_floris_from_df_approx(df_cells, fsc.df_fi_approx, verbose=False, mirror_nans=False)
+    pow_fi = df_cells[pow_cols].to_numpy(dtype=float).reshape(n_wd, n_ws, -1)
+    pow_fi_test = np.moveaxis(pow_fi[:, :, test_turbines], 2, 0)
+    with wn.catch_warnings():
+        wn.simplefilter("ignore", category=RuntimeWarning)  # No upstream turbines
+        pow_fi_ref = np.stack([np.mean(pow_fi[:, :, mask], axis=2) for mask in masks])
+    pow_fi_ref = pow_fi_ref[cell_set_ids, np.arange(n_wd)]
+
+    is_masked = np.zeros(n_wd, dtype=bool)
+    if er_options["wd_mask"] is not None:
+        is_masked = ~((wd_centers > er_options["wd_mask"][0]) & (wd_centers <= er_options["wd_mask"][1]))
+
+    bin_options = {c: er_options[c] for c in ["wd_step", "ws_step", "wd_bin_width"]}
+    costs = np.full(len(wd_biases), np.nan)
+    for ii, wd_bias in enumerate(wd_biases):
+        # Combine the cells of the histograms of each set of upstream turbines
+        wd_offset = -wd_resolution * np.round(wd_bias / wd_resolution)
+        cell_sums = [h.get_cell_sums(wd_offset) for h in histograms]
+        cells = np.arange(n_wd)
+        sums = {
+            "n_rows": np.stack([c["n_rows"] for c in cell_sums])[cell_set_ids, cells],
+            "n_rows_wd": np.stack([c["n_rows_wd"] for c in cell_sums])[cell_set_ids, cells],
+        }
+        for key in ["n_valid", "sum_test", "sum_ref"]:
+            x = np.stack([c[key] for c in cell_sums])[cell_set_ids, :, cells]
+            sums[key] = np.moveaxis(x, 0, 1)
+        sums["n_rows"][is_masked] = 0
+        sums["n_rows_wd"][is_masked] = 0
+        for key in ["n_valid", "sum_test", "sum_ref"]:
+            sums[key][:, is_masked] = 0
+
+        # The FLORIS predictions of the same measurements
+        has_data = (sums["n_valid"] > 0)
+        sums_fi = dict(
+            sums,
+            sum_test=np.where(has_data, sums["n_valid"] * pow_fi_test, 0.0),
+            sum_ref=np.where(has_data, sums["n_valid"] * pow_fi_ref, 0.0),
+        )
+        er_scada = histograms[0].get_energy_ratios(test_turbines, fast=True, cell_sums=sums, **bin_options)
+        er_floris = histograms[0].get_energy_ratios(test_turbines, fast=True, cell_sums=sums_fi, **bin_options)
+        costs[ii] = _get_cost_from_energy_ratios(
+            [er_scada[ti] for ti in test_turbines], [er_floris[ti] for ti in test_turbines]
+        )
+    return costs
+
+
+def estimate_wd_bias_coarse_to_fine(
+    fsc,
+    time_mask=None,
+    ws_mask=(6.0, 10.0),
+    wd_mask=None,
+    ti_mask=None,
+    opt_search_range=(-180.0, 180.0),
+    opt_search_brute_dx=5.0,
+    er_wd_step=3.0,
+    er_ws_step=5.0,
+    er_wd_bin_width=None,
+    er_N_btstrp=1,
+    coarse_fraction=0.1,
+    n_candidates=3,
+    xtol=0.1,
+    ftol=1.0e-4,
+    maxfun=10,
+    upstream_index=None,
+):
+    """Estimate the wind direction bias like flasc's
+    bias_estimation.estimate_wd_bias(...), but with a multi-resolution
+    search. The brute-force grid of biases is first evaluated on all data
+    at once from energy ratio histograms, see EnergyRatioHistogram, or, if
+    the upstream turbines are not known, on a subsample of the data, taking
+    every n-th measurement. Only the 'n_candidates' most promising biases
+    are then evaluated on the full dataset, and the best of these is refined with the same Nelder-Mead
+    search as in flasc, which stops once the bias has converged within
+    'xtol' and the cost within 'ftol'. As long as the best grid point on
+    the full dataset is among the candidates, the estimated bias equals that
+    of the brute-force search, at a fraction of the energy ratio
+    evaluations on the full dataset.
+
+    Args:
+        fsc (bias_estimation): flasc bias estimation object.
+        time_mask, ws_mask, wd_mask, ti_mask (iterable, optional): Masks for
+          the energy ratios, see estimate_wd_bias(...).
+        opt_search_range (tuple, optional): Range of biases to search over in
+          [deg]. Defaults to (-180.0, 180.0).
+        opt_search_brute_dx (float, optional): Step of the grid of biases in
+          [deg]. Defaults to 5.0.
+        er_wd_step, er_ws_step, er_wd_bin_width, er_N_btstrp (optional):
+          Energy ratio settings, see estimate_wd_bias(...).
+        coarse_fraction (float, optional): Fraction of the measurements used
+          in the coarse search without 'upstream_index'. Defaults to 0.1.
+        n_candidates (int, optional): Number of grid points evaluated on the
+          full dataset. If the grid has no more points than this, the coarse
+          search is skipped. Defaults to 3.
+        xtol (float, optional): Convergence tolerance of the bias in [deg].
+          Defaults to 0.1.
+        ftol (float, optional): Convergence tolerance of the cost. Defaults
+          to 1.0e-4.
+        maxfun (int, optional): Maximum number of cost function evaluations
+          in the refinement. Defaults to 10.
+        upstream_index (UpstreamTurbineIndex, optional): Upstream turbines
+          that the wind speed and reference power mapping functions of 'fsc'
+          average over, see CalibrationContext.get_upstream_index(...). If
+          given, the coarse search uses histograms of all data rather than a
+          subsample. Defaults to None.
+
+    Returns:
+        x_opt (np.array): Optimal wind direction offset.
+        J_opt (float): Cost function under optimal offset.
+    """
+    print("Estimating the wind direction bias using a coarse-to-fine search")
+    er_options = {
+        "time_mask": time_mask,
+        "ws_mask": ws_mask,
+        "wd_mask": wd_mask,
+        "ti_mask": ti_mask,
+        "wd_step": er_wd_step,
+        "ws_step": er_ws_step,
+        "wd_bin_width": er_wd_bin_width,
+    }
+    n_evals = {"coarse": 0, "full": 0}
+
+    def cost_fun(wd_bias):
+        n_evals["full"] += 1
+        return _get_bias_cost(fsc, wd_bias, er_options)
+
+    # Same grid of biases as in the brute-force search
+    dran = opt_search_range[1] - opt_search_range[0]
+    x_grid = np.linspace(
+        opt_search_range[0], opt_search_range[1], int(np.ceil(dran / opt_search_brute_dx) + 1)
+    )
+
+    # Evaluate the grid on histograms of the data, or on a subsample of the
+    # data, to find the candidates
+    if len(x_grid) > n_candidates:
+        if upstream_index is not None:
+            J_grid = _get_bias_costs_from_histograms(fsc, upstream_index, x_grid, er_options)
+        else:
+            fsc_coarse = best.bias_estimation(
+                df=fsc.df.iloc[::int(np.round(1.0 / coarse_fraction))],
+                df_fi_approx=fsc.df_fi_approx,
+                test_turbines_subset=fsc.test_turbines_subset,
+                df_ws_mapping_func=fsc.df_ws_mapping_func,
+                df_pow_ref_mapping_func=fsc.df_pow_ref_mapping_func,
+            )
+            J_grid = np.array([_get_bias_cost(fsc_coarse, x, er_options) for x in x_grid])
+        n_evals["coarse"] += len(x_grid)
+        ids_candidates = np.sort(np.argsort(np.where(np.isnan(J_grid), np.inf, J_grid))[:n_candidates])
+    else:
+        J_grid = np.full(len(x_grid), np.nan)
+        ids_candidates = np.arange(len(x_grid))
+
+    # Evaluate the candidates on the full dataset and refine the best one
+    J_candidates = np.array([cost_fun(x_grid[ii]) for ii in ids_candidates])
+    x0 = x_grid[ids_candidates[np.argmin(J_candidates)]]
+    x_opt, J_opt, _, _, _ = opt.fmin(
+        cost_fun, x0, maxfun=maxfun, full_output=True, xtol=xtol, ftol=ftol, disp=False
+    )
+    if upstream_index is not None:
+        coarse_label = "histograms of all data"
+    else:
+        coarse_label = "{:.0f}% of the data".format(100.0 * coarse_fraction)
+    print(
+        "  Evaluated the energy ratios for {:d} biases on {:s} and for {:d} biases on all data.".format(
+            n_evals["coarse"], coarse_label, n_evals["full"]
+        )
+    )
+
+    fsc.opt_wd_bias = x_opt
+    fsc.opt_cost = J_opt
+    fsc.opt_wd_grid = x_grid
+    fsc.opt_wd_cost = J_grid
+
+    # End with optimal results and bootstrapping
+    print("  Evaluating optimal solution with bootstrapping")
+    fsc._get_energy_ratios_allbins(wd_bias=x_opt, N_btstrp=er_N_btstrp, fast=False, **er_options)
+
+    return x_opt, J_opt
+
+
+def get_bias_for_single_turbine(
+    df,
+    fi,
+    ti,
+    opt_search_range=[-180.0, 180.0],
+    plot=True,
+    figure_save_path=None,
+    df_approx=None,
+    context=None,
+    search_mode="brute",
+):
+    """Estimate the northing bias of the wind direction measurement of a
+    single turbine by matching the energy ratios of the three closest
+    turbines to the FLORIS predictions, see flasc's bias_estimation.
+
+    Args:
+        df (pd.DataFrame): Dataframe with the SCADA data.
+        fi (FlorisInterface): FLORIS model of the wind farm.
+        ti (int): Turbine of which the wind direction is calibrated.
+        opt_search_range (list, optional): Range of biases to search over in
+          [deg]. Defaults to [-180.0, 180.0].
+        plot (bool, optional): Plot the calibrated energy ratios. Defaults to True.
+        figure_save_path (str, optional): Path to save the figures to.
+          Defaults to None.
+        df_approx (pd.DataFrame, optional): Precalculated table of FLORIS
+          solutions. Defaults to None, meaning the 'gch' table is loaded.
+        context (CalibrationContext, optional): Farm-level artifacts shared
+          between turbines. Defaults to None, meaning a context is created
+          for 'fi' and 'df_approx'.
+        search_mode (str, optional): Search for the bias with a 'brute'-force
+          search over the search range, or with a 'coarse_to_fine' search,
+          see estimate_wd_bias_coarse_to_fine(...). Defaults to "brute".
+
+    Returns:
+        wd_bias (float): Estimated northing bias in [deg].
+    """
+    print("Initializing wd bias estimator object for turbine %03d..." % ti)
+
+    # Copy variables and unlink them
+    df = df.copy()  # Unlink from input 
+
+    # Farm-level artifacts, such as which turbines are upstream for every
+    # wind direction, are the same for every turbine, so they are taken from
+    # the calibration context.
+    if context is None:
+        context = CalibrationContext(fi, df_approx=df_approx)
+
+    # We assign the total datasets "true" wind direction as equal to the wind
+    # direction of the turbine which we want to perform northing calibration
+    # on. In this case, turbine 'ti'.
+    df = dfm.set_wd_by_turbines(df, [ti])
+
+    # We define a function that calculates the freestream wind speed based
+    # on a dataframe that is inserted. It does this based on knowing which
+    # turbines are upstream for what wind directions, and then knowledge
+    # of what the wind direction is for every row in the dataframe. Since we
+    # shift the "true" wind direction many times to estimate the northing
+    # bias, the upstream turbines of each row change with every northing bias
+    # guess. Hence, we must insert a function. The index of the upstream
+    # turbines within 5 km of turbine 'ti' does not depend on the wind
+    # direction, so it is taken from the calibration context.
+    upstream_index = context.get_upstream_index(ti, max_radius=5000.0)
+
+    def _set_ws_fun(df):
+        df["ws"] = upstream_index.get_column_mean(df, "ws")
+        return df
+
+    # We similarly define a function that calculates the reference power. This
+    # is typically the power production of one or multiple upstream turbines.
+    # Here, we assume it is the average power production of all upstream
+    # turbines. Which turbines are upstream depends on the wind direction.
+    def _set_pow_ref_fun(df):
+        df["pow_ref"] = upstream_index.get_column_mean(df, "pow")
+        return df
+
+    # Now we calculate a grid of FLORIS solutions. Since our estimated SCADA
+    # data changes as we shift its wind direction, the predicted solutions
+    # according to FLORIS will also change. Therefore, we precalculate a grid
+    # of FLORIS solutions and insert that into the bias estimation class.
+    df_approx = context.df_approx
+
+    # We now have the reference power productions specified, being equal to
+    # the mean power production of all turbines upstream. We also need to
+    # define a test power production, which should be waked at least part of
+    # the time so that we can match it with our FLORIS predictions. Here, we
+    # calculate the energy ratios for the 3 turbines closest to the turbine
+    # from which we take the wind direction measurement ('ti').
+    turbines_sorted_by_distance = context.get_turbines_sorted_by_distance(ti)
+    test_turbines = turbines_sorted_by_distance[0:3]
+
+    # Now, we have all information set up and we can initialize the northing
+    # bias estimation class.
+    fsc = best.bias_estimation(
+        df=df,
+        df_fi_approx=df_approx,
+        test_turbines_subset=test_turbines,
+        df_ws_mapping_func=_set_ws_fun,
+        df_pow_ref_mapping_func=_set_pow_ref_fun,
+    )
+
+    # We can save the energy ratio curves for every iteration in the
+    # optimization process. This is useful for debugging. However, it also
+    # significantly slows down the estimation process. We disable it by
+    # default by assigning it 'None'.
+    plot_iter_path = None  # Disabled, useful for debugging but slow
+    # plot_iter_path = os.path.join(out_path, "opt_iters_ti%03d" % ti)
+
+    # Now estimate the wind direction bias while catching warning messages
+    # that do not really inform but do pollute the console.
+    with wn.catch_warnings():
+        wn.filterwarnings(action="ignore", message="All-NaN slice encountered")
+
+        # Estimate bias for the entire time range, from start to end of
+        # dataframe, for wind speeds in region II of turbine operation, with
+        # in steps of 3.0 deg (wd) and 5.0 m/s (ws). We search over the entire
+        # range from -180.0 deg to +180.0 deg, in steps of 5.0 deg. This has
+        # appeared to be a good stepsize empirically.
+        if search_mode == "brute":
+            wd_bias, _ = fsc.estimate_wd_bias(
+                time_mask=None,  # For entire dataset
+                ws_mask=(6.0, 10.0),
+                er_wd_step=3.0,
+                er_ws_step=5.0,
+                er_wd_bin_width=3.0,
+                er_N_btstrp=1,
+                opt_search_brute_dx=5.0,
+                opt_search_range=opt_search_range,
+                plot_iter_path=plot_iter_path
+            )
+        elif search_mode == "coarse_to_fine":
+            # Evaluate the same grid on histograms of the data first, and
+            # only evaluate the 3 most promising biases on the full dataset.
+            wd_bias, _ = estimate_wd_bias_coarse_to_fine(
+                fsc,
+                time_mask=None,  # For entire dataset
+                ws_mask=(6.0, 10.0),
+                er_wd_step=3.0,
+                er_ws_step=5.0,
+                er_wd_bin_width=3.0,
+                er_N_btstrp=1,
+                opt_search_brute_dx=5.0,
+                opt_search_range=opt_search_range,
+                coarse_fraction=0.1,
+                n_candidates=3,
+                upstream_index=upstream_index,
+            )
+        else:
+            raise ValueError("Search mode must be 'brute' or 'coarse_to_fine'.")
+        wd_bias = float(wd_bias[0])  # Convert to float
+
+    # Print progress to console
+    print("Turbine {}. estimated bias = {} deg.".format(ti, wd_bias))
+
+    if plot:
+        # Produce and save calibrated/corrected energy ratio figures
+        fsc.plot_energy_ratios(save_path=figure_save_path)
+        if figure_save_path is not None:
+            print("Calibrated energy ratio figures saved to {:s}.".format(figure_save_path))
+
+    # Finally, return the estimated wind direction bias
+    return wd_bias
+
+
+# Data shared with the worker processes, see _init_worker(...)
+_worker_data = {}
+
+
+def _init_worker(shm_name, shape, dtypes, context):
+    # Runs once in every worker process. The SCADA data and the reference
+    # wind direction are read from shared memory by each task, see
+    # _get_shared_scada_data(...), so only their layout and the calibration
+    # context are handed to the workers.
+    _worker_data.update({"shm_name": shm_name, "shape": shape, "dtypes": dtypes, "context": context})
+
+
+def _get_shared_scada_data():
+    # Copy the SCADA data and the reference wind direction (the last column)
+    # out of shared memory. Datetime columns are stored as their int64
+    # nanoseconds, reinterpreted as float64.
+    shm = shared_memory.SharedMemory(name=_worker_data["shm_name"])
+    try:
+        block = np.ndarray(_worker_data["shape"], dtype=np.float64, buffer=shm.buf)
+        columns = {}
+        for jj, (c, dtype) in enumerate(_worker_data["dtypes"].items()):
+            values = np.array(block[:, jj])
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                values = values.view(np.int64).astype("datetime64[ns]")
+            columns[c] = pd.Series(values).astype(dtype)
+        wd_ref = np.array(block[:, -1])
+    finally:
+        shm.close()
+    return pd.DataFrame(columns), wd_ref
+
+
+def _estimate_bias_with_reference_wd(ti, figure_save_path=None):
+    # Worker function: estimate the bias of turbine 'ti' around the offset
+    # between its wind direction and the reference wind direction. Returns
+    # the bias, the wall clock time and the console output.
+    start_time = timerpc()
+    stdout = io.StringIO()
+    with redirect_stdout(stdout):
+        df_scada, wd_ref = _get_shared_scada_data()
+
+        # Calculate the offset between this turbine's wind direction and that
+        # of the calibrated (reference) wind direction. Note that 'wd_ref' may
+        # also be a met mast' wind direction signal, if available. The offset
+        # between a turbine's wind direction and wd_ref is very likely to be
+        # the bias or close to the bias in this turbine's northing.
+        wd_test = df_scada["wd_{:03d}".format(ti)]
+        x0, _ = flopt.match_y_curves_by_offset(
+            wd_ref,
+            wd_test.to_numpy(),
+            dy_eval=np.arange(-180.0, 180.0, 2.0),
+            angle_wrapping=True
+        )
+
+        # Then, we refine this first guess by evaluating the cost function
+        # at [-5.0, 0.0, 5.0] deg around x0, and let the optimizer
+        # converge.
+        x_search_bounds = np.round(x0) + np.array([-5.0, 5.0])
+        if figure_save_path is not None:
+            figure_save_path = os.path.join(figure_save_path, "energy_ratios_ti{:03d}".format(ti))
+        wd_bias = get_bias_for_single_turbine(
+            df=df_scada,
+            fi=_worker_data["context"].fi,
+            ti=ti,
+            opt_search_range=x_search_bounds,
+            plot=(figure_save_path is not None),
+            figure_save_path=figure_save_path,
+            context=_worker_data["context"],
+        )
+        plt.close("all")
+
+    return wd_bias, timerpc() - start_time, stdout.getvalue()
+
+
+def estimate_biases_with_reference_wd(
+    df_scada,
+    fi,
+    wd_ref,
+    df_approx=None,
+    context=None,
+    turbine_list=None,
+    max_workers=8,
+    figure_save_path=None,
+    verbose=True,
+):
+    """Estimate the northing bias of every turbine, using a calibrated
+    reference wind direction to narrow down the search range of each
+    turbine, see get_bias_for_single_turbine(...). The turbines are
+    calibrated independently from one another, so the estimations are
+    spread over a pool of worker processes. The SCADA data is shared with
+    the workers read-only through shared memory rather than by pickling the
+    dataframe. The calibration context, holding the FLORIS model, the table
+    of FLORIS solutions and the upstream turbines, is prepared once and
+    handed to each worker once, rather than with every turbine.
+
+    Args:
+        df_scada (pd.DataFrame): Dataframe with the SCADA data.
+        fi (FlorisInterface): FLORIS model of the wind farm.
+        wd_ref (pd.Series): Calibrated reference wind direction in [deg],
+          for every row of 'df_scada'.
+        df_approx (pd.DataFrame, optional): Precalculated table of FLORIS
+          solutions. Defaults to None, meaning the 'gch' table is loaded.
+        context (CalibrationContext, optional): Farm-level artifacts shared
+          between turbines. Defaults to None, meaning a context is created
+          for 'fi' and 'df_approx'.
+        turbine_list (list, optional): Turbines to calibrate. Defaults to
+          None, meaning all turbines.
+        max_workers (int, optional): Number of worker processes. Defaults to 8.
+        figure_save_path (str, optional): Directory to save the calibrated
+          energy ratio figures of each turbine to. Defaults to None, meaning
+          no figures are made.
+        verbose (bool, optional): Print the output of each estimation, in
+          turbine order. Defaults to True.
+
+    Returns:
+        wd_bias_list (np.array): Estimated northing bias of each turbine in
+          [deg]. NaN for turbines that are not in 'turbine_list'.
+        turbine_timings (np.array): Wall clock time of the estimation of
+          each turbine in [s].
+    """
+    num_turbines = len(fi.layout_x)
+    if turbine_list is None:
+        turbine_list = list(range(num_turbines))
+    if context is None:
+        context = CalibrationContext(fi, df_approx=df_approx)
+    context.prepare(turbine_list)
+
+    # Copy the SCADA data and the reference wind direction into shared
+    # memory. Datetime columns, e.g., 'time', keep their int64 nanoseconds.
+    dtypes = df_scada.dtypes.to_dict()
+    shape = (df_scada.shape[0], df_scada.shape[1] + 1)
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        for jj, (c, dtype) in enumerate(dtypes.items()):
+            if pd.api.types.is_datetime64_any_dtype(dtype):
+                block[:, jj] = df_scada[c].to_numpy(dtype="datetime64[ns]").view(np.int64).view(np.float64)
+            else:
+                block[:, jj] = df_scada[c].to_numpy(dtype=np.float64)
+        block[:, -1] = np.asarray(wd_ref, dtype=np.float64)
+
+        wd_bias_list = np.full(num_turbines, np.nan)
+        turbine_timings = np.full(num_turbines, np.nan)
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(shm.name, shape, dtypes, context),
+        ) as executor:
+            results = executor.map(
+                _estimate_bias_with_reference_wd,
+                turbine_list,
+                [figure_save_path] * len(turbine_list),
+            )
+            for ti, (wd_bias, t, output) in zip(turbine_list, results):
+                if verbose:
+                    print(output)
+                wd_bias_list[ti] = wd_bias
+                turbine_timings[ti] = t
+        del block
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return wd_bias_list, turbine_timings
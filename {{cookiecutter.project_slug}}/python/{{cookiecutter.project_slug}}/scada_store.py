@@ -0,0 +1,408 @@
+from datetime import datetime
+import json
+import os
+import re
+import shutil
+from time import perf_counter as timerpc
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+
+def get_scada_dict(turbine_names):
+    """Get the mapping from the column names in the raw SCADA data to the
+    common FLASC format. In FLORIS, turbines are numbered from 0 to
+    nturbs - 1, whereas in SCADA data, turbines often have a different name.
+
+    Args:
+        turbine_names (list): Names of the turbines in the raw SCADA data,
+          ordered by their index in FLORIS.
+
+    Returns:
+        scada_dict (dict): Dictionary mapping the raw to the FLASC column names.
+    """
+    scada_dict = {}
+    for ii, tn in enumerate(turbine_names):
+        scada_dict.update(
+            {
+                "ActivePower_{:s}".format(tn): "pow_{:03d}".format(ii),  # We want to use the 'active' power production for our analysis in FLASC
+                "NacWSpeed_{:s}".format(tn): "ws_{:03d}".format(ii),  # Turbine-felt wind speed. This should be the freestream-equivalent wind speed at this turbine.
+                "NacTI_{:s}".format(tn): "ti_{:03d}".format(ii),  # Turbine-felt turbulence intensity at each turbine, with 0.06 meaning 6 % turbulence intensity
+                "NacWDir_{:s}".format(tn): "wd_{:03d}".format(ii),  # Wind direction from the data. If this is not available, can approximate this with the nacelle heading.
+                "is_operation_normal_{:s}".format(tn): "is_operation_normal_{:03d}".format(ii),
+            }
+        )
+    return scada_dict
+
+
+def format_chunk(df, column_mapping=None, time_col="time"):
+    """Rename the columns of a chunk of raw data and cast every column to a
+    fixed data type: timestamps for the time column, booleans for the
+    'is_operation_normal_###' flags, and 32-bit floats for all other columns.
+    Unlike flasc's df_reduce_precision(...), the data types do not depend on
+    the values in the chunk, so that all chunks of a dataset share one schema.
+    Missing 'is_operation_normal_###' flags are marked as False, i.e., faulty.
+
+    Args:
+        df (pd.DataFrame): Chunk of raw data.
+        column_mapping (dict, optional): Mapping of the raw to the new column
+          names, e.g., the output of get_scada_dict(...). Defaults to None.
+        time_col (str, optional): Name of the time column after renaming.
+          Defaults to "time".
+
+    Returns:
+        df (pd.DataFrame): Formatted chunk of data.
+    """
+    if column_mapping is not None:
+        df = df.rename(columns=column_mapping)
+
+    data = {}
+    for c in df.columns:
+        if c == time_col:
+            data[c] = pd.to_datetime(df[c])
+        elif c.startswith("is_operation_normal"):
+            values = df[c]
+            if values.dtype == object:
+                values = values.map({True: True, False: False, "True": True, "False": False})
+            data[c] = values.astype("boolean").fillna(False).astype(bool)
+        else:
+            data[c] = pd.to_numeric(df[c], errors="coerce").astype(np.float32)
+    return pd.DataFrame(data, index=df.index)
+
+
+def _get_wd_sectors(df, wd_sector_width):
+    # Assign each row to a wind direction sector based on the circular mean
+    # of the wind directions of all turbines, like dfm.set_wd_by_all_turbines(...).
+    # Rows without any valid wind direction are assigned to sector -1.
+    wd_cols = [c for c in df.columns if re.match(r"^wd_\d{3}$", c)]
+    if len(wd_cols) == 0:
+        wd_cols = ["wd"]
+    wd = np.deg2rad(df[wd_cols].to_numpy(dtype=float))
+    with np.errstate(invalid="ignore"):
+        wd_mean = np.rad2deg(np.arctan2(np.nanmean(np.sin(wd), axis=1), np.nanmean(np.cos(wd), axis=1))) % 360.0
+    sectors = (np.floor(wd_mean / wd_sector_width) * wd_sector_width).astype(float)
+    return np.where(np.isnan(sectors), -1, sectors).astype(int)
+
+
+def _write_partitions(df, store_path, part_id, time_col="time", partition_by="month", wd_sector_width=None):
+    # Split a dataframe by time partition and, optionally, by wind direction
+    # sector, and write each partition to a separate .ftr file, e.g.,
+    # 'store_path/year=2019/month=01/wd_sector=030/part_00000.ftr'.
+    if partition_by not in ["year", "month"]:
+        raise ValueError("Partitioning must be 'year' or 'month'.")
+
+    keys = [df[time_col].dt.year.rename("year")]
+    if partition_by == "month":
+        keys.append(df[time_col].dt.month.rename("month"))
+    if wd_sector_width is not None:
+        keys.append(pd.Series(_get_wd_sectors(df, wd_sector_width), index=df.index, name="wd_sector"))
+
+    for key, df_part in df.groupby(keys, sort=True):
+        part_path = os.path.join(store_path, "year={:04d}".format(key[0]))
+        if partition_by == "month":
+            part_path = os.path.join(part_path, "month={:02d}".format(key[1]))
+        if wd_sector_width is not None:
+            part_path = os.path.join(part_path, "wd_sector={:03d}".format(key[-1]))
+        os.makedirs(part_path, exist_ok=True)
+        df_part.reset_index(drop=True).to_feather(os.path.join(part_path, "part_{:05d}.ftr".format(part_id)))
+
+
+def _get_source_info(fn):
+    return {"filename": os.path.abspath(fn), "size": os.path.getsize(fn), "mtime": os.path.getmtime(fn)}
+
+
+def _save_store_metadata(store_path, df, source, time_col, partition_by, wd_sector_width, n_rows, time_min, time_max):
+    metadata = {
+        "created": datetime.now().isoformat(),
+        "source": source,
+        "time_col": time_col,
+        "partition_by": partition_by,
+        "wd_sector_width": wd_sector_width,
+        "n_rows": int(n_rows),
+        "time_min": str(time_min),
+        "time_max": str(time_max),
+        "columns": list(df.columns),
+        "dtypes": {c: str(t) for c, t in df.dtypes.items()},
+    }
+    with open(os.path.join(store_path, "_metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+    return metadata
+
+
+def load_store_metadata(store_path):
+    """Load the metadata of a data store, or None if the store does not exist."""
+    fn = os.path.join(store_path, "_metadata.json")
+    if not os.path.exists(fn):
+        return None
+    with open(fn, "r") as f:
+        return json.load(f)
+
+
+def ingest_csv_to_store(
+    fn_csv,
+    store_path,
+    column_mapping=None,
+    time_col="time",
+    chunksize=100000,
+    partition_by="month",
+    wd_sector_width=None,
+    overwrite=False,
+    verbose=True,
+):
+    """Stream a raw .csv file into a time-partitioned data store. The file is
+    read in chunks of 'chunksize' rows. Each chunk is renamed and cast to a
+    fixed schema using format_chunk(...), sorted by time, split by time
+    partition and written as a separate .ftr file, e.g.,
+    'store_path/year=2019/month=01/part_00000.ftr'. Peak memory use is
+    thereby bounded by the chunk size rather than by the size of the dataset.
+    Index columns written by pandas, i.e., columns named 'Unnamed: ...', are
+    skipped. If the store was already created from the same, unmodified
+    .csv file, the ingestion is skipped unless 'overwrite' is True. A file
+    without any rows gives an empty store.
+
+    Args:
+        fn_csv (str): Path to the raw .csv file.
+        store_path (str): Directory of the data store.
+        column_mapping (dict, optional): Mapping of the raw to the new column
+          names, e.g., the output of get_scada_dict(...). Defaults to None.
+        time_col (str, optional): Name of the time column after renaming.
+          Defaults to "time".
+        chunksize (int, optional): Number of rows per chunk. Defaults to 100000.
+        partition_by (str, optional): Time partitioning, options are 'year'
+          and 'month'. Defaults to 'month'.
+        wd_sector_width (float, optional): Additionally partition the data by
+          wind direction sectors of this width in [deg], see write_store(...).
+          Defaults to None, meaning no partitioning by wind direction.
+        overwrite (bool, optional): Recreate the store even if it is up to
+          date. Defaults to False.
+        verbose (bool, optional): Print progress. Defaults to True.
+
+    Returns:
+        metadata (dict): Metadata of the data store.
+    """
+    source = _get_source_info(fn_csv)
+    metadata = load_store_metadata(store_path)
+    if (not overwrite) and (metadata is not None) and (metadata["source"] == source):
+        if verbose:
+            print("Data store '{:s}' is up to date with '{:s}'. Skipping...".format(store_path, fn_csv))
+        return metadata
+
+    # The store is built in a temporary directory and only replaces the
+    # existing store once it is complete, so that a failed ingestion, e.g.,
+    # of an unreadable file, leaves the existing store intact
+    tmp_path = store_path.rstrip(os.sep) + ".tmp"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    start_time = timerpc()
+    n_rows = 0
+    time_min = None
+    time_max = None
+    df_chunk = pd.DataFrame(columns=[time_col])  # Schema of a file without any content
+    try:
+        try:
+            reader = pd.read_csv(fn_csv, chunksize=chunksize, usecols=lambda c: not c.startswith("Unnamed"))
+        except pd.errors.EmptyDataError:
+            reader = []  # File without any content
+        for ii, df_chunk in enumerate(reader):
+            df_chunk = format_chunk(df_chunk, column_mapping=column_mapping, time_col=time_col)
+            df_chunk = df_chunk.sort_values(by=time_col).reset_index(drop=True)
+            _write_partitions(df_chunk, tmp_path, ii, time_col, partition_by, wd_sector_width)
+
+            n_rows += df_chunk.shape[0]
+            if df_chunk.shape[0] > 0:
+                t0, t1 = df_chunk[time_col].min(), df_chunk[time_col].max()
+                time_min = t0 if time_min is None else min(time_min, t0)
+                time_max = t1 if time_max is None else max(time_max, t1)
+            if verbose:
+                print("  Ingested {:d} rows from '{:s}' ({:.1f} s).".format(n_rows, fn_csv, timerpc() - start_time))
+
+        metadata = _save_store_metadata(
+            tmp_path, df_chunk, source, time_col, partition_by, wd_sector_width, n_rows, time_min, time_max
+        )
+    except Exception:
+        shutil.rmtree(tmp_path)
+        raise
+
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path)
+    os.replace(tmp_path, store_path)
+    return metadata
+
+
+def write_store(df, store_path, time_col="time", partition_by="month", wd_sector_width=None):
+    """Write a dataframe to a time-partitioned data store that can be read
+    with load_store(...). Any existing store at 'store_path' is replaced.
+    Optionally, the data is also partitioned by wind direction sector, based
+    on the circular mean of the wind directions of all turbines, i.e., the
+    'wd' signal of dfm.set_wd_by_all_turbines(...). Reading the data for a
+    limited wind direction range then only touches the files of the sectors
+    overlapping with that range.
+
+    Args:
+        df (pd.DataFrame): Dataframe to write.
+        store_path (str): Directory of the data store.
+        time_col (str, optional): Name of the time column. Defaults to "time".
+        partition_by (str, optional): Time partitioning, options are 'year'
+          and 'month'. Defaults to 'month'.
+        wd_sector_width (float, optional): Width of the wind direction sectors
+          in [deg]. Defaults to None, meaning no partitioning by wind direction.
+
+    Returns:
+        metadata (dict): Metadata of the data store.
+    """
+    if os.path.exists(store_path):
+        shutil.rmtree(store_path)
+    os.makedirs(store_path)
+
+    df = df.sort_values(by=time_col).reset_index(drop=True)
+    _write_partitions(df, store_path, 0, time_col, partition_by, wd_sector_width)
+    return _save_store_metadata(
+        store_path, df, None, time_col, partition_by, wd_sector_width, df.shape[0], df[time_col].min(), df[time_col].max()
+    )
+
+
+def get_turbine_columns(columns, turbines):
+    """Select the columns of a subset of turbines, e.g., 'pow_001' and
+    'ws_001' for turbine 1, plus all columns that do not belong to any
+    turbine, such as 'time'.
+
+    Args:
+        columns (list): All column names.
+        turbines (list): Turbine indices to keep.
+
+    Returns:
+        list: Selected column names.
+    """
+    out = []
+    for c in columns:
+        m = re.search(r"_(\d{3})$", c)
+        if (m is None) or (int(m.group(1)) in turbines):
+            out.append(c)
+    return out
+
+
+def _get_wd_sectors_in_range(wd_range, wd_sector_width):
+    # Wind direction sectors overlapping with wd_range, treating the wind
+    # direction as periodic, e.g., wd_range=[350.0, 20.0] and [-10.0, 20.0]
+    # both cover the directions from 350 deg to 20 deg.
+    sectors = np.arange(0.0, 360.0, wd_sector_width)
+    if wd_range[1] - wd_range[0] >= 360.0:
+        return [int(s) for s in sectors]
+    lb = wd_range[0] % 360.0
+    width = (wd_range[1] - wd_range[0]) % 360.0
+    ids = (((sectors - lb) % 360.0) <= width) | (((lb - sectors) % 360.0) < wd_sector_width)
+    return [int(s) for s in sectors[ids]]
+
+
+def load_store(store_path, columns=None, turbines=None, time_range=None, wd_range=None):
+    """Load a data store created with ingest_csv_to_store(...) or
+    write_store(...) into a single dataframe, sorted by time. Only the
+    requested columns are read from disk, and the time and wind direction
+    predicates are pushed down to the partitions, so that files outside of
+    the time window or wind direction range are not read at all.
+
+    Args:
+        store_path (str): Directory of the data store.
+        columns (list, optional): Columns to load. Defaults to None, meaning
+          all columns.
+        turbines (list, optional): Only load the columns of these turbines,
+          see get_turbine_columns(...). Defaults to None, meaning all turbines.
+        time_range (list, optional): Only load data with time_range[0] <= time
+          < time_range[1]. Either bound may be None. Defaults to None.
+        wd_range (list, optional): Only load the wind direction sectors that
+          overlap with [wd_range[0], wd_range[1]] in [deg]. This requires a
+          store partitioned by wind direction. This is a coarse selection at
+          the resolution of the sectors; use dfm.filter_df_by_wd(...) to
+          filter the data on the exact wind direction. Defaults to None.
+
+    Returns:
+        df (pd.DataFrame): Dataframe with the data in the store.
+    """
+    metadata = load_store_metadata(store_path)
+    if metadata is None:
+        raise UserWarning("Please run ingest_csv_to_store(...) to create the data store '{:s}'.".format(store_path))
+    time_col = metadata["time_col"]
+
+    dataset = ds.dataset(store_path, format="feather", partitioning="hive")
+
+    # Column projection
+    if columns is None:
+        columns = list(metadata["columns"])
+    if turbines is not None:
+        columns = get_turbine_columns(columns, turbines)
+    if (time_col in metadata["columns"]) and (time_col not in columns):
+        columns = [time_col] + list(columns)
+
+    if metadata["n_rows"] == 0:
+        return pd.DataFrame(columns=columns)  # Store without any files
+
+    # Predicates on the partitions and on the time column
+    expr = None
+    if time_range is not None:
+        tz = dataset.schema.field(time_col).type.tz
+        for ii, t in enumerate(time_range):
+            if t is None:
+                continue
+            t = pd.Timestamp(t)
+            if (tz is not None) and (t.tzinfo is None):
+                t = t.tz_localize(tz)
+            if ii == 0:
+                e = ds.field(time_col) >= pa.scalar(t)
+                e_part = ds.field("year") >= t.year
+            else:
+                e = ds.field(time_col) < pa.scalar(t)
+                e_part = ds.field("year") <= t.year
+            if metadata["partition_by"] == "month":
+                if ii == 0:
+                    e_part = (ds.field("year") > t.year) | ((ds.field("year") == t.year) & (ds.field("month") >= t.month))
+                else:
+                    e_part = (ds.field("year") < t.year) | ((ds.field("year") == t.year) & (ds.field("month") <= t.month))
+            e = e & e_part
+            expr = e if expr is None else expr & e
+    if wd_range is not None:
+        if metadata["wd_sector_width"] is None:
+            raise UserWarning("Data store '{:s}' is not partitioned by wind direction.".format(store_path))
+        e = ds.field("wd_sector").isin(_get_wd_sectors_in_range(wd_range, metadata["wd_sector_width"]))
+        expr = e if expr is None else expr & e
+
+    df = dataset.to_table(columns=columns, filter=expr).to_pandas()
+    if time_col in df.columns:
+        df = df.sort_values(by=time_col).reset_index(drop=True)
+    return df
+
+
+def get_default_store_path():
+    """Return the path of the filtered and northing-calibrated SCADA data
+    store, as written by 'raw_data_processing/northing_calibration.ipynb'."""
+    root_path = os.path.dirname(os.path.abspath(__file__))
+    data_path = os.path.join(root_path, "..", "raw_data_processing", "postprocessed")
+    return os.path.join(data_path, "scada_store_600s_filtered_and_northing_calibrated")
+
+
+def load_postprocessed_store(columns=None, turbines=None, time_range=None, wd_range=None):
+    """Load the filtered and northing-calibrated SCADA data, see
+    get_default_store_path(...) and load_store(...).
+
+    Args:
+        columns (list, optional): Columns to load. Defaults to None, meaning
+          all columns.
+        turbines (list, optional): Only load the columns of these turbines.
+          Defaults to None, meaning all turbines.
+        time_range (list, optional): Only load data within this time window.
+          Defaults to None.
+        wd_range (list, optional): Only load the wind direction sectors that
+          overlap with this range, based on the circular mean wind direction
+          of all turbines. Defaults to None.
+
+    Returns:
+        df (pd.DataFrame): Dataframe with the SCADA data.
+    """
+    print("Loading data from the SCADA data store...")
+    store_path = get_default_store_path()
+    if not os.path.exists(store_path):
+        raise UserWarning("Please run the scripts in 'raw_data_processing' first.")
+    return load_store(store_path, columns=columns, turbines=turbines, time_range=time_range, wd_range=wd_range)
@@ -0,0 +1,388 @@
+from datetime import timedelta as td
+import os
+from time import perf_counter as timerpc
+
+import numpy as np
+import pandas as pd
+from scipy.signal import lfilter
+
+from floris.utilities import wrap_360
+
+
+# Default settings of the faults injected into the synthetic SCADA data. Rates
+# are expressed as the expected number of events per turbine per day, and the
+# duration of events as a [min, max] range in hours.
+DEFAULT_FAULT_OPTIONS = {
+    "northing_bias_range": 25.0,  # Turbine wd biases are drawn from [-x, x] deg
+    "negative_fraction": 0.001,  # Fraction of samples with negative ws and power
+    "outlier_fraction": 0.01,  # Fraction of samples with a random power reduction
+    "stuck_ws_rate": 0.05,  # Stuck wind speed sensor events per turbine per day
+    "stuck_wd_rate": 0.05,  # Stuck wind direction sensor events per turbine per day
+    "stuck_duration": [1.0, 4.0],  # Duration of stuck sensor events in hours
+    "maintenance_rate": 2.0 / 365.0,  # Maintenance events per turbine per day
+    "maintenance_duration": [24.0, 216.0],  # Duration of maintenance events in hours
+    "curtailment": None,  # E.g., {"turbines": [2, 5], "pow_max": 3150.0, "t_start": ..., "t_end": ...}
+}
+
+
+def get_grid_layout(n_turbines, spacing=630.0, n_cols=None):
+    """Get the turbine locations of a rectangular wind farm layout.
+
+    Args:
+        n_turbines (int): Number of turbines.
+        spacing (float, optional): Turbine spacing in [m]. Defaults to 630.0.
+        n_cols (int, optional): Number of turbines per row. Defaults to None,
+          meaning a square-ish layout.
+
+    Returns:
+        layout_x (np.array): x-coordinates of the turbines in [m].
+        layout_y (np.array): y-coordinates of the turbines in [m].
+    """
+    if n_cols is None:
+        n_cols = int(np.ceil(np.sqrt(n_turbines)))
+    ids = np.arange(n_turbines)
+    return spacing * (ids % n_cols), spacing * (ids // n_cols)
+
+
+def get_wake_ws_ratios(layout_x, layout_y, rotor_diameter=126.0, wake_expansion=0.05, ct=0.8, wd_step=1.0):
+    """Calculate the ratio between the waked and the freestream wind speed of
+    each turbine as a function of the wind direction, using a top-hat Jensen
+    wake model with a root-sum-square superposition of the wake deficits.
+    This is a cheap surrogate for FLORIS that works for arbitrary layouts
+    without precalculating a table of FLORIS solutions.
+
+    Args:
+        layout_x (array): x-coordinates of the turbines in [m].
+        layout_y (array): y-coordinates of the turbines in [m].
+        rotor_diameter (float, optional): Rotor diameter in [m]. Defaults to 126.0.
+        wake_expansion (float, optional): Wake expansion coefficient of the
+          Jensen model. Defaults to 0.05.
+        ct (float, optional): Thrust coefficient. Defaults to 0.8.
+        wd_step (float, optional): Wind direction resolution in [deg]. Defaults to 1.0.
+
+    Returns:
+        ratios (np.array): Array of shape (n_wd, n_turbines), with the wind
+          speed ratios for wind directions np.arange(0.0, 360.0, wd_step).
+    """
+    x = np.asarray(layout_x, dtype=float)
+    y = np.asarray(layout_y, dtype=float)
+    wd = np.deg2rad(np.arange(0.0, 360.0, wd_step))
+
+    # Distances between all turbine pairs (i upstream, j downstream) along and
+    # perpendicular to the direction the wind is blowing to
+    dx = x[None, :] - x[:, None]
+    dy = y[None, :] - y[:, None]
+    ux = -np.sin(wd)[:, None, None]
+    uy = -np.cos(wd)[:, None, None]
+    d_along = dx[None, :, :] * ux + dy[None, :, :] * uy
+    d_cross = np.abs(dx[None, :, :] * uy - dy[None, :, :] * ux)
+
+    # Top-hat Jensen deficits
+    wake_radius = rotor_diameter / 2.0 + wake_expansion * d_along
+    in_wake = (d_along > 0.0) & (d_cross < wake_radius)
+    d_along_pos = np.maximum(d_along, 0.0)
+    deficit = (1.0 - np.sqrt(1.0 - ct)) / (1.0 + 2.0 * wake_expansion * d_along_pos / rotor_diameter) ** 2
+    deficit = np.where(in_wake, deficit, 0.0)
+
+    return 1.0 - np.sqrt(np.sum(deficit ** 2, axis=1))
+
+
+def get_power_curve(ws, rated_power=5000.0, ws_cut_in=3.0, ws_rated=11.4, ws_cut_out=25.0):
+    """Generic cubic power curve of a wind turbine.
+
+    Args:
+        ws (array): Wind speeds in [m/s].
+        rated_power (float, optional): Rated power in [kW]. Defaults to 5000.0.
+        ws_cut_in (float, optional): Cut-in wind speed in [m/s]. Defaults to 3.0.
+        ws_rated (float, optional): Rated wind speed in [m/s]. Defaults to 11.4.
+        ws_cut_out (float, optional): Cut-out wind speed in [m/s]. Defaults to 25.0.
+
+    Returns:
+        np.array: Turbine power in [kW].
+    """
+    ws = np.asarray(ws)
+    power = rated_power * np.clip((ws - ws_cut_in) / (ws_rated - ws_cut_in), 0.0, 1.0) ** 3
+    return np.where(ws > ws_cut_out, 0.0, power)
+
+
+def _get_ar1_series(rng, n, phi, sigma, state):
+    # Autoregressive process x[t] = phi * x[t-1] + e[t] with a stationary
+    # standard deviation of 'sigma', continuing from the last value 'state'
+    e = rng.normal(0.0, sigma * np.sqrt(1.0 - phi ** 2), size=n)
+    x, _ = lfilter([1.0], [1.0, -phi], e, zi=[phi * state])
+    return x
+
+
+def _get_runs(rng, n, n_turbines, rate, duration, carry):
+    # Draw the start and length of random events for every turbine, e.g.,
+    # stuck sensors or maintenance, and return the mask of samples that are
+    # part of an event, and the index of the first sample of the event. Events
+    # running past the end of the chunk are carried over to the next chunk
+    # through 'carry', the number of remaining samples per turbine.
+    idx = np.arange(n)[:, None]
+    starts = rng.random((n, n_turbines)) < rate
+    lengths = rng.integers(duration[0], duration[1] + 1, size=(n, n_turbines))
+
+    last_start = np.maximum.accumulate(np.where(starts, idx, -1), axis=0)
+    has_start = last_start >= 0
+    cols = np.broadcast_to(np.arange(n_turbines)[None, :], (n, n_turbines))
+    run_length = lengths[np.maximum(last_start, 0), cols]
+    in_new_run = has_start & (idx - last_start < run_length)
+    in_carry_run = (~has_start) & (idx < carry[None, :])
+    in_run = in_new_run | in_carry_run
+
+    # Remaining samples of events that continue in the next chunk
+    carry_new = np.where(
+        has_start[-1, :],
+        np.maximum(last_start[-1, :] + run_length[-1, :] - n, 0),
+        np.maximum(carry - n, 0),
+    )
+    return in_run, last_start, carry_new
+
+
+def _apply_stuck_values(values, in_run, last_start, held_values):
+    # Replace the values inside each event by the value at the start of the
+    # event, or by the held value of an event carried over from the previous chunk
+    n_turbines = values.shape[1]
+    cols = np.broadcast_to(np.arange(n_turbines)[None, :], values.shape)
+    stuck_values = np.where(last_start >= 0, values[np.maximum(last_start, 0), cols], held_values[None, :])
+    values = np.where(in_run, stuck_values, values)
+    return values, values[-1, :]
+
+
+class SyntheticScadaGenerator:
+    """Vectorized, seedable generator of synthetic SCADA and met mast data for
+    wind farms of arbitrary size and layout. The data is generated in chunks
+    of time, with the state of the inflow processes and of ongoing fault
+    events carried over between chunks, so that datasets much larger than the
+    available memory can be streamed to disk, see write_to_disk(...).
+
+    The ambient wind direction follows a random walk, and the wind speed and
+    turbulence intensity follow mean-reverting autoregressive processes. The
+    turbine wind speeds include the wake losses of a cheap Jensen model, see
+    get_wake_ws_ratios(...), and the turbine powers follow a generic power
+    curve, see get_power_curve(...). Measurement noise, northing biases and
+    the faults configured in 'fault_options' are added on top, see
+    DEFAULT_FAULT_OPTIONS. For a given seed and chunk size, the generated
+    data is reproducible.
+
+    Args:
+        layout_x (array): x-coordinates of the turbines in [m].
+        layout_y (array): y-coordinates of the turbines in [m].
+        t_start (str or pd.Timestamp, optional): First timestamp. Defaults to
+          "2019-01-01".
+        duration (td, optional): Length of the dataset. Defaults to td(days=365).
+        dt (float, optional): Sample time in [s]. Defaults to 600.0.
+        seed (int, optional): Seed of the random number generator. Defaults to 0.
+        fault_options (dict, optional): Fault settings overriding the entries
+          in DEFAULT_FAULT_OPTIONS. Defaults to None.
+        ws_mean (float, optional): Mean wind speed in [m/s]. Defaults to 8.0.
+        ws_std (float, optional): Standard deviation of the wind speed in [m/s].
+          Defaults to 3.0.
+        wd_std_per_hour (float, optional): Standard deviation of the change in
+          wind direction over one hour in [deg]. Defaults to 10.0.
+        time_constant (float, optional): Correlation time of the wind speed and
+          turbulence intensity in [s]. Defaults to 6 hours.
+    """
+
+    def __init__(
+        self,
+        layout_x,
+        layout_y,
+        t_start="2019-01-01",
+        duration=td(days=365),
+        dt=600.0,
+        seed=0,
+        fault_options=None,
+        ws_mean=8.0,
+        ws_std=3.0,
+        wd_std_per_hour=10.0,
+        time_constant=6.0 * 3600.0,
+    ):
+        self.layout_x = np.asarray(layout_x, dtype=float)
+        self.layout_y = np.asarray(layout_y, dtype=float)
+        self.n_turbines = len(self.layout_x)
+        self.t_start = pd.Timestamp(t_start)
+        self.n_samples = int(duration.total_seconds() // dt)
+        self.dt = float(dt)
+        self.seed = seed
+        self.ws_mean = ws_mean
+        self.ws_std = ws_std
+        self.wd_std_per_hour = wd_std_per_hour
+        self.phi = np.exp(-self.dt / time_constant)
+
+        self.fault_options = dict(DEFAULT_FAULT_OPTIONS)
+        if fault_options is not None:
+            self.fault_options.update(fault_options)
+
+        self.ws_ratios = get_wake_ws_ratios(self.layout_x, self.layout_y)
+        self.reset()
+
+    def reset(self):
+        """Restart the generator at the first timestamp."""
+        self.rng = np.random.default_rng(self.seed)
+        self.northing_bias = self.fault_options["northing_bias_range"] * (
+            2.0 * self.rng.random(self.n_turbines) - 1.0
+        )
+        self.i_sample = 0
+        self.state = {
+            "wd": 360.0 * self.rng.random(),
+            "ws": 0.0,
+            "ti": 0.0,
+            "stuck_ws": np.zeros(self.n_turbines, dtype=int),
+            "stuck_ws_value": np.zeros(self.n_turbines),
+            "stuck_wd": np.zeros(self.n_turbines, dtype=int),
+            "stuck_wd_value": np.zeros(self.n_turbines),
+            "maintenance": np.zeros(self.n_turbines, dtype=int),
+        }
+
+    def _get_event_settings(self, rate_key, duration_key):
+        samples_per_hour = 3600.0 / self.dt
+        rate = self.fault_options[rate_key] * self.dt / 86400.0
+        duration = [max(int(d * samples_per_hour), 1) for d in self.fault_options[duration_key]]
+        return rate, duration
+
+    def get_chunk(self, n):
+        """Generate the next 'n' samples of data.
+
+        Args:
+            n (int): Number of samples to generate.
+
+        Returns:
+            df_scada (pd.DataFrame): SCADA data with the columns 'time',
+              'wd_truth', 'ws_truth', 'ti_truth' and 'wd_###', 'ws_###',
+              'ti_###', 'pow_###' and 'is_operation_normal_###' per turbine.
+            df_metmast (pd.DataFrame): Met mast data with the columns 'time',
+              'WindDirection_80m', 'WindSpeed_80m' and 'TurbulenceIntensity_80m'.
+        """
+        n = int(min(n, self.n_samples - self.i_sample))
+        rng = self.rng
+        nt = self.n_turbines
+        opts = self.fault_options
+        time = self.t_start + pd.to_timedelta((self.i_sample + np.arange(n)) * self.dt, unit="s")
+
+        # Ambient conditions
+        wd_steps = rng.normal(0.0, self.wd_std_per_hour * np.sqrt(self.dt / 3600.0), size=n)
+        wd_unwrapped = self.state["wd"] + np.cumsum(wd_steps)
+        ws_dev = _get_ar1_series(rng, n, self.phi, self.ws_std, self.state["ws"])
+        ti_dev = _get_ar1_series(rng, n, self.phi, 0.02, self.state["ti"])
+        self.state.update({"wd": wd_unwrapped[-1] % 360.0, "ws": ws_dev[-1], "ti": ti_dev[-1]})
+        wd = wrap_360(wd_unwrapped)
+        ws = np.clip(self.ws_mean + ws_dev, 0.0, None)
+        ti = np.clip(0.08 + ti_dev, 0.02, None)
+
+        # Turbine measurements including wake losses and noise
+        wd_ids = np.round(wd / (360.0 / self.ws_ratios.shape[0])).astype(int) % self.ws_ratios.shape[0]
+        ws_turbs = ws[:, None] * self.ws_ratios[wd_ids, :]
+        pow_turbs = np.minimum(get_power_curve(ws_turbs) * (1.0 + 0.03 * rng.standard_normal((n, nt))), 5000.0)
+        ws_turbs = ws_turbs + 0.2 * rng.standard_normal((n, nt))
+        wd_turbs = wd[:, None] + 3.0 * rng.standard_normal((n, nt)) + self.northing_bias[None, :]
+        ti_turbs = ti[:, None] + 0.01 * rng.standard_normal((n, nt))
+        is_normal = np.ones((n, nt), dtype=bool)
+
+        # Maintenance: turbine is flagged and produces (almost) no power
+        rate, duration = self._get_event_settings("maintenance_rate", "maintenance_duration")
+        in_run, _, self.state["maintenance"] = _get_runs(rng, n, nt, rate, duration, self.state["maintenance"])
+        pow_turbs = np.where(in_run, 0.01 * pow_turbs, pow_turbs)
+        is_normal &= ~in_run
+
+        # Random outliers: flagged samples with a random power reduction
+        is_outlier = rng.random((n, nt)) < opts["outlier_fraction"]
+        pow_turbs = np.where(is_outlier, 0.01 * rng.integers(0, 100, size=(n, nt)) * pow_turbs, pow_turbs)
+        is_normal &= ~is_outlier
+
+        # Negative wind speeds and powers
+        is_negative = rng.random((n, nt)) < opts["negative_fraction"]
+        ws_turbs = np.where(is_negative, -rng.uniform(0.01, 0.5, size=(n, nt)), ws_turbs)
+        pow_turbs = np.where(is_negative, -rng.uniform(0.01, 25.0, size=(n, nt)), pow_turbs)
+
+        # Curtailment of a subset of turbines over a period of time
+        curtailment = opts["curtailment"]
+        if curtailment is not None:
+            in_period = (time >= pd.Timestamp(curtailment["t_start"])) & (time < pd.Timestamp(curtailment["t_end"]))
+            cols = np.isin(np.arange(nt), curtailment["turbines"])
+            ids = np.asarray(in_period)[:, None] & cols[None, :]
+            pow_turbs = np.where(ids, np.minimum(pow_turbs, curtailment["pow_max"]), pow_turbs)
+
+        # Stuck wind speed and wind direction sensors
+        rate, duration = self._get_event_settings("stuck_ws_rate", "stuck_duration")
+        in_run, last_start, self.state["stuck_ws"] = _get_runs(rng, n, nt, rate, duration, self.state["stuck_ws"])
+        ws_turbs, self.state["stuck_ws_value"] = _apply_stuck_values(
+            ws_turbs, in_run, last_start, self.state["stuck_ws_value"]
+        )
+        rate, duration = self._get_event_settings("stuck_wd_rate", "stuck_duration")
+        in_run, last_start, self.state["stuck_wd"] = _get_runs(rng, n, nt, rate, duration, self.state["stuck_wd"])
+        wd_turbs, self.state["stuck_wd_value"] = _apply_stuck_values(
+            wd_turbs, in_run, last_start, self.state["stuck_wd_value"]
+        )
+
+        # Format dataframes
+        data = {"time": time, "wd_truth": wd, "ws_truth": ws, "ti_truth": ti}
+        for name, values in [("wd", wrap_360(wd_turbs)), ("ws", ws_turbs), ("ti", ti_turbs), ("pow", pow_turbs)]:
+            for tii in range(nt):
+                data["{:s}_{:03d}".format(name, tii)] = values[:, tii].astype(np.float32)
+        for tii in range(nt):
+            data["is_operation_normal_{:03d}".format(tii)] = is_normal[:, tii]
+        df_scada = pd.DataFrame(data)
+
+        df_metmast = pd.DataFrame({
+            "time": time,
+            "WindDirection_80m": wrap_360(wd + 1.0 * rng.standard_normal(n)).astype(np.float32),
+            "WindSpeed_80m": np.clip(ws + 0.1 * rng.standard_normal(n), 0.0, None).astype(np.float32),
+            "TurbulenceIntensity_80m": ti.astype(np.float32),
+        })
+
+        self.i_sample += n
+        return df_scada, df_metmast
+
+    def iter_chunks(self, chunk_size=100000):
+        """Iterate over the full dataset in chunks of 'chunk_size' samples,
+        starting from the first timestamp.
+
+        Args:
+            chunk_size (int, optional): Number of samples per chunk. Defaults
+              to 100000.
+
+        Yields:
+            (df_scada, df_metmast): Dataframes of each chunk, see get_chunk(...).
+        """
+        self.reset()
+        while self.i_sample < self.n_samples:
+            yield self.get_chunk(chunk_size)
+
+    def write_to_disk(self, out_path, chunk_size=100000, verbose=True):
+        """Generate the full dataset and write it to disk in chunks, as
+        'scada_part_#####.ftr' and 'metmast_part_#####.ftr' files. Only a
+        single chunk is held in memory at any time.
+
+        Args:
+            out_path (str): Directory to write the files to.
+            chunk_size (int, optional): Number of samples per chunk. Defaults
+              to 100000.
+            verbose (bool, optional): Print progress. Defaults to True.
+
+        Returns:
+            list: Paths to the SCADA files written.
+        """
+        os.makedirs(out_path, exist_ok=True)
+        start_time = timerpc()
+        n_chunks = int(np.ceil(self.n_samples / chunk_size))
+        files = []
+        for ii, (df_scada, df_metmast) in enumerate(self.iter_chunks(chunk_size)):
+            fn = os.path.join(out_path, "scada_part_{:05d}.ftr".format(ii))
+            df_scada.to_feather(fn)
+            df_metmast.to_feather(os.path.join(out_path, "metmast_part_{:05d}.ftr".format(ii)))
+            files.append(fn)
+            if verbose:
+                print(
+                    "Written chunk {:d}/{:d} to '{:s}' ({:.1f} s).".format(ii + 1, n_chunks, fn, timerpc() - start_time)
+                )
+        return files
+
+
+if __name__ == "__main__":
+    # Generate one year of 10-minute data for a 100-turbine wind farm
+    layout_x, layout_y = get_grid_layout(100)
+    generator = SyntheticScadaGenerator(layout_x, layout_y, duration=td(days=365), dt=600.0, seed=0)
+    root_path = os.path.dirname(os.path.abspath(__file__))
+    generator.write_to_disk(os.path.join(root_path, "..", "synthetic_data"), chunk_size=10000)
@@ -0,0 +1,251 @@
+import numpy as np
+from scipy import sparse
+
+from floris.utilities import wrap_360
+
+from flasc import floris_tools as ftools
+
+
+class UpstreamTurbineIndex:
+    """Interval index mapping the wind direction to the set of upstream
+    turbines, for dataframes with many measurements. The wind direction
+    ranges of 'df_upstream' are split into the elementary intervals between
+    all of their bounds, and for every interval the upstream turbines are
+    stored as a boolean mask over all turbines. Finding the upstream
+    turbines of a measurement is then a binary search over the interval
+    bounds, and averaging a quantity over the upstream turbines of every
+    measurement is a single gather of these masks.
+
+    The results equal those of flasc's dataframe_manipulations functions,
+    e.g., set_ws_by_upstream_turbines(...): the wind direction ranges are
+    open on the left and closed on the right, may wrap around 360 deg, and
+    later rows of 'df_upstream' take precedence over earlier rows. Wind
+    directions outside all ranges have no upstream turbines. Unlike flasc,
+    the wind directions are wrapped to (0, 360] deg first, so that a wind
+    direction of exactly 0 deg falls in the range ending at 360 deg.
+
+    Args:
+        df_upstream (pd.DataFrame): Upstream turbines for each wind direction
+          range, see flasc's floris_tools.get_upstream_turbs_floris(...).
+        num_turbines (int): Number of turbines in the farm.
+        exclude_turbs (list, optional): Turbines that are never used, e.g.,
+          turbines with faulty measurements. Defaults to [].
+    """
+    def __init__(self, df_upstream, num_turbines, exclude_turbs=[]):
+        wd_min = df_upstream["wd_min"].to_numpy(dtype=float)
+        wd_max = df_upstream["wd_max"].to_numpy(dtype=float)
+        self.num_turbines = int(num_turbines)
+        self.edges = np.unique(np.clip(np.hstack([0.0, wd_min, wd_max, 360.0]), 0.0, 360.0))
+
+        # Interval k covers (edges[k-1], edges[k]], and the conditions of
+        # df_upstream are constant on each interval, so they are evaluated
+        # at its right bound. The last interval holds NaNs and is never
+        # covered.
+        n_intervals = len(self.edges) + 1
+        self.masks = np.zeros((n_intervals, self.num_turbines), dtype=bool)
+        wd = self.edges
+        for lb, ub, turbines in zip(wd_min, wd_max, df_upstream["turbines"]):
+            if lb > ub:  # Wrap around
+                ids = (wd > lb) | (wd <= ub)
+            else:
+                ids = (wd > lb) & (wd <= ub)
+            ids = np.flatnonzero(ids)
+            turbines = [ti for ti in turbines if ti not in exclude_turbs]
+            self.masks[ids, :] = False
+            self.masks[np.ix_(ids, np.asarray(turbines, dtype=int))] = True
+
+    def get_interval_ids(self, wd):
+        """Find the interval of each wind direction.
+
+        Args:
+            wd (np.array): Wind directions in [deg].
+
+        Returns:
+            np.array: Interval index of each wind direction, see 'masks'.
+        """
+        wd = wrap_360(np.asarray(wd, dtype=float))
+        wd = np.where(wd == 0.0, 360.0, wd)
+        return np.searchsorted(self.edges, wd, side="left")
+
+    def get_turbine_masks(self, wd):
+        """Get the upstream turbines of each wind direction.
+
+        Args:
+            wd (np.array): Wind directions in [deg].
+
+        Returns:
+            np.array: Boolean array of shape (n, num_turbines), True for the
+              upstream turbines.
+        """
+        return self.masks[self.get_interval_ids(wd)]
+
+    def get_upstream_turbines(self, wd):
+        """Get the upstream turbines of a single wind direction.
+
+        Args:
+            wd (float): Wind direction in [deg].
+
+        Returns:
+            list: Upstream turbines.
+        """
+        return [int(ti) for ti in np.flatnonzero(self.get_turbine_masks([wd])[0])]
+
+    def get_column_mean(self, df, col_prefix, circular_mean=False, chunksize=100000):
+        """Average a quantity over the upstream turbines of every measurement,
+        ignoring NaNs, like flasc's dataframe_manipulations.get_column_mean(...)
+        with the upstream turbines of each measurement.
+
+        Args:
+            df (pd.DataFrame): Dataframe with the column 'wd' and the columns
+              '[col_prefix]_###' of all turbines.
+            col_prefix (str): Prefix of the columns, e.g., 'ws' or 'pow'.
+            circular_mean (bool, optional): Average angles in [deg] through
+              their sine and cosine components. Defaults to False.
+            chunksize (int, optional): Number of measurements processed at
+              once, to limit memory usage. Defaults to 100000.
+
+        Returns:
+            np.array: Averaged quantity of each measurement. NaN if none of
+              the upstream turbines has a valid measurement.
+        """
+        ids = self.get_interval_ids(df["wd"])
+        cols = ["{:s}_{:03d}".format(col_prefix, ti) for ti in range(self.num_turbines)]
+        values = df[cols].to_numpy(dtype=float)
+
+        mean_out = np.full(len(ids), np.nan)
+        for ii in range(0, len(ids), chunksize):
+            x = values[ii:ii + chunksize]
+            is_used = self.masks[ids[ii:ii + chunksize]] & ~np.isnan(x)
+            count = np.sum(is_used, axis=1)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                if circular_mean:
+                    x = np.deg2rad(x)
+                    dir_x = np.sum(np.where(is_used, np.cos(x), 0.0), axis=1) / count
+                    dir_y = np.sum(np.where(is_used, np.sin(x), 0.0), axis=1) / count
+                    mean = wrap_360(np.rad2deg(np.arctan2(dir_y, dir_x)))
+                else:
+                    mean = np.sum(np.where(is_used, x, 0.0), axis=1) / count
+            mean[count == 0] = np.nan
+            mean_out[ii:ii + chunksize] = mean
+        return mean_out
+
+
+def get_upstream_index_in_radius(df_upstream, x_turbs, y_turbs, turb_no, max_radius, include_itself=True):
+    """Get the index of the upstream turbines that are also within a radius
+    of turbine 'turb_no', like flasc's
+    dfm.set_ws_by_upstream_turbines_in_radius(...) and
+    dfm.set_pow_ref_by_upstream_turbines_in_radius(...).
+
+    Args:
+        df_upstream (pd.DataFrame): Upstream turbines for each wind direction
+          range, see flasc's floris_tools.get_upstream_turbs_floris(...).
+        x_turbs (np.array): x-coordinates of the turbines.
+        y_turbs (np.array): y-coordinates of the turbines.
+        turb_no (int): Turbine from which the radius is measured.
+        max_radius (float): Maximum distance to turbine 'turb_no' in [m].
+        include_itself (bool, optional): Include turbine 'turb_no' itself.
+          Defaults to True.
+
+    Returns:
+        UpstreamTurbineIndex: Index of the upstream turbines in the radius.
+    """
+    x_turbs = np.asarray(x_turbs, dtype=float)
+    y_turbs = np.asarray(y_turbs, dtype=float)
+    turbs_in_radius = ftools.get_turbs_in_radius(
+        x_turbs=x_turbs,
+        y_turbs=y_turbs,
+        turb_no=turb_no,
+        max_radius=max_radius,
+        include_itself=include_itself,
+    )
+    if len(turbs_in_radius) < 1:
+        raise ValueError("No turbines within proximity. Try to increase radius.")
+    exclude_turbs = [ti for ti in range(len(x_turbs)) if ti not in turbs_in_radius]
+    return UpstreamTurbineIndex(df_upstream, len(x_turbs), exclude_turbs=exclude_turbs)
+
+
+class ReferenceWeights:
+    """Weights of the reference turbines of every measurement, for
+    calculating reference signals such as 'ws' and 'pow_ref' for several
+    dataframes that share the same wind directions, e.g., the SCADA data and
+    the FLORIS predictions for that data. The weights form a sparse matrix
+    of shape (n, num_turbines), gathered once from the (wind direction
+    interval x turbine) masks of an UpstreamTurbineIndex. Each reference
+    signal is then a sparse row-wise product with the turbine measurements,
+    whose cost scales with the number of reference turbines rather than the
+    number of turbines in the farm.
+
+    NaNs are ignored by renormalizing the weights of the valid measurements,
+    which equals the NaN-ignoring average of flasc.
+
+    Args:
+        upstream_index (UpstreamTurbineIndex): Index of the reference turbines,
+          e.g., from get_upstream_index_in_radius(...).
+        wd (np.array): Wind direction of each measurement in [deg].
+    """
+    def __init__(self, upstream_index, wd):
+        masks = sparse.csr_matrix(upstream_index.masks)
+        self.num_turbines = upstream_index.num_turbines
+        self.weights = masks[upstream_index.get_interval_ids(wd)]
+        counts = np.diff(self.weights.indptr)
+        self.weights.data = np.repeat(1.0 / np.maximum(counts, 1), counts)
+        self._rows = np.repeat(np.arange(self.weights.shape[0]), counts)
+
+    def get_column_mean(self, df, col_prefix):
+        """Average a quantity over the reference turbines of every
+        measurement.
+
+        Args:
+            df (pd.DataFrame): Dataframe with the columns '[col_prefix]_###'
+              of all turbines, in the same row order as 'wd'.
+            col_prefix (str): Prefix of the columns, e.g., 'ws' or 'pow'.
+
+        Returns:
+            np.array: Averaged quantity of each measurement. NaN if none of
+              the reference turbines has a valid measurement.
+        """
+        cols = ["{:s}_{:03d}".format(col_prefix, ti) for ti in range(self.num_turbines)]
+        values = df[cols].to_numpy(dtype=float)[self._rows, self.weights.indices]
+        is_valid = ~np.isnan(values)
+        w = np.where(is_valid, self.weights.data, 0.0)
+        n = self.weights.shape[0]
+        numerator = np.bincount(self._rows, weights=w * np.where(is_valid, values, 0.0), minlength=n)
+        denominator = np.bincount(self._rows, weights=w, minlength=n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_out = numerator / denominator
+        mean_out[denominator == 0.0] = np.nan
+        return mean_out
+
+
+def set_ws_by_upstream_turbines(df, upstream_index):
+    """Add a column called 'ws' to the dataframe, with the averaged wind
+    speed of the upstream turbines, see UpstreamTurbineIndex. This is a
+    faster alternative to flasc's dfm.set_ws_by_upstream_turbines(...).
+
+    Args:
+        df (pd.DataFrame): Dataframe with the column 'wd' and the 'ws_###'
+          columns of all turbines.
+        upstream_index (UpstreamTurbineIndex): Index of the upstream turbines.
+
+    Returns:
+        pd.DataFrame: Dataframe with the additional column 'ws'.
+    """
+    df["ws"] = upstream_index.get_column_mean(df, "ws")
+    return df
+
+
+def set_pow_ref_by_upstream_turbines(df, upstream_index):
+    """Add a column called 'pow_ref' to the dataframe, with the averaged
+    power of the upstream turbines, see UpstreamTurbineIndex. This is a
+    faster alternative to flasc's dfm.set_pow_ref_by_upstream_turbines(...).
+
+    Args:
+        df (pd.DataFrame): Dataframe with the column 'wd' and the 'pow_###'
+          columns of all turbines.
+        upstream_index (UpstreamTurbineIndex): Index of the upstream turbines.
+
+    Returns:
+        pd.DataFrame: Dataframe with the additional column 'pow_ref'.
+    """
+    df["pow_ref"] = upstream_index.get_column_mean(df, "pow")
+    return df